@@ -1,9 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
-from typing import List
-import os
-import shutil
-from backend.models.schemas import User, AnalysisResult
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from typing import List, Optional
+from backend.models.schemas import User, AnalysisResult, RiskLevel
 from backend.services.analysis_service import AnalysisService
+from backend.services.pipeline_executor import ExecutorFull
 from backend.api.auth import get_current_user
 from config.settings import settings
 from loguru import logger
@@ -11,54 +10,32 @@ from loguru import logger
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 analysis_service = AnalysisService()
 
+# Plain VCF plus gzip / BGZF compressed VCF (as shipped by most sequencing vendors)
+ALLOWED_EXTENSIONS = ('.vcf', '.vcf.gz', '.vcf.bgz')
+
 @router.post("/upload", response_model=dict)
 async def upload_vcf(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
     """Upload VCF file and start analysis"""
     
     # Validate file
-    if not file.filename.endswith('.vcf'):
-        raise HTTPException(status_code=400, detail="Only VCF files are allowed")
-
-    # Save file while enforcing max size. FastAPI's UploadFile does not provide a
-    # reliable `size` attribute, so we stream the upload and count bytes.
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, f"{current_user.id}_{file.filename}")
+    if not file.filename.endswith(ALLOWED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only VCF files (.vcf, .vcf.gz, .vcf.bgz) are allowed")
 
-    max_size = settings.MAX_FILE_SIZE
-    bytes_written = 0
+    # Store the upload by content hash while enforcing max size. FastAPI's
+    # UploadFile does not provide a reliable `size` attribute, so the store
+    # streams the upload, counting and hashing bytes as they arrive.
+    extension = next(ext for ext in ALLOWED_EXTENSIONS if file.filename.endswith(ext))
 
     try:
-        # Read in chunks from the UploadFile (async) and write to disk.
-        with open(file_path, "wb") as buffer:
-            while True:
-                chunk = await file.read(1024 * 1024)  # 1MB
-                if not chunk:
-                    break
-                bytes_written += len(chunk)
-                if bytes_written > max_size:
-                    # Clean up partial file
-                    buffer.close()
-                    try:
-                        os.remove(file_path)
-                    except Exception:
-                        pass
-                    raise HTTPException(status_code=400, detail="File too large")
-                buffer.write(chunk)
-    except HTTPException:
-        # Re-raise known HTTP exceptions
-        raise
+        content_hash, file_path, duplicate = await analysis_service.content_store.save_upload(
+            file, extension, settings.MAX_FILE_SIZE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="File too large")
     except Exception as e:
         logger.error(f"File upload failed: {e}")
-        # Try to remove partial file if exists
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception:
-            pass
         raise HTTPException(status_code=500, detail="File upload failed")
     finally:
         # Ensure the uploaded file is closed
@@ -67,16 +44,26 @@ async def upload_vcf(
         except Exception:
             pass
     
+    if duplicate:
+        logger.info(f"Upload {file.filename} matches stored content {content_hash}")
+    
     # Create analysis record
-    analysis_id = await analysis_service.create_analysis(current_user.id, file.filename)
+    analysis_id = await analysis_service.create_analysis(
+        current_user.id, file.filename, content_hash=content_hash, file_path=file_path)
     
-    # Start background processing
-    background_tasks.add_task(analysis_service.process_vcf, analysis_id, file_path)
+    # Repeat uploads complete straight from the result cache; others go to the pipeline workers
+    try:
+        cached = analysis_service.submit_analysis(analysis_id, file_path, content_hash)
+    except ExecutorFull:
+        await analysis_service.delete_analysis(analysis_id)
+        raise HTTPException(status_code=503, detail="Analysis queue is full, please retry shortly",
+                            headers={"Retry-After": "30"})
     
     return {
         "message": "File uploaded successfully",
         "analysis_id": analysis_id,
-        "filename": file.filename
+        "filename": file.filename,
+        "cached": cached
     }
 
 @router.get("/results/{analysis_id}")
@@ -97,6 +84,40 @@ async def get_analysis_results(
     
     return analysis
 
+@router.get("/results/{analysis_id}/variants")
+async def get_analysis_variants(
+    analysis_id: str,
+    after: Optional[int] = Query(None, ge=0, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    gene: Optional[List[str]] = Query(None, description="Gene symbols; matches variants overlapping any of them"),
+    risk: Optional[List[RiskLevel]] = Query(None),
+    pathogenicity: Optional[List[str]] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Page through an analysis's annotated variants, in VCF order"""
+    
+    analysis = await analysis_service.get_analysis(analysis_id)
+    
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    if analysis.get('user_id') != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    page = await analysis_service.get_variants(
+        analysis_id, after=after, limit=limit, gene=gene,
+        disease_risk=[level.value for level in risk] if risk else None, pathogenicity=pathogenicity)
+    if page is None:
+        raise HTTPException(status_code=404, detail="No variant results stored for this analysis")
+    
+    variants, next_cursor, total = page
+    return {
+        "analysis_id": analysis_id,
+        "total_variants": total,
+        "variants": variants,
+        "next_cursor": next_cursor
+    }
+
 @router.get("/history", response_model=List[AnalysisResult])
 async def get_analysis_history(
     current_user: User = Depends(get_current_user)
@@ -122,12 +143,7 @@ async def delete_analysis(
     if analysis.get('user_id') != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Delete from database
-    analysis_service._db.analyses.delete_one({"_id": analysis_id})
-    
-    # Delete associated file
-    file_path = os.path.join(settings.UPLOAD_DIR, f"{current_user.id}_{analysis.get('vcf_file')}")
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # Delete from database, and the upload unless another analysis shares it
+    await analysis_service.delete_analysis(analysis_id)
     
     return {"message": "Analysis deleted successfully"}
\ No newline at end of file
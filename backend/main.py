@@ -3,8 +3,10 @@ GenomeGuard API - Main FastAPI application
 """
 import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from backend.services.metrics import METRICS
 import logging
 
 # Load environment variables
@@ -35,11 +37,18 @@ app.add_middleware(
 # Import routers
 try:
     from backend.api.auth import router as auth_router
-    from backend.api.analysis import router as analysis_router
+    from backend.api.analysis import router as analysis_router, analysis_service
     
     # Include routers
     app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
     app.include_router(analysis_router, prefix="/analysis", tags=["Analysis"])
+    # Start the pipeline worker processes with the API, resume analyses
+    # interrupted by a previous shutdown or crash, clear out files they left
+    # behind, and stop the workers again on shutdown
+    app.router.add_event_handler("startup", analysis_service.start)
+    app.router.add_event_handler("startup", analysis_service.recover_stalled_analyses)
+    app.router.add_event_handler("startup", analysis_service.sweep_storage)
+    app.router.add_event_handler("shutdown", analysis_service.shutdown)
     logger.info("✅ Successfully loaded API routers")
 except ImportError as e:
     logger.warning(f"⚠️  Could not load API routers: {e}")
@@ -62,6 +71,11 @@ async def health_check():
         "timestamp": str(__import__('datetime').datetime.now())
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Pipeline stage histograms, analysis counts and queue depth in Prometheus text format"""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("API_PORT", 8000))
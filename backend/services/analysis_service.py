@@ -1,26 +1,135 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
 import os
+import socket
 from loguru import logger
 from backend.models.database import get_database
 from backend.models.schemas import AnalysisResult, AnalysisStatus
-from backend.services.ml_pipeline import MLPipeline
+from backend.services.checkpoints import CheckpointStore
+from backend.services.ml_pipeline import PROCESSED_DIR, MLPipeline, PipelineVersions
+from backend.services.annotation_cache import AnnotationCache
+from backend.services.content_store import ContentStore
+from backend.services.metrics import ANALYSES_TOTAL, METRICS, StageTimer, observe_timings
+from backend.services.pipeline_executor import ExecutorFull, PipelineExecutor
+from backend.services.result_cache import ResultCache
+from backend.services.retention import ACTIVE_STATUSES, RetentionManager
+from backend.services.variant_results import DEFAULT_PAGE_SIZE, VariantResultStore
+from backend.services.rate_limiter import TokenBucket
+from backend.services.variant_annotator import VariantAnnotator
+from config.settings import settings
+
+# Analysis record fields the storage scans need
+STORAGE_FIELDS = ["_id", "status", "file_path", "user_id", "vcf_file"]
+
+def create_annotator():
+    """Remote annotator for hybrid annotation mode, None in local mode"""
+    if settings.ANNOTATION_MODE != "hybrid":
+        return None
+    return VariantAnnotator(
+        use_api=True,
+        api_base_url=settings.MYVARIANT_URL,
+        max_concurrency=settings.ANNOTATION_CONCURRENCY,
+        cache=AnnotationCache(
+            settings.ANNOTATION_CACHE_PATH,
+            ttl=settings.ANNOTATION_CACHE_TTL,
+            max_entries=settings.ANNOTATION_CACHE_MAX_ENTRIES,
+        ),
+        rate_limiter=TokenBucket(
+            "myvariant",
+            rate=settings.ANNOTATION_RATE_LIMIT,
+            burst=settings.ANNOTATION_RATE_BURST,
+        ),
+    )
+
+def create_pipeline(parse_workers=None):
+    """ML pipeline configured from settings"""
+    return MLPipeline(
+        regions_only=settings.REGION_RESTRICTED_PARSING,
+        parse_workers=parse_workers or settings.PARSE_WORKERS or None,
+        intermediate_format=settings.INTERMEDIATE_FORMAT,
+        parse_mode=settings.PARSE_MODE,
+        gene_db_path=settings.GENE_DB_PATH,
+        variant_store_path=settings.VARIANT_STORE_PATH,
+        annotator=create_annotator(),
+        model_threads=settings.MODEL_THREADS or None,
+        streaming=settings.PIPELINE_MODE == "streaming",
+        top_variants=settings.TOP_VARIANTS,
+        checkpoint_dir=settings.CHECKPOINT_DIR,
+        results_dir=settings.RESULTS_DIR,
+    )
+
+def create_pipeline_versions():
+    """Versions the pipeline configured from settings would report, without loading it"""
+    return PipelineVersions(
+        regions_only=settings.REGION_RESTRICTED_PARSING,
+        gene_db_path=settings.GENE_DB_PATH,
+        variant_store_path=settings.VARIANT_STORE_PATH,
+        remote=settings.ANNOTATION_MODE == "hybrid",
+    )
+
+def create_worker_pipeline():
+    """
+    Pipeline for executor workers: the PARSE_WORKERS parsing processes are
+    shared out between the pipeline workers, so the pool never oversubscribes
+    the cores (at least one each, i.e. parsing in-process)
+    """
+    cores = os.cpu_count() or 1
+    pool_size = settings.PIPELINE_WORKERS or cores
+    return create_pipeline(parse_workers=max(1, (settings.PARSE_WORKERS or cores) // pool_size))
 
 class AnalysisService:
     def __init__(self):
         self._db = get_database()
         # fallback in-memory store when DB is not available
         self._store = {}
-        # Initialize ML pipeline
-        self.ml_pipeline = MLPipeline()
+        self.content_store = ContentStore(settings.UPLOAD_DIR)
+        self.result_cache = ResultCache(self._db) if settings.RESULT_CACHE_ENABLED else None
+        # Identifies this API process on the analyses it runs, for stall detection
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # The pipeline itself only runs in the executor's workers; this process
+        # needs its versions (for the result cache) and the stores it writes
+        self.pipeline_versions = create_pipeline_versions()
+        self.checkpoints = CheckpointStore(settings.CHECKPOINT_DIR)
+        self.variant_results = VariantResultStore(settings.RESULTS_DIR)
+        # Removes intermediates, orphaned files and (over budget) old uploads
+        self.retention = RetentionManager(
+            settings.UPLOAD_DIR,
+            PROCESSED_DIR,
+            self.checkpoints,
+            self.variant_results,
+            disk_budget=settings.STORAGE_BUDGET_BYTES,
+            grace_seconds=settings.RETENTION_GRACE_SECONDS,
+        )
+        # Worker processes with the pipeline preloaded run submitted analyses
+        # (started by start(), so importing the service forks nothing)
+        self.executor = PipelineExecutor(
+            create_worker_pipeline,
+            workers=settings.PIPELINE_WORKERS or None,
+            max_pending=settings.PIPELINE_QUEUE_SIZE,
+        )
+        METRICS.gauge("genomeguard_pipeline_queue_depth", "Analyses queued or running on the pipeline workers",
+                      lambda: self.executor.pending)
+        METRICS.gauge("genomeguard_pipeline_workers", "Pipeline worker processes",
+                      lambda: self.executor.workers)
+        METRICS.gauge("genomeguard_storage_used_bytes", "Bytes used by uploads, intermediates and checkpoints",
+                      self.retention.disk_usage)
+
+    def start(self):
+        self.executor.start()
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
 
-    async def create_analysis(self, user_id: str, filename: str) -> str:
+    async def create_analysis(self, user_id: str, filename: str, content_hash: str = None,
+                              file_path: str = None) -> str:
         analysis_id = str(uuid.uuid4())
         now = datetime.utcnow()
         record = {
             "_id": analysis_id,
             "user_id": user_id,
             "vcf_file": filename,
+            "content_hash": content_hash,
+            "file_path": file_path,
             "status": AnalysisStatus.PENDING.value,
             "total_variants": 0,
             "high_risk_variants": 0,
@@ -70,73 +179,261 @@ class AnalysisService:
         # filter in-memory
         return [v for v in self._store.values() if v["user_id"] == user_id]
 
-    def process_vcf(self, analysis_id: str, file_path: str):
+    async def get_variants(self, analysis_id: str, after: int = None, limit: int = DEFAULT_PAGE_SIZE,
+                           gene: list = None, disease_risk: list = None, pathogenicity: list = None):
         """
-        Process VCF file through complete ML pipeline
-        1. Preprocess VCF
-        2. Annotate variants
-        3. Predict disease risk
-        4. Update database with results
+        One page of an analysis's stored variants (see VariantResultStore.page);
+        None if it has none
         """
-        logger.info(f"Starting ML pipeline for analysis {analysis_id}")
-        logger.info(f"Processing file: {file_path}")
+        return self.variant_results.page(
+            analysis_id, after=after, limit=limit,
+            gene=gene, disease_risk=disease_risk, pathogenicity=pathogenicity)
+    
+    def complete_from_cache(self, analysis_id: str, content_hash: str) -> bool:
+        """
+        Complete an analysis from the result cache if the same content was
+        already analyzed with the current annotation databases and model
+        """
+        if self.result_cache is None or not content_hash:
+            return False
+        key = self.result_cache.key(content_hash, *self.pipeline_versions.current())
+        cached = self.result_cache.get(key)
+        if cached is None:
+            return False
+        # Share the per-variant results of the analysis that produced the entry;
+        # if that analysis was deleted since, run the pipeline again
+        source = cached.get('variant_results')
+        if not source or not self.variant_results.link(source, analysis_id):
+            return False
         
+        self._update_analysis(analysis_id, self._completed_update(cached))
+        ANALYSES_TOTAL.inc(status="cached")
+        logger.info(f"✓ Analysis {analysis_id} completed from cached results ({key})")
+        return True
+    
+    def submit_analysis(self, analysis_id: str, file_path: str, content_hash: str = None) -> bool:
+        """
+        Queue an analysis on the pipeline executor; results are written to
+        the database from this process when the worker finishes.
+        
+        Returns:
+            True if the analysis was completed from the result cache instead
+        
+        Raises:
+            ExecutorFull: if the executor's submission queue is at capacity
+        """
+        if self.complete_from_cache(analysis_id, content_hash):
+            return True
+        
+        logger.info(f"Queueing analysis {analysis_id} ({self.executor.pending} pending)")
+        # Set before submitting so a fast worker's result is never overwritten
+        self._mark_processing(analysis_id)
         try:
-            # Update status to PROCESSING
-            self._update_status(analysis_id, AnalysisStatus.PROCESSING.value)
-            
-            # Run complete ML pipeline
-            results = self.ml_pipeline.process_vcf_file(file_path, analysis_id)
-            
-            # Check if pipeline succeeded
-            if results['status'] == 'completed':
-                # Update database with actual results
-                update_data = {
-                    "status": AnalysisStatus.COMPLETED.value,
-                    "completed_at": datetime.utcnow(),
-                    "total_variants": results['total_variants'],
-                    "high_risk_variants": results['high_risk_variants'],
-                    "pathogenic_variants": results['pathogenic_variants'],
-                    "risk_probability": results['risk_probability'],
-                    "risk_classification": results['risk_classification'],
-                    "error_message": None
-                }
-                
-                # Add optional fields if available
-                if 'medium_risk_variants' in results:
-                    update_data['medium_risk_variants'] = results['medium_risk_variants']
-                if 'low_risk_variants' in results:
-                    update_data['low_risk_variants'] = results['low_risk_variants']
-                
-                self._update_analysis(analysis_id, update_data)
-                
-                logger.info(f"✓ Analysis {analysis_id} completed successfully")
-                logger.info(f"  Total variants: {results['total_variants']}")
-                logger.info(f"  High risk: {results['high_risk_variants']}")
-                logger.info(f"  Risk: {results['risk_classification']} ({results['risk_probability']:.2%})")
-                
-            else:
-                # Pipeline failed
-                error_msg = results.get('error_message', 'Unknown pipeline error')
-                logger.error(f"Pipeline failed for {analysis_id}: {error_msg}")
-                
-                self._update_analysis(analysis_id, {
-                    "status": AnalysisStatus.FAILED.value,
-                    "error_message": error_msg
-                })
-                
-        except Exception as e:
-            error_msg = f"Processing error: {str(e)}"
+            self.executor.submit(
+                file_path, analysis_id,
+                on_done=lambda done_id, results, error: self._record_results(done_id, results, error, content_hash),
+                input_hash=content_hash,
+            )
+        except ExecutorFull:
+            self._update_status(analysis_id, AnalysisStatus.PENDING.value)
+            raise
+        return False
+    
+    def _record_results(self, analysis_id: str, results: dict, error: Exception, content_hash: str = None):
+        """Write a finished pipeline run (results, or the error that stopped it) to the analysis"""
+        try:
+            self._persist_results(analysis_id, results, error, content_hash)
+        finally:
+            # The outcome is recorded, nothing is left to resume
+            self.retention.release(analysis_id)
+            self.enforce_storage_budget()
+    
+    def _persist_results(self, analysis_id: str, results: dict, error: Exception, content_hash: str = None):
+        if error is not None:
+            error_msg = f"Processing error: {str(error)}"
             logger.error(f"Failed to process {analysis_id}: {error_msg}")
             
             import traceback
-            logger.error(traceback.format_exc())
+            logger.error("".join(traceback.format_exception(error)))
             
+            self.retention.remove_results(analysis_id)
             # Update status to FAILED
             self._update_analysis(analysis_id, {
                 "status": AnalysisStatus.FAILED.value,
                 "error_message": error_msg
             })
+            ANALYSES_TOTAL.inc(status="error")
+            return
+        
+        # Check if pipeline succeeded
+        if results['status'] == 'completed':
+            # Update database with actual results, timing the write as a stage of its own
+            # (leaving the API process's peak RSS alone)
+            timer = StageTimer(reset_peak_rss=False)
+            with timer.stage('db_update'):
+                self._update_analysis(analysis_id, self._completed_update(results))
+            timings = {**results.get('timings', {}), **timer.timings}
+            self._update_analysis(analysis_id, {"timings": timings})
+            observe_timings(timings)
+            ANALYSES_TOTAL.inc(status="completed")
+            
+            if self.result_cache is not None and content_hash:
+                key = self.result_cache.key(content_hash, results['annotation_version'],
+                                            results['model_version'])
+                self.result_cache.set(key, results)
+            
+            logger.info(f"✓ Analysis {analysis_id} completed successfully")
+            logger.info(f"  Total variants: {results['total_variants']}")
+            logger.info(f"  High risk: {results['high_risk_variants']}")
+            logger.info(f"  Risk: {results['risk_classification']} ({results['risk_probability']:.2%})")
+            
+        else:
+            # Pipeline failed
+            error_msg = results.get('error_message', 'Unknown pipeline error')
+            logger.error(f"Pipeline failed for {analysis_id}: {error_msg}")
+            
+            self.retention.remove_results(analysis_id)
+            self._update_analysis(analysis_id, {
+                "status": AnalysisStatus.FAILED.value,
+                "error_message": error_msg,
+                "timings": results.get('timings', {})
+            })
+            ANALYSES_TOTAL.inc(status="failed")
+    
+    def recover_stalled_analyses(self):
+        """
+        Startup scan: resubmit analyses left 'processing' by an API process
+        that is gone. Workers resume them from their last checkpointed stage.
+        """
+        stalled = [record for record in self._find_analyses({"status": AnalysisStatus.PROCESSING.value})
+                   if self._is_stalled(record)]
+        if stalled:
+            logger.info(f"Recovering {len(stalled)} interrupted analyses")
+        
+        for record in stalled:
+            analysis_id = record["_id"]
+            if not self._claim(record):
+                continue    # another API process got to it first
+            file_path = record.get("file_path")
+            if not file_path or not os.path.exists(file_path):
+                self._record_results(analysis_id, None, RuntimeError("Analysis was interrupted and its upload is gone"))
+                continue
+            try:
+                self.submit_analysis(analysis_id, file_path, record.get("content_hash"))
+            except ExecutorFull:
+                # Still marked processing under this process; the next restart retries it
+                logger.warning(f"Pipeline queue full, {analysis_id} not resumed")
+    
+    def sweep_storage(self):
+        """Startup scan: remove files of deleted analyses, then enforce the storage budget"""
+        self.retention.remove_orphans(self._find_analyses({}, STORAGE_FIELDS))
+        self.enforce_storage_budget()
+    
+    def enforce_storage_budget(self):
+        """Evict the oldest uploads and intermediates not in use while over the storage budget"""
+        self.retention.enforce_budget(
+            lambda: self._find_analyses({"status": {"$in": list(ACTIVE_STATUSES)}}, STORAGE_FIELDS))
+    
+    def _find_analyses(self, query: dict, fields: list = None) -> list:
+        """Analyses matching a simple {field: value} or {field: {"$in": [...]}} query"""
+        if self._db:
+            return list(self._db.analyses.find(query, fields))
+        
+        def matches(record):
+            for field, condition in query.items():
+                allowed = condition["$in"] if isinstance(condition, dict) else [condition]
+                if record.get(field) not in allowed:
+                    return False
+            return True
+        return [record for record in self._store.values() if matches(record)]
+    
+    def _is_stalled(self, record: dict) -> bool:
+        """Whether a 'processing' analysis has no live API process behind it"""
+        owner = record.get("owner")
+        if not owner or owner == self.owner:
+            return True
+        host, _, pid = owner.rpartition(":")
+        if host == socket.gethostname():
+            try:
+                os.kill(int(pid), 0)
+                return False
+            except ProcessLookupError:
+                return True
+            except (PermissionError, ValueError):
+                return False
+        # Owned by another host: only presume it dead after the stall timeout
+        started = record.get("processing_started_at")
+        return started is None or datetime.utcnow() - started > timedelta(seconds=settings.ANALYSIS_STALL_TIMEOUT)
+    
+    def _claim(self, record: dict) -> bool:
+        """Take ownership of a stalled analysis unless another process already has"""
+        if self._db:
+            claimed = self._db.analyses.update_one(
+                {"_id": record["_id"], "owner": record.get("owner")},
+                {"$set": {"owner": self.owner}},
+            )
+            return claimed.modified_count == 1
+        record["owner"] = self.owner
+        return True
+    
+    async def delete_analysis(self, analysis_id: str):
+        """Delete an analysis and its upload, unless other analyses share the file"""
+        analysis = await self.get_analysis(analysis_id)
+        if not analysis:
+            return
+        
+        if self._db:
+            self._db.analyses.delete_one({"_id": analysis_id})
+        else:
+            self._store.pop(analysis_id, None)
+        
+        self.retention.release(analysis_id, reason="deleted")
+        self.retention.remove_results(analysis_id, reason="deleted")
+        file_path = self.retention.upload_path(analysis)
+        if self._count_file_references(file_path) == 0:
+            if self.retention.remove_upload(file_path, reason="deleted"):
+                logger.info(f"Removed upload {file_path}")
+        else:
+            logger.info(f"Keeping upload {file_path}, still used by other analyses")
+    
+    def _count_file_references(self, file_path: str) -> int:
+        """Number of analyses whose input is `file_path`"""
+        if self._db:
+            return self._db.analyses.count_documents({"file_path": file_path})
+        return sum(1 for record in self._store.values() if record.get("file_path") == file_path)
+    
+    @staticmethod
+    def _completed_update(results: dict) -> dict:
+        """Analysis record fields for completed pipeline results"""
+        update_data = {
+            "status": AnalysisStatus.COMPLETED.value,
+            "completed_at": datetime.utcnow(),
+            "total_variants": results['total_variants'],
+            "high_risk_variants": results['high_risk_variants'],
+            "pathogenic_variants": results['pathogenic_variants'],
+            "risk_probability": results['risk_probability'],
+            "risk_classification": results['risk_classification'],
+            "error_message": None
+        }
+        
+        # Add optional fields if available
+        if 'medium_risk_variants' in results:
+            update_data['medium_risk_variants'] = results['medium_risk_variants']
+        if 'low_risk_variants' in results:
+            update_data['low_risk_variants'] = results['low_risk_variants']
+        if results.get('variants'):
+            update_data['variants'] = results['variants']
+        for field in ('model_version', 'annotation_version', 'stored_variants'):
+            if field in results:
+                update_data[field] = results[field]
+        return update_data
+    
+    def _mark_processing(self, analysis_id: str):
+        self._update_analysis(analysis_id, {
+            "status": AnalysisStatus.PROCESSING.value,
+            "owner": self.owner,
+            "processing_started_at": datetime.utcnow(),
+        })
     
     def _update_status(self, analysis_id: str, status: str):
         """Update analysis status"""
@@ -0,0 +1,175 @@
+"""
+Persistent Annotation Cache
+SQLite-backed cache shared by every API and worker process on a host
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+# Processes only share the database if they open the same file, whatever
+# directory they were started from
+project_root = Path(__file__).parent.parent.parent
+
+DEFAULT_CACHE_PATH = "data/cache/annotations.sqlite"
+DEFAULT_TTL = 30 * 24 * 3600          # 30 days for found annotations
+DEFAULT_NEGATIVE_TTL = 24 * 3600      # 1 day for "not found" answers
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# Returned by get() when there is no live entry (None means a cached "not found")
+MISSING = object()
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 500
+
+
+class AnnotationCache:
+    """
+    Disk-backed key -> annotation cache with per-entry TTL, LRU eviction
+    and negative caching.
+
+    The database runs in WAL mode so readers in other processes are never
+    blocked by a writer. Storing None records that the remote service has
+    no annotation for a key; get() then returns None rather than MISSING.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            path: SQLite database file (created if missing); relative paths
+                are resolved against the project root, not the working directory
+            ttl: Seconds a found annotation stays valid
+            negative_ttl: Seconds a "not found" answer stays valid
+            max_entries: Size cap; least recently used entries are evicted beyond it
+        """
+        self.path = str(project_root / path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS annotations ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT,"                # JSON, NULL for negative entries
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS annotations_lru ON annotations (last_access)")
+
+    def get(self, key: str):
+        """Cached annotation, None for a cached "not found", or MISSING"""
+        return self.get_many([key]).get(key, MISSING)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Live entries for `keys`; keys without one are left out of the result"""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found, expired = {}, []
+
+        with self._lock:
+            for start in range(0, len(keys), _CHUNK):
+                chunk = keys[start:start + _CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, value, expires_at FROM annotations WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, value, expires_at in rows:
+                    if expires_at <= now:
+                        expired.append(key)
+                    else:
+                        found[key] = json.loads(value) if value is not None else None
+
+            if found:
+                self._execute_chunked(
+                    "UPDATE annotations SET last_access = ? WHERE key IN ({})", list(found), now)
+            if expired:
+                self._execute_chunked("DELETE FROM annotations WHERE key IN ({})", expired)
+
+        negative = sum(1 for value in found.values() if value is None)
+        self.stats['hits'] += len(found) - negative
+        self.stats['negative_hits'] += negative
+        self.stats['misses'] += len(keys) - len(found)
+        self.stats['expired'] += len(expired)
+        return found
+
+    def set(self, key: str, value: Optional[Dict], ttl: Optional[float] = None):
+        """Store one annotation (None caches a "not found" answer)"""
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, Optional[Dict]], ttl: Optional[float] = None):
+        """Store several annotations in one transaction"""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            if value is None:
+                rows.append((key, None, now + (self.negative_ttl if ttl is None else ttl), now))
+            else:
+                rows.append((key, json.dumps(value), now + (self.ttl if ttl is None else ttl), now))
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO annotations (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+
+    def purge_expired(self) -> int:
+        """Delete every expired entry; returns the number removed"""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM annotations WHERE expires_at <= ?", (time.time(),)).rowcount
+        self.stats['expired'] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM annotations")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries (caller holds the lock)"""
+        excess = self._conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM annotations WHERE key IN "
+                "(SELECT key FROM annotations ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+            self.stats['evictions'] += excess
+
+    def _execute_chunked(self, sql: str, keys, *leading):
+        for start in range(0, len(keys), _CHUNK):
+            chunk = keys[start:start + _CHUNK]
+            self._conn.execute(sql.format(','.join('?' * len(chunk))), (*leading, *chunk))
@@ -0,0 +1,86 @@
+"""
+Pipeline Checkpoints
+Durable per-analysis record of the stages that already finished
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+DEFAULT_CHECKPOINT_DIR = "data/checkpoints"
+
+
+def file_fingerprint(path: str) -> str:
+    """Cheap stand-in for a content hash: path, size and modification time"""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class CheckpointStore:
+    """
+    One JSON checkpoint per analysis, listing the finished pipeline stages
+    and their outputs.
+
+    Checkpoints are written to a temporary file, fsynced and renamed over
+    the previous one, so a crash at any point leaves either the old or the
+    new checkpoint on disk, never a torn one.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.directory = str(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, analysis_id: str) -> str:
+        return os.path.join(self.directory, f"{analysis_id}.json")
+
+    def save(self, analysis_id: str, checkpoint: Dict):
+        temp_path = os.path.join(self.directory, f".{analysis_id}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(checkpoint, f, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path(analysis_id))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._sync_directory()
+
+    def load(self, analysis_id: str) -> Optional[Dict]:
+        try:
+            with open(self.path(analysis_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint for {analysis_id}: {e}")
+            return None
+
+    def remove(self, analysis_id: str):
+        try:
+            os.remove(self.path(analysis_id))
+        except FileNotFoundError:
+            pass
+
+    def analysis_ids(self) -> List[str]:
+        """Analyses that currently have a checkpoint"""
+        return [name[:-len(".json")] for name in os.listdir(self.directory)
+                if name.endswith(".json") and not name.startswith(".")]
+
+    def _sync_directory(self):
+        # Make the rename itself durable (not supported on every platform)
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,79 @@
+"""
+Content-Addressed Upload Storage
+Uploaded VCFs are stored once per distinct content, named by SHA-256
+"""
+
+import hashlib
+import os
+import uuid
+from typing import Tuple
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class ContentStore:
+    """
+    Stores uploads as {sha256}{extension} in one directory.
+
+    The hash is computed while the upload streams to a temporary file, which
+    is then renamed into place; when the same bytes were uploaded before,
+    the temporary file is dropped and the existing copy is reused.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}{extension}")
+
+    async def save_upload(self, upload, extension: str, max_size: int) -> Tuple[str, str, bool]:
+        """
+        Stream an UploadFile into the store.
+
+        Returns:
+            (content hash, stored path, whether these bytes were already stored)
+
+        Raises:
+            ValueError: if the upload exceeds max_size bytes
+        """
+        digest = hashlib.sha256()
+        size = 0
+        temp_path = os.path.join(self.directory, f".upload-{uuid.uuid4().hex}.part")
+        try:
+            with open(temp_path, "wb") as buffer:
+                while True:
+                    chunk = await upload.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError("File too large")
+                    digest.update(chunk)
+                    buffer.write(chunk)
+
+            content_hash = digest.hexdigest()
+            path = self.path_for(content_hash, extension)
+            if os.path.exists(path):
+                try:
+                    # Storage eviction goes by age (with a grace period for new
+                    # files): mark the reused copy as just uploaded
+                    os.utime(path)
+                    os.remove(temp_path)
+                    return content_hash, path, True
+                except FileNotFoundError:
+                    pass    # evicted in the meantime; store this copy instead
+            # Identical concurrent uploads both rename identical bytes into place
+            os.replace(temp_path, path)
+            return content_hash, path, False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def remove(self, path: str) -> bool:
+        """Delete a stored file; returns whether it existed"""
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
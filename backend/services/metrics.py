@@ -0,0 +1,247 @@
+"""
+Pipeline Metrics
+Per-stage resource measurement and a Prometheus text-format registry
+"""
+
+import bisect
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Observations per label set the quantiles are computed over
+QUANTILE_WINDOW = 1024
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RSS_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192))
+THROUGHPUT_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6)
+
+
+def _reset_peak_rss() -> bool:
+    """Reset this process's peak RSS (Linux); returns whether that worked"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> int:
+    """Peak RSS of this process since the last reset (or since it started)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS), never reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process plus its finished child processes (e.g. parse workers)"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class StageTimer:
+    """
+    Measures pipeline stages: wall time, CPU time (including child
+    processes), peak RSS of this process and, once the variant count is
+    known, variants per second.
+    """
+
+    def __init__(self, reset_peak_rss: bool = True):
+        """
+        Args:
+            reset_peak_rss: Reset the process's peak RSS as each stage starts,
+                so every stage reports its own peak. The reset is process-wide:
+                only use it where the pipeline owns the process (pool workers,
+                the CLI), never in the API server
+        """
+        self.reset_peak_rss = reset_peak_rss
+        self.timings: Dict[str, Dict] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.reset_peak_rss:
+            _reset_peak_rss()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield
+        finally:
+            self.timings[name] = {
+                'wall_seconds': time.perf_counter() - wall,
+                'cpu_seconds': _cpu_seconds() - cpu,
+                'peak_rss_bytes': _peak_rss_bytes(),
+            }
+
+    def set_variants(self, variants: int):
+        """Record how many variants every measured stage processed"""
+        for timing in self.timings.values():
+            timing['variants'] = variants
+            timing['variants_per_second'] = variants / timing['wall_seconds'] if timing['wall_seconds'] else 0.0
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = list(labels) + [(key, value) for key, value in extra.items()]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _quantile(ordered, q: float) -> float:
+    """Nearest-rank quantile of a sorted, non-empty sequence"""
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """
+    Prometheus histogram, plus recent-window quantiles rendered as a
+    `<name>_window` summary (histogram buckets alone only bound percentiles)
+    """
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float], labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple, Dict] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0,
+                    'window': deque(maxlen=QUANTILE_WINDOW),
+                }
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+            series['window'].append(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        summary = [f"# HELP {self.name}_window {self.help} (last {QUANTILE_WINDOW} observations)",
+                   f"# TYPE {self.name}_window summary"]
+        with self._lock:
+            series = [(key, dict(s, counts=list(s['counts']), window=sorted(s['window'])))
+                      for key, s in self._series.items()]
+        for key, s in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, s['counts']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=_format_value(bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(s['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {s['count']}")
+
+            window = s['window']
+            for q in QUANTILES:
+                summary.append(f"{self.name}_window{_format_labels(key, quantile=q)} "
+                               f"{_format_value(_quantile(window, q))}")
+            summary.append(f"{self.name}_window_sum{_format_labels(key)} {_format_value(sum(window))}")
+            summary.append(f"{self.name}_window_count{_format_labels(key)} {len(window)}")
+        return lines + summary
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values]
+        return lines
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(self.read())}"]
+
+
+class MetricsRegistry:
+    """Named metric families rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. a second service instance) replaces the old family
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help, buckets, labelnames=()) -> Histogram:
+        return self._register(Histogram(name, help, buckets, labelnames))
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, read) -> Gauge:
+        return self._register(Gauge(name, help, read))
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+STAGE_WALL_SECONDS = METRICS.histogram(
+    "genomeguard_stage_wall_seconds", "Wall time per pipeline stage", DURATION_BUCKETS, ("stage",))
+STAGE_CPU_SECONDS = METRICS.histogram(
+    "genomeguard_stage_cpu_seconds", "CPU time per pipeline stage", DURATION_BUCKETS, ("stage",))
+STAGE_PEAK_RSS_BYTES = METRICS.histogram(
+    "genomeguard_stage_peak_rss_bytes", "Peak resident memory per pipeline stage", RSS_BUCKETS, ("stage",))
+STAGE_VARIANTS_PER_SECOND = METRICS.histogram(
+    "genomeguard_stage_variants_per_second", "Variants processed per second per pipeline stage",
+    THROUGHPUT_BUCKETS, ("stage",))
+ANALYSES_TOTAL = METRICS.counter(
+    "genomeguard_analyses_total", "Finished analyses by outcome", ("status",))
+
+
+def observe_timings(timings: Optional[Dict[str, Dict]]):
+    """Add one analysis's per-stage timings (from StageTimer) to the stage histograms"""
+    for stage, timing in (timings or {}).items():
+        STAGE_WALL_SECONDS.observe(timing['wall_seconds'], stage=stage)
+        STAGE_CPU_SECONDS.observe(timing['cpu_seconds'], stage=stage)
+        STAGE_PEAK_RSS_BYTES.observe(timing['peak_rss_bytes'], stage=stage)
+        if 'variants_per_second' in timing:
+            STAGE_VARIANTS_PER_SECOND.observe(timing['variants_per_second'], stage=stage)
@@ -2,63 +2,183 @@
 ML Pipeline Service
 Orchestrates the complete genomic analysis workflow:
 1. Preprocess VCF → 2. Annotate variants → 3. Predict disease risk
+→ 4. Store per-variant results (backend/services/variant_results.py)
+
+In streaming mode the steps are fused into one pass over the VCF with no
+intermediate tables (see scripts/streaming.py).
+
+In staged mode a checkpoint is written after every step, so an
+interrupted analysis resumes from its last finished step.
 """
 
+import hashlib
+import json
 import os
 import sys
 from pathlib import Path
 from loguru import logger
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import traceback
 
 # Add project root to path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from scripts.preprocess import preprocess_vcf
-from scripts.annotate import annotate_variants
-from scripts.predict import predict_disease_risk, load_model
+from scripts.preprocess import preprocess_vcf, DEFAULT_BATCH_SIZE
+from scripts.annotate import annotate_variants, GENE_INDEX, GeneIndex
+from scripts.predict import build_report, predict_disease_risk, model_registry
+from scripts.streaming import DEFAULT_TOP_K, stream_vcf
+from scripts.model_registry import ModelFileVersion, find_model_file
+from scripts.variant_store import VariantStore
+from backend.services.variant_annotator import VariantAnnotator
+from backend.services.metrics import StageTimer
+from backend.services.checkpoints import CheckpointStore, file_fingerprint
+from backend.services.variant_results import ANNOTATED_COLUMNS, VariantResultStore
+from scripts.intermediate import DEFAULT_FORMAT, read_table, resolve_format, table_path
+
+# Where intermediates are written and the model is served from
+PROCESSED_DIR = project_root / "data" / "processed"
+MODELS_DIR = project_root / "models"
+
+
+def _annotation_version(gene_version: str, store_version: Optional[str], remote: bool, regions_only: bool) -> str:
+    parts = [
+        f"genes={gene_version}",
+        f"store={store_version}",
+        f"remote={remote}",
+        f"regions={regions_only}",
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+def _compiled_version(directory: str) -> str:
+    """Version recorded in the meta.json of a compiled gene database or variant store"""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return json.load(f)['version']
+
+
+class PipelineVersions:
+    """
+    The (annotation version, model version) pair MLPipeline.versions() would
+    report for the same configuration, read from the compiled databases'
+    metadata and the model file without loading any of them; for processes
+    that look up cached results but never run the pipeline
+    """
+    
+    def __init__(self, regions_only: bool = False, gene_db_path: Optional[str] = None,
+                 variant_store_path: Optional[str] = None, remote: bool = False):
+        self.annotation_version = _annotation_version(
+            _compiled_version(gene_db_path) if gene_db_path else GENE_INDEX.version,
+            _compiled_version(variant_store_path) if variant_store_path else None,
+            remote,
+            regions_only,
+        )
+        self.model_version = ModelFileVersion(find_model_file(MODELS_DIR))
+    
+    def current(self) -> Tuple[str, str]:
+        return self.annotation_version, self.model_version.current()
 
 
 class MLPipeline:
     """Complete ML pipeline for genomic variant analysis"""
     
-    def __init__(self):
-        """Initialize pipeline with necessary directories"""
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, regions_only: bool = False,
+                 parse_workers: Optional[int] = None, intermediate_format: str = DEFAULT_FORMAT,
+                 parse_mode: str = 'mmap', gene_db_path: Optional[str] = None,
+                 variant_store_path: Optional[str] = None,
+                 annotator: Optional[VariantAnnotator] = None, model_threads: Optional[int] = None,
+                 streaming: bool = False, top_variants: int = DEFAULT_TOP_K,
+                 checkpoint_dir: Optional[str] = None, results_dir: Optional[str] = None):
+        """
+        Initialize pipeline with necessary directories
+
+        Args:
+            batch_size: Variants per record batch while streaming the VCF
+            regions_only: Only parse variants inside the annotated disease gene
+                regions (indexed seeks for BGZF input, filtered scan otherwise)
+            parse_workers: Processes used to parse large plain-text VCFs
+                (defaults to the number of CPU cores)
+            intermediate_format: Storage format for the tables handed between
+                stages ('parquet', 'arrow' or 'csv')
+            parse_mode: 'mmap' scans plain-text VCFs as memory-mapped bytes,
+                'text' decodes line by line
+            gene_db_path: Directory of a compiled gene database (see
+                scripts/gene_db.py); the built-in disease gene table is used if unset
+            variant_store_path: Directory of a compiled exact-match variant
+                store (see scripts/variant_store.py) applied after gene annotation
+            annotator: API-enabled VariantAnnotator for hybrid annotation; only
+                variants the gene index and variant store cannot resolve are sent to it
+            model_threads: XGBoost prediction threads (library default if unset)
+            streaming: Parse, annotate and featurize in a single pass over the
+                VCF instead of writing intermediate tables between stages
+            top_variants: Most significant variants returned for display
+                (streaming mode)
+            checkpoint_dir: Where per-analysis stage checkpoints are kept
+                (defaults to data/checkpoints)
+            results_dir: Where per-variant results are stored (defaults to
+                data/results)
+        """
+        self.batch_size = batch_size
+        self.regions_only = regions_only
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.intermediate_format = resolve_format(intermediate_format)
+        self.parse_mode = parse_mode
+        self.gene_index = GeneIndex.load(gene_db_path) if gene_db_path else GENE_INDEX
+        self.variant_store = VariantStore.load(variant_store_path) if variant_store_path else None
+        self.annotator = annotator
+        self.streaming = streaming
+        self.top_variants = top_variants
         self.base_dir = project_root
         self.upload_dir = self.base_dir / "data" / "uploads"
-        self.processed_dir = self.base_dir / "data" / "processed"
-        self.models_dir = self.base_dir / "models"
+        self.processed_dir = PROCESSED_DIR
+        self.models_dir = MODELS_DIR
+        self.checkpoints = CheckpointStore(checkpoint_dir or self.base_dir / "data" / "checkpoints")
+        self.variant_results = VariantResultStore(results_dir or self.base_dir / "data" / "results")
         
         # Create directories if they don't exist
         self.upload_dir.mkdir(parents=True, exist_ok=True)
         self.processed_dir.mkdir(parents=True, exist_ok=True)
         self.models_dir.mkdir(parents=True, exist_ok=True)
         
-        # Check if model exists
-        self.model_path = self.models_dir / "model.pkl"
+        # Shared, hot-reloading model; the rule-based model is served until a model file exists
+        self.model_path = Path(find_model_file(self.models_dir))
+        self.model_registry = model_registry(self.model_path, nthread=model_threads)
         if not self.model_path.exists():
-            logger.warning("Model file not found. Run scripts/train.py first!")
-            self.model = None
-        else:
-            try:
-                self.model = load_model()
-                logger.info("ML model loaded successfully")
-            except Exception as e:
-                logger.error(f"Failed to load model: {e}")
-                self.model = None
-    
-    def process_vcf_file(self, vcf_path: str, analysis_id: str) -> Dict:
+            logger.warning("Model file not found, using the rule-based model. Run scripts/train.py to train one")
+    
+    @property
+    def annotation_version(self) -> str:
+        """
+        Identifies everything that shapes annotation: the gene index and
+        variant store versions, remote annotation and region-restricted parsing
+        """
+        return _annotation_version(self.gene_index.version,
+                                   self.variant_store.version if self.variant_store else None,
+                                   self.annotator is not None, self.regions_only)
+    
+    def versions(self) -> Tuple[str, str]:
+        """(annotation version, model version) a run started now would use"""
+        return self.annotation_version, self.model_registry.current()[1]
+    
+    def process_vcf_file(self, vcf_path: str, analysis_id: str, input_hash: Optional[str] = None) -> Dict:
         """
         Run complete pipeline on a VCF file
         
+        Steps already recorded in a checkpoint for the same analysis and
+        input are skipped. The checkpoint is left in place; the caller
+        removes it once the results are persisted.
+        
         Args:
             vcf_path: Path to uploaded VCF file
             analysis_id: Unique identifier for this analysis
+            input_hash: Content hash of the VCF (a size/mtime fingerprint is
+                used if unknown); checkpoints for other input are ignored
             
         Returns:
-            Dictionary with analysis results
+            Dictionary with analysis results, including per-stage 'timings'
+            (wall/CPU seconds, peak RSS bytes, variants per second)
         """
+        timer = StageTimer()
         results = {
             'analysis_id': analysis_id,
             'status': 'failed',
@@ -70,44 +190,67 @@ class MLPipeline:
             'risk_probability': 0.0,
             'risk_classification': 'Unknown',
             'variants': [],
-            'error_message': None
+            'error_message': None,
+            'timings': timer.timings
         }
         
         try:
             logger.info(f"Starting pipeline for analysis {analysis_id}")
             logger.info(f"Input VCF: {vcf_path}")
             
+            if self.streaming:
+                logger.info("Streaming VCF through annotation and feature extraction...")
+                with timer.stage('stream'):
+                    prediction_results = self._streaming_step(vcf_path, analysis_id)
+                if not prediction_results:
+                    results['error_message'] = "Failed to analyze VCF file"
+                    return results
+                return self._complete(results, prediction_results, analysis_id, timer)
+            
+            checkpoint = self._load_checkpoint(analysis_id, input_hash or file_fingerprint(vcf_path))
+            stages = checkpoint['stages']
+            timer.timings.update(checkpoint['timings'])
+            if stages:
+                logger.info(f"Resuming from checkpoint after: {', '.join(stages)}")
+            
             # Step 1: Preprocess VCF
-            logger.info("Step 1/3: Preprocessing VCF file...")
-            processed_file = self._preprocess_step(vcf_path, analysis_id)
+            processed_file = stages.get('preprocess')
             if not processed_file:
-                results['error_message'] = "Failed to preprocess VCF file"
-                return results
+                logger.info("Step 1/3: Preprocessing VCF file...")
+                with timer.stage('preprocess'):
+                    processed_file = self._preprocess_step(vcf_path, analysis_id)
+                if not processed_file:
+                    results['error_message'] = "Failed to preprocess VCF file"
+                    return results
+                self._save_checkpoint(checkpoint, 'preprocess', processed_file, timer)
             
             # Step 2: Annotate variants
-            logger.info("Step 2/3: Annotating variants with disease associations...")
-            annotated_file = self._annotate_step(processed_file, analysis_id)
+            annotated_file = stages.get('annotate')
             if not annotated_file:
-                results['error_message'] = "Failed to annotate variants"
-                return results
+                logger.info("Step 2/3: Annotating variants with disease associations...")
+                with timer.stage('annotate'):
+                    annotated_file = self._annotate_step(processed_file, analysis_id)
+                if not annotated_file:
+                    results['error_message'] = "Failed to annotate variants"
+                    return results
+                self._save_checkpoint(checkpoint, 'annotate', annotated_file, timer)
             
             # Step 3: Predict disease risk
-            logger.info("Step 3/3: Predicting disease risk using ML model...")
-            prediction_results = self._predict_step(annotated_file, vcf_path)
+            prediction_results = stages.get('predict')
             if not prediction_results:
-                results['error_message'] = "Failed to generate risk prediction"
-                return results
+                logger.info("Step 3/3: Predicting disease risk using ML model...")
+                with timer.stage('predict'):
+                    prediction_results = self._predict_step(annotated_file, vcf_path)
+                if not prediction_results:
+                    results['error_message'] = "Failed to generate risk prediction"
+                    return results
+                self._save_checkpoint(checkpoint, 'predict', prediction_results, timer)
             
-            # Combine results
-            results.update(prediction_results)
-            results['status'] = 'completed'
+            # Step 4: Keep every annotated variant for the paginated results API
+            with timer.stage('store_variants'):
+                results.update(self._store_variants_step(annotated_file, analysis_id))
             
-            logger.info(f"Pipeline completed successfully for {analysis_id}")
-            logger.info(f"Total variants: {results['total_variants']}")
-            logger.info(f"High risk: {results['high_risk_variants']}")
-            logger.info(f"Risk classification: {results['risk_classification']}")
-            
-            return results
+            return self._complete(results, prediction_results, analysis_id, timer)
             
         except Exception as e:
             error_msg = f"Pipeline error: {str(e)}"
@@ -116,13 +259,79 @@ class MLPipeline:
             results['error_message'] = error_msg
             return results
     
+    def _load_checkpoint(self, analysis_id: str, input_hash: str) -> Dict:
+        """
+        The usable part of an analysis's checkpoint: the leading stages whose
+        outputs still exist and were produced with the current settings
+        """
+        checkpoint = {
+            'analysis_id': analysis_id,
+            'input_hash': input_hash,
+            'regions_only': self.regions_only,
+            'intermediate_format': self.intermediate_format,
+            'annotation_version': self.annotation_version,
+            'stages': {},
+            'timings': {},
+        }
+        saved = self.checkpoints.load(analysis_id)
+        if not saved or saved.get('input_hash') != input_hash:
+            return checkpoint
+        
+        saved_stages = saved.get('stages', {})
+        valid = {
+            'preprocess': (saved.get('regions_only') == self.regions_only
+                           and saved.get('intermediate_format') == self.intermediate_format
+                           and Path(saved_stages.get('preprocess', '')).is_file()),
+            'annotate': (saved.get('annotation_version') == self.annotation_version
+                         and Path(saved_stages.get('annotate', '')).is_file()),
+            'predict': (saved_stages.get('predict', {}).get('model_version')
+                        == self.model_registry.current()[1]),
+        }
+        for stage in ('preprocess', 'annotate', 'predict'):
+            if stage not in saved_stages or not valid[stage]:
+                break
+            checkpoint['stages'][stage] = saved_stages[stage]
+            if stage in saved.get('timings', {}):
+                checkpoint['timings'][stage] = saved['timings'][stage]
+        return checkpoint
+    
+    def _save_checkpoint(self, checkpoint: Dict, stage: str, output, timer: StageTimer):
+        """Record a finished stage and its output (file path or prediction results)"""
+        checkpoint['stages'][stage] = output
+        checkpoint['timings'] = dict(timer.timings)
+        try:
+            self.checkpoints.save(checkpoint['analysis_id'], checkpoint)
+        except OSError as e:
+            # The analysis can still finish; it just could not resume from here
+            logger.warning(f"Could not write checkpoint for {checkpoint['analysis_id']}: {e}")
+    
+    def _complete(self, results: Dict, prediction_results: Dict, analysis_id: str, timer: StageTimer) -> Dict:
+        """Combine prediction results into the pipeline result"""
+        results.update(prediction_results)
+        results['status'] = 'completed'
+        timer.set_variants(results['total_variants'])
+        
+        logger.info(f"Pipeline completed successfully for {analysis_id}")
+        logger.info(f"Total variants: {results['total_variants']}")
+        logger.info(f"High risk: {results['high_risk_variants']}")
+        logger.info(f"Risk classification: {results['risk_classification']}")
+        for stage, timing in timer.timings.items():
+            logger.info(f"  {stage}: {timing['wall_seconds']:.3f}s wall, {timing['cpu_seconds']:.3f}s CPU, "
+                        f"{timing['peak_rss_bytes'] / 2**20:.0f} MB peak RSS, "
+                        f"{timing['variants_per_second']:,.0f} variants/s")
+        
+        return results
+    
     def _preprocess_step(self, vcf_path: str, analysis_id: str) -> Optional[str]:
-        """Step 1: Preprocess VCF to CSV"""
+        """Step 1: Stream the VCF in record batches into the intermediate table"""
         try:
-            base_name = Path(vcf_path).stem
-            processed_file = self.processed_dir / f"{analysis_id}_processed.csv"
+            processed_file = Path(table_path(self.processed_dir, f"{analysis_id}_processed",
+                                             self.intermediate_format))
             
-            success = preprocess_vcf(vcf_path, str(processed_file))
+            regions = self.gene_index.regions() if self.regions_only else None
+            success = preprocess_vcf(vcf_path, str(processed_file), batch_size=self.batch_size,
+                                     regions=regions, workers=self.parse_workers,
+                                     mode=self.parse_mode)
             
             if success and processed_file.exists():
                 logger.info(f"✓ Preprocessing complete: {processed_file}")
@@ -138,9 +347,11 @@ class MLPipeline:
     def _annotate_step(self, processed_file: str, analysis_id: str) -> Optional[str]:
         """Step 2: Annotate variants with disease info"""
         try:
-            annotated_file = self.processed_dir / f"{analysis_id}_annotated.csv"
+            annotated_file = Path(table_path(self.processed_dir, f"{analysis_id}_annotated",
+                                             self.intermediate_format))
             
-            success = annotate_variants(processed_file, str(annotated_file))
+            success = annotate_variants(processed_file, str(annotated_file), index=self.gene_index,
+                                        store=self.variant_store, remote=self.annotator)
             
             if success and annotated_file.exists():
                 logger.info(f"✓ Annotation complete: {annotated_file}")
@@ -157,24 +368,12 @@ class MLPipeline:
         """Step 3: Predict disease risk"""
         try:
             # Use the prediction function from predict.py with explicit annotated file path
-            report = predict_disease_risk(original_vcf, annotated_file)
+            model, model_version = self.model_registry.current()
+            report = predict_disease_risk(original_vcf, annotated_file, model=model)
             
             if report:
-                # Convert report to our result format
-                results = {
-                    'total_variants': report['total_variants'],
-                    'high_risk_variants': report['high_risk_variants'],
-                    'pathogenic_variants': report['pathogenic_variants'],
-                    'risk_probability': report['disease_risk_probability'],
-                    'risk_classification': report['risk_classification'].lower().replace(' ', '_'),
-                    
-                    # Add more detailed breakdown
-                    'medium_risk_variants': report.get('medium_risk_variants', 0),
-                    'low_risk_variants': report.get('low_risk_variants', 0),
-                }
-                
                 logger.info(f"✓ Prediction complete")
-                return results
+                return self._prediction_results(report, model_version)
             else:
                 logger.error("Prediction returned no results")
                 return None
@@ -184,22 +383,75 @@ class MLPipeline:
             logger.error(traceback.format_exc())
             return None
     
-    def cleanup_intermediate_files(self, analysis_id: str):
-        """Clean up intermediate processing files"""
+    def _streaming_step(self, vcf_path: str, analysis_id: str) -> Optional[Dict]:
+        """Parse, annotate and predict in one pass over the VCF (streaming mode)"""
+        writer = self.variant_results.writer(analysis_id) if self.variant_results.available else None
         try:
-            patterns = [
-                f"{analysis_id}_processed.csv",
-                f"{analysis_id}_annotated.csv"
-            ]
-            
-            for pattern in patterns:
-                file_path = self.processed_dir / pattern
-                if file_path.exists():
-                    file_path.unlink()
-                    logger.info(f"Cleaned up: {file_path}")
-                    
+            regions = self.gene_index.regions() if self.regions_only else None
+            features, top = stream_vcf(vcf_path, index=self.gene_index, store=self.variant_store,
+                                       remote=self.annotator, top_k=self.top_variants, sink=writer,
+                                       batch_size=self.batch_size, regions=regions,
+                                       workers=self.parse_workers, mode=self.parse_mode)
+            if features.rows == 0:
+                logger.error("No variants found in VCF file")
+                if writer is not None:
+                    writer.abort()
+                return None
+            
+            model, model_version = self.model_registry.current()
+            vector = features.features()
+            prob_high, classes = model.score_batch([vector])
+            report = build_report(vcf_path, features.rows, vector, prob_high[0], classes[0])
+            
+            results = self._prediction_results(report, model_version)
+            results['variants'] = top.records()
+            if writer is not None:
+                results['stored_variants'] = writer.commit()
+                results['variant_results'] = analysis_id
+            logger.info(f"✓ Streaming analysis complete: {features.rows} variants")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Streaming analysis error: {e}")
+            logger.error(traceback.format_exc())
+            if writer is not None:
+                writer.abort()
+            return None
+    
+    def _store_variants_step(self, annotated_file: str, analysis_id: str) -> Dict:
+        """Step 4: Copy the annotated variants into the analysis's result chunks"""
+        if not self.variant_results.available:
+            logger.warning("pyarrow not installed, per-variant results are not stored")
+            return {}
+        writer = self.variant_results.writer(analysis_id)
+        try:
+            df = read_table(annotated_file, columns=ANNOTATED_COLUMNS)
+            for start in range(0, len(df), self.batch_size):
+                writer.write(df.iloc[start:start + self.batch_size])
+            stored = writer.commit()
+            logger.info(f"✓ Stored {stored} variant results")
+            return {'stored_variants': stored, 'variant_results': analysis_id}
         except Exception as e:
-            logger.warning(f"Cleanup error: {e}")
+            # The risk prediction stands without them; only the variant listing is missing
+            writer.abort()
+            logger.warning(f"Could not store variant results: {e}")
+            return {}
+    
+    def _prediction_results(self, report: Dict, model_version: str) -> Dict:
+        """Convert a prediction report to our result format"""
+        return {
+            'total_variants': report['total_variants'],
+            'high_risk_variants': report['high_risk_variants'],
+            'pathogenic_variants': report['pathogenic_variants'],
+            'risk_probability': report['disease_risk_probability'],
+            'risk_classification': report['risk_classification'].lower().replace(' ', '_'),
+            'model_version': model_version,
+            'annotation_version': self.annotation_version,
+            
+            # Add more detailed breakdown
+            'medium_risk_variants': report.get('medium_risk_variants', 0),
+            'low_risk_variants': report.get('low_risk_variants', 0),
+        }
 
 
 # Test the pipeline
@@ -0,0 +1,139 @@
+"""
+Pipeline Executor
+Runs analyses on a pool of worker processes with the pipeline preloaded
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+# The pipeline each worker process builds once, in _init_worker
+_PIPELINE = None
+
+
+class ExecutorFull(Exception):
+    """Raised by submit() when the submission queue is at capacity"""
+
+
+def _init_worker(pipeline_factory: Callable):
+    global _PIPELINE
+    _PIPELINE = pipeline_factory()
+    logger.info(f"Pipeline worker {os.getpid()} ready")
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _run_pipeline(vcf_path: str, analysis_id: str, input_hash: Optional[str]) -> Dict:
+    return _PIPELINE.process_vcf_file(vcf_path, analysis_id, input_hash)
+
+
+class PipelineExecutor:
+    """
+    Pool of worker processes running MLPipeline.process_vcf_file.
+
+    The pool is created by start() (or the first submit()), not by the
+    constructor, so merely importing the service forks nothing. Every worker
+    then calls `pipeline_factory` once, so the gene index, variant store and
+    model are loaded before the first job arrives and stay warm between jobs. Analyses run outside the API process and
+    never compete with request handling for the GIL.
+
+    At most `max_pending` jobs may be queued or running; submit() raises
+    ExecutorFull beyond that so callers can shed load. Results come back
+    through a callback run in this process, which is where the database
+    is updated.
+    """
+
+    def __init__(self, pipeline_factory: Callable, workers: Optional[int] = None, max_pending: int = 32):
+        """
+        Args:
+            pipeline_factory: Picklable zero-argument callable returning an
+                MLPipeline (e.g. a module-level function)
+            workers: Worker processes (defaults to the number of CPU cores)
+            max_pending: Capacity of the submission queue, running jobs included
+        """
+        self.pipeline_factory = pipeline_factory
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pending(self) -> int:
+        """Jobs queued or running"""
+        return self._pending
+
+    def start(self):
+        """Start the worker processes (and their pipeline loading) now rather than on the first submit()"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._start_pool()
+    
+    def submit(self, vcf_path: str, analysis_id: str,
+               on_done: Optional[Callable[[str, Optional[Dict], Optional[BaseException]], None]] = None,
+               input_hash: Optional[str] = None) -> Future:
+        """
+        Queue an analysis.
+
+        `on_done(analysis_id, results, error)` is called in this process when
+        the job finishes; exactly one of results and error is None.
+        `input_hash` identifies the input for resuming from checkpoints.
+
+        Raises:
+            ExecutorFull: if max_pending jobs are already queued or running
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise ExecutorFull(f"{self._pending} analyses already queued")
+            if self._pool is None:
+                self._pool = self._start_pool()
+            try:
+                future = self._pool.submit(_run_pipeline, vcf_path, analysis_id, input_hash)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); replace the pool and retry once
+                logger.error("Pipeline worker pool broken, restarting it")
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._start_pool()
+                future = self._pool.submit(_run_pipeline, vcf_path, analysis_id, input_hash)
+            self._pending += 1
+            self.stats['submitted'] += 1
+
+        future.add_done_callback(lambda done: self._finish(done, analysis_id, on_done))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.pipeline_factory,))
+        # Start every worker now, so they load the pipeline before the first
+        # analysis is waiting rather than after
+        for _ in range(self.workers):
+            pool.submit(_warm_up)
+        return pool
+
+    def _finish(self, future: Future, analysis_id: str, on_done: Optional[Callable]):
+        with self._lock:
+            self._pending -= 1
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled():
+            error = RuntimeError("Analysis cancelled")
+        self.stats['failed' if error else 'completed'] += 1
+        if on_done is None:
+            return
+        try:
+            on_done(analysis_id, None if error else future.result(), error)
+        except Exception as e:
+            logger.error(f"Result handler failed for {analysis_id}: {e}")
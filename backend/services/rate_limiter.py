@@ -0,0 +1,100 @@
+"""
+Shared Rate Limiter
+Token bucket coordinated across processes through a local SQLite file
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Processes only share the database if they open the same file, whatever
+# directory they were started from
+project_root = Path(__file__).parent.parent.parent
+
+DEFAULT_LIMITER_PATH = "data/cache/rate_limits.sqlite"
+
+
+class TokenBucket:
+    """
+    Token bucket whose state lives in SQLite, so every worker process on a
+    host draws from the same budget.
+
+    Callers reserve tokens up front: when the bucket is short they take it
+    into debt and sleep until their reservation is covered. Each caller
+    therefore needs one short transaction, waits no longer than the rate
+    requires, and concurrent callers are served in arrival order.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float = 1, path: str = DEFAULT_LIMITER_PATH):
+        """
+        Args:
+            name: Bucket name; processes using the same name share a budget
+            rate: Tokens added per second
+            burst: Bucket capacity, i.e. how many calls may go out back to back
+            path: SQLite database holding the bucket state; relative paths
+                are resolved against the project root, not the working directory
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.path = str(project_root / path)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+            (name, burst, time.time()),
+        )
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take `tokens` from the bucket; returns the seconds to wait before using them"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                now = time.time()
+                available, updated_at = row if row else (self.burst, now)
+                available = min(self.burst, available + max(0.0, now - updated_at) * self.rate)
+                available -= tokens
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    (self.name, available, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return max(0.0, -available / self.rate)
+
+    def acquire(self, tokens: float = 1):
+        """Block until `tokens` may be spent"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Asyncio version of acquire()"""
+        wait = await asyncio.to_thread(self.reserve, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,66 @@
+"""
+Analysis Result Cache
+Memoizes pipeline results by input content and the versions that shaped them
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+
+from loguru import logger
+
+# Pipeline result fields worth replaying for a repeat upload
+RESULT_FIELDS = (
+    'total_variants', 'high_risk_variants', 'medium_risk_variants', 'low_risk_variants',
+    'pathogenic_variants', 'risk_probability', 'risk_classification', 'model_version',
+    'annotation_version', 'variants', 'stored_variants', 'variant_results',
+)
+
+
+class ResultCache:
+    """
+    Pipeline results keyed by (content hash, annotation version, model version).
+
+    A result stays valid as long as the same bytes are analyzed with the
+    same annotation databases and model, so entries never expire; changing
+    either version simply stops them from matching. Entries live in the
+    `result_cache` MongoDB collection, or in memory when no database is
+    available.
+    """
+
+    def __init__(self, db=None, collection: str = "result_cache"):
+        self._collection = db[collection] if db is not None else None
+        self._store: Dict[str, Dict] = {}
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(content_hash: str, annotation_version: str, model_version: str) -> str:
+        return f"{content_hash}:{annotation_version}:{model_version}"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached result fields for `key`, or None"""
+        entry = None
+        if self._collection is not None:
+            try:
+                entry = self._collection.find_one({"_id": key})
+            except Exception as e:
+                logger.warning(f"Result cache read failed: {e}")
+        else:
+            entry = self._store.get(key)
+
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return {field: entry[field] for field in RESULT_FIELDS if field in entry}
+
+    def set(self, key: str, results: Dict):
+        """Store the result fields of a completed pipeline run"""
+        entry = {field: results[field] for field in RESULT_FIELDS if field in results}
+        entry['created_at'] = datetime.utcnow()
+        if self._collection is not None:
+            try:
+                self._collection.replace_one({"_id": key}, {"_id": key, **entry}, upsert=True)
+            except Exception as e:
+                logger.warning(f"Result cache write failed: {e}")
+        else:
+            self._store[key] = entry
@@ -0,0 +1,267 @@
+"""
+Artifact Retention
+Removes pipeline intermediates once results are persisted, cleans up files
+left behind by deleted analyses and keeps storage within a disk budget
+"""
+
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from backend.models.schemas import AnalysisStatus
+from backend.services.checkpoints import CheckpointStore
+from backend.services.metrics import METRICS
+from backend.services.variant_results import VariantResultStore
+
+# Pipeline intermediates are named {analysis_id}_{stage}{extension} (processed, annotated)
+ANALYSIS_FILE = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_")
+# Files younger than this are never evicted or treated as orphans: the
+# analysis that owns them may not be recorded in the database yet
+DEFAULT_GRACE_SECONDS = 600
+# Analyses whose checkpoints may still be resumed
+ACTIVE_STATUSES = (AnalysisStatus.PENDING.value, AnalysisStatus.PROCESSING.value)
+
+RECLAIMED_BYTES = METRICS.counter(
+    "genomeguard_retention_reclaimed_bytes_total", "Bytes freed by artifact retention", ("reason",))
+RECLAIMED_FILES = METRICS.counter(
+    "genomeguard_retention_reclaimed_files_total", "Files removed by artifact retention", ("reason",))
+
+
+def _upload_key(name: str) -> str:
+    """Content hash an upload (or the tabix/CSI index built next to it) belongs to"""
+    return name.lstrip(".").split(".", 1)[0]
+
+
+class RetentionManager:
+    """
+    Tracks the files each analysis leaves on disk and removes them when
+    they are no longer needed.
+
+    Artifacts of an analysis:
+      - intermediates: {analysis_id}_processed / _annotated tables in the
+        processed directory, and its stage checkpoint
+      - its upload in the content store, with any index built next to it;
+        shared by every analysis of the same content
+      - its per-variant results, kept as long as the analysis exists and
+        outside the disk budget
+
+    Files are removed for one of these reasons, each counted separately:
+      - released: intermediates of an analysis whose outcome is persisted
+        (and the variant results of one that failed)
+      - deleted: artifacts of an analysis deleted by its user
+      - orphaned: files no analysis record refers to (crashes, old deletes)
+      - evicted: oldest inactive files removed to get back under the budget
+    """
+
+    def __init__(self, upload_dir: str, processed_dir: str, checkpoints: CheckpointStore,
+                 results: VariantResultStore, disk_budget: int = 0,
+                 grace_seconds: int = DEFAULT_GRACE_SECONDS):
+        """
+        Args:
+            upload_dir: Content store directory holding the uploads
+            processed_dir: Directory the pipeline writes intermediates to
+            checkpoints: Stage checkpoints of the pipeline
+            results: Per-variant results of the pipeline
+            disk_budget: Bytes uploads and intermediates may occupy (0 = unlimited)
+            grace_seconds: Minimum age before a file is evicted or orphaned
+        """
+        self.upload_dir = str(upload_dir)
+        self.processed_dir = str(processed_dir)
+        self.checkpoints = checkpoints
+        self.results = results
+        self.disk_budget = disk_budget
+        self.grace_seconds = grace_seconds
+        self.stats = {'released': 0, 'deleted': 0, 'orphaned': 0, 'evicted': 0}
+
+    def intermediates(self, analysis_id: str) -> List[str]:
+        """Intermediate tables and checkpoint of an analysis"""
+        prefix = f"{analysis_id}_"
+        paths = [os.path.join(self.processed_dir, name) for name in self._list(self.processed_dir)
+                 if name.startswith(prefix)]
+        checkpoint = self.checkpoints.path(analysis_id)
+        if os.path.exists(checkpoint):
+            paths.append(checkpoint)
+        return paths
+
+    def upload_files(self, upload_path: str) -> List[str]:
+        """An upload and the indexes built next to it"""
+        key = _upload_key(os.path.basename(upload_path))
+        return [os.path.join(self.upload_dir, name) for name in self._list(self.upload_dir)
+                if not name.startswith(".") and _upload_key(name) == key]
+
+    def upload_path(self, record: Dict) -> str:
+        """Upload of an analysis record; uploads from before content addressing were stored per user"""
+        return record.get("file_path") or os.path.join(
+            self.upload_dir, f"{record.get('user_id')}_{record.get('vcf_file')}")
+
+    def artifacts(self, record: Dict) -> List[str]:
+        """Every file on disk belonging to an analysis, its (possibly shared) upload included"""
+        return (self.intermediates(record["_id"]) + self.results.files(record["_id"])
+                + self.upload_files(self.upload_path(record)))
+
+    def release(self, analysis_id: str, reason: str = "released") -> int:
+        """Remove an analysis's intermediates; returns the bytes freed"""
+        return sum(self.discard(path, reason) for path in self.intermediates(analysis_id))
+
+    def remove_results(self, analysis_id: str, reason: str = "released") -> int:
+        """Remove an analysis's per-variant results; returns the bytes freed"""
+        return self._remove_directory(self.results.path(analysis_id), reason)
+
+    def remove_upload(self, upload_path: str, reason: str = "deleted") -> int:
+        """Remove an upload and its indexes; returns the bytes freed"""
+        return sum(self.discard(path, reason) for path in self.upload_files(upload_path))
+
+    def discard(self, path: str, reason: str) -> int:
+        """Remove one file and count it under `reason`; returns the bytes freed"""
+        try:
+            stat = os.stat(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+            return 0
+        # Variant results shared with another analysis are hard links: no space comes back yet
+        size = stat.st_size if stat.st_nlink <= 1 else 0
+        self.stats[reason] = self.stats.get(reason, 0) + size
+        RECLAIMED_BYTES.inc(size, reason=reason)
+        RECLAIMED_FILES.inc(reason=reason)
+        logger.debug(f"Removed {path} ({reason}, {size} bytes)")
+        return size
+
+    def disk_usage(self) -> int:
+        """Bytes currently used by uploads, intermediates and checkpoints"""
+        return sum(size for _, size, _ in self._files())
+
+    def enforce_budget(self, active: Callable[[], Iterable[Dict]]) -> int:
+        """
+        Evict the least recently modified files until usage is within the
+        disk budget. Uploads are evicted together with their indexes.
+
+        Args:
+            active: Returns the pending and processing analysis records,
+                whose files are never evicted; only called when over budget
+
+        Returns:
+            Bytes freed
+        """
+        if not self.disk_budget:
+            return 0
+        files = self._files()
+        usage = sum(size for _, size, _ in files)
+        if usage <= self.disk_budget:
+            return 0
+
+        in_use = self._keys(active())
+        groups: Dict[str, List] = {}
+        for path, size, mtime in files:
+            key = self._owner(path)
+            if key is not None and key not in in_use:
+                groups.setdefault(key, []).append((path, size, mtime))
+
+        freed = 0
+        # Oldest first, by the newest file of each group
+        for key, group in sorted(groups.items(), key=lambda item: max(mtime for _, _, mtime in item[1])):
+            if usage - freed <= self.disk_budget:
+                break
+            if not self._expired(max(mtime for _, _, mtime in group)):
+                continue
+            freed += sum(self.discard(path, "evicted") for path, _, _ in group)
+
+        if usage - freed > self.disk_budget:
+            logger.warning(f"Storage still over budget after eviction: "
+                           f"{usage - freed} of {self.disk_budget} bytes in use")
+        elif freed:
+            logger.info(f"Evicted {freed} bytes to stay within the {self.disk_budget} byte budget")
+        return freed
+
+    def remove_orphans(self, records: Iterable[Dict]) -> int:
+        """
+        Remove files left by analyses that no longer exist, and checkpoints
+        of analyses that are no longer pending or processing.
+
+        Args:
+            records: Every analysis record (`_id`, `status` and upload fields)
+
+        Returns:
+            Bytes freed
+        """
+        records = list(records)
+        known_keys = self._keys(records)
+        active_ids = {record["_id"] for record in records if record.get("status") in ACTIVE_STATUSES}
+        freed = 0
+        for name in self.results.analysis_ids():
+            path = self.results.path(name)
+            # Temporary directories belong to writes that never finished
+            if (name.startswith(".") or name not in known_keys) and self._expired(os.path.getmtime(path)):
+                freed += self._remove_directory(path, "orphaned")
+        for path, _, mtime in self._files():
+            if not self._expired(mtime):
+                continue
+            name = os.path.basename(path)
+            if os.path.dirname(path) == self.checkpoints.directory:
+                orphan = name.startswith(".") or name[:-len(".json")] not in active_ids
+            else:
+                # Leftover partial uploads and temporary files are orphans too
+                key = self._owner(path)
+                orphan = name.startswith(".") or (key is not None and key not in known_keys)
+            if orphan:
+                freed += self.discard(path, "orphaned")
+        if freed:
+            logger.info(f"Removed {freed} bytes of orphaned artifacts")
+        return freed
+
+    def _remove_directory(self, directory: str, reason: str) -> int:
+        freed = sum(self.discard(os.path.join(directory, name), reason) for name in self._list(directory))
+        try:
+            os.rmdir(directory)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {directory}: {e}")
+        return freed
+
+    def _keys(self, records: Iterable[Dict]) -> Set[str]:
+        """Analysis IDs and upload keys the records refer to"""
+        keys = set()
+        for record in records:
+            keys.add(record["_id"])
+            keys.add(_upload_key(os.path.basename(self.upload_path(record))))
+        return keys
+
+    def _owner(self, path: str) -> Optional[str]:
+        """Analysis ID or upload content hash a managed file belongs to (None: leave alone)"""
+        directory, name = os.path.split(path)
+        if directory == self.upload_dir:
+            return _upload_key(name)
+        if directory == self.checkpoints.directory:
+            return name[:-len(".json")] if name.endswith(".json") else None
+        match = ANALYSIS_FILE.match(name)
+        return match.group(1) if match else None
+
+    def _expired(self, mtime: float) -> bool:
+        return time.time() - mtime >= self.grace_seconds
+
+    def _files(self) -> List:
+        """(path, size, mtime) of every file in the managed directories"""
+        files = []
+        for directory in (self.upload_dir, self.processed_dir, self.checkpoints.directory):
+            for name in self._list(directory):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if os.path.isfile(path):
+                    files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    @staticmethod
+    def _list(directory: str) -> List[str]:
+        try:
+            return os.listdir(directory)
+        except FileNotFoundError:
+            return []
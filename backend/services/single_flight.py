@@ -0,0 +1,80 @@
+"""
+Request Coalescing
+Lets concurrent lookups of the same key share one in-flight request
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+class SingleFlight:
+    """
+    Tracks keys that are currently being fetched.
+
+    The first caller for a key becomes its owner and performs the fetch;
+    everyone else asking for the key meanwhile waits on the owner's result.
+    Futures are concurrent.futures.Future objects, so threads can block on
+    them and asyncio tasks (in any event loop) can await wrap()-ed versions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self.stats = {'owned': 0, 'coalesced': 0}
+
+    def claim(self, keys: Iterable[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        """
+        Claim keys for fetching.
+
+        Returns:
+            (keys the caller now owns and must resolve(),
+             {key: future} for keys another caller is already fetching)
+        """
+        owned, waiting = [], {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                future = self._inflight.get(key)
+                if future is None:
+                    self._inflight[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = future
+        self.stats['owned'] += len(owned)
+        self.stats['coalesced'] += len(waiting)
+        return owned, waiting
+
+    def resolve(self, results: Dict[Hashable, object]):
+        """Publish results for owned keys and release them"""
+        with self._lock:
+            futures = [(self._inflight.pop(key, None), value) for key, value in results.items()]
+        for future, value in futures:
+            if future is not None:
+                future.set_result(value)
+
+    def fail(self, keys: Iterable[Hashable], error: BaseException):
+        """Release owned keys, passing `error` to their waiters"""
+        with self._lock:
+            futures = [self._inflight.pop(key, None) for key in keys]
+        for future in futures:
+            if future is not None:
+                future.set_exception(error)
+
+    def do(self, key: Hashable, fetch: Callable[[], object]):
+        """Run fetch() for `key` unless it is already in flight; either way return its result"""
+        owned, waiting = self.claim([key])
+        if not owned:
+            return waiting[key].result()
+        try:
+            value = fetch()
+        except BaseException as e:
+            self.fail(owned, e)
+            raise
+        self.resolve({key: value})
+        return value
+
+    @staticmethod
+    def wrap(future: Future) -> asyncio.Future:
+        """Awaitable view of an in-flight future for the running event loop"""
+        return asyncio.wrap_future(future)
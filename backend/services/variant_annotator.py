@@ -3,10 +3,34 @@ Variant Annotation Service
 Provides both local (fast, reliable) and API-based (comprehensive) annotation options
 """
 
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional
 from loguru import logger
-import time
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend.services.annotation_cache import AnnotationCache, MISSING
+from backend.services.rate_limiter import TokenBucket
+from backend.services.single_flight import SingleFlight
+from scripts.annotate import PATHOGENICITY_LEVELS, RISK_LEVELS, overlay_categorical
+from scripts.variant_store import classify_significance
+
+MYVARIANT_URL = "https://myvariant.info/v1"
+ANNOTATION_FIELDS = 'clinvar,dbsnp,cadd,dbnsfp.genename,dbnsfp.clinvar'
+
+# MyVariant.info accepts up to 1000 ids per batch POST
+MAX_BATCH_SIZE = 1000
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Default request budget shared by all annotator processes on the host
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
 
 class VariantAnnotator:
     """
@@ -15,17 +39,54 @@ class VariantAnnotator:
     2. MyVariant.info API (comprehensive, real-time)
     """
     
-    def __init__(self, use_api: bool = False):
+    def __init__(self, use_api: bool = False, api_base_url: str = MYVARIANT_URL,
+                 batch_size: int = MAX_BATCH_SIZE, max_concurrency: int = 4,
+                 max_retries: int = 3, backoff: float = 0.5, timeout: float = 10,
+                 cache: Optional[AnnotationCache] = None,
+                 rate_limiter: Optional[TokenBucket] = None):
         """
         Initialize annotator
         
         Args:
             use_api: If True, uses MyVariant.info API for real-time annotations
                     If False, uses local curated database (recommended for demos)
+            api_base_url: MyVariant-compatible API root (point at a stub server in tests)
+            batch_size: Variant ids per batch POST (at most 1000)
+            max_concurrency: Batch requests in flight at once
+            max_retries: Retries for throttled, failed or timed-out batch requests
+            backoff: Initial retry delay in seconds, doubled on each attempt
+            timeout: Per-request timeout in seconds
+            cache: Shared persistent annotation cache (a default on-disk cache
+                    is opened when the API is used and none is given)
+            rate_limiter: Request budget shared across processes (defaults to
+                    DEFAULT_RATE requests/s with a burst of DEFAULT_BURST)
         """
         self.use_api = use_api
-        self.api_base_url = "https://myvariant.info/v1"
-        self.cache = {}  # Simple in-memory cache
+        self.api_base_url = api_base_url.rstrip('/')
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Persistent cache shared with other processes; also remembers "not found" answers
+        self.cache = cache if cache is not None else (AnnotationCache() if use_api else None)
+        # Every HTTP request (single lookup, batch POST or retry) spends one token
+        if rate_limiter is None and use_api:
+            rate_limiter = TokenBucket('myvariant', rate=DEFAULT_RATE, burst=DEFAULT_BURST)
+        self.rate_limiter = rate_limiter
+        # Concurrent lookups of the same variant (threads or asyncio tasks) share one request
+        self._inflight = SingleFlight()
+        
+        # Keep-alive connection pool shared by all requests (one connection per concurrent batch)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    @staticmethod
+    def hgvs_id(chrom, pos, ref: str, alt: str) -> str:
+        """HGVS genomic identifier used as the MyVariant.info variant id"""
+        return f"chr{str(chrom).replace('chr', '')}:g.{pos}{ref}>{alt}"
         
     def annotate_variant(self, chrom: str, pos: int, ref: str, alt: str) -> Optional[Dict]:
         """
@@ -45,24 +106,30 @@ class VariantAnnotator:
             return None  # Fallback to local annotations in annotate.py
         
         # Build HGVS identifier for API query
-        hgvs_id = f"chr{chrom}:g.{pos}{ref}>{alt}"
+        hgvs_id = self.hgvs_id(chrom, pos, ref, alt)
         
         # Check cache first
-        if hgvs_id in self.cache:
+        cached = self.cache.get(hgvs_id)
+        if cached is not MISSING:
             logger.debug(f"Cache hit for {hgvs_id}")
-            return self.cache[hgvs_id]
+            return cached
         
+        return self._inflight.do(hgvs_id, lambda: self._fetch_variant(hgvs_id))
+    
+    def _fetch_variant(self, hgvs_id: str) -> Optional[Dict]:
+        """Query the API for one variant and cache the answer"""
         try:
             logger.info(f"Querying MyVariant.info API for {hgvs_id}")
             
             # Query MyVariant.info API
             url = f"{self.api_base_url}/variant/{hgvs_id}"
             params = {
-                'fields': 'clinvar,dbsnp,cadd,dbnsfp.genename,dbnsfp.clinvar',
+                'fields': ANNOTATION_FIELDS,
                 'assembly': 'hg38'
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            self.rate_limiter.acquire()
+            response = self.session.get(url, params=params, timeout=self.timeout)
             
             if response.status_code == 200:
                 data = response.json()
@@ -71,12 +138,13 @@ class VariantAnnotator:
                 annotation = self._parse_myvariant_response(data)
                 
                 # Cache the result
-                self.cache[hgvs_id] = annotation
-                
-                # Rate limiting: be nice to the API
-                time.sleep(0.1)
+                self.cache.set(hgvs_id, annotation)
                 
                 return annotation
+            elif response.status_code == 404:
+                # Unknown variant: cache the miss so it is not looked up again
+                self.cache.set(hgvs_id, None)
+                return None
             else:
                 logger.warning(f"API returned status {response.status_code}")
                 return None
@@ -143,6 +211,10 @@ class VariantAnnotator:
         """
         Annotate multiple variants efficiently
         
+        Variants are sent to the batch endpoint in chunks of `batch_size`
+        ids, with up to `max_concurrency` requests in flight. Call
+        batch_annotate_async() instead from code already running an event loop.
+        
         Args:
             variants: List of variant dictionaries with chrom, pos, ref, alt
             
@@ -153,23 +225,169 @@ class VariantAnnotator:
             logger.info("Batch annotation using local database")
             return variants
         
-        logger.info(f"Batch annotating {len(variants)} variants via API")
+        return asyncio.run(self.batch_annotate_async(variants))
+    
+    async def batch_annotate_async(self, variants: List[Dict]) -> List[Dict]:
+        """Asyncio version of batch_annotate()"""
+        if not self.use_api:
+            return variants
+        
+        ids = [self.hgvs_id(v['chrom'], v['pos'], v['ref'], v['alt']) for v in variants]
+        annotations = await asyncio.to_thread(self.cache.get_many, ids)
+        missing = [i for i in dict.fromkeys(ids) if i not in annotations]
+        logger.info(f"Batch annotating {len(variants)} variants via API "
+                    f"({len(ids) - len(missing)} cached, {len(missing)} to fetch or join)")
+        
+        # Ids another request is already fetching are awaited instead of re-requested
+        owned, waiting = self._inflight.claim(missing)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def fetch_chunk(chunk):
+            try:
+                fetched = await self._fetch_batch(chunk, semaphore)
+                await asyncio.to_thread(self.cache.set_many, fetched)
+            except BaseException as e:
+                self._inflight.fail(chunk, e)
+                raise
+            annotations.update(fetched)
+            # Ids the API failed to answer are released as None (not cached)
+            self._inflight.resolve({hgvs_id: fetched.get(hgvs_id) for hgvs_id in chunk})
+        
+        chunks = [owned[i:i + self.batch_size] for i in range(0, len(owned), self.batch_size)]
+        await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        
+        if waiting:
+            shared = await asyncio.gather(*(SingleFlight.wrap(f) for f in waiting.values()),
+                                          return_exceptions=True)
+            for hgvs_id, annotation in zip(waiting, shared):
+                if not isinstance(annotation, BaseException):
+                    annotations[hgvs_id] = annotation
         
         annotated_variants = []
-        for variant in variants:
-            annotation = self.annotate_variant(
-                variant['chrom'],
-                variant['pos'],
-                variant['ref'],
-                variant['alt']
-            )
-            
+        for variant, hgvs_id in zip(variants, ids):
+            annotation = annotations.get(hgvs_id)
             if annotation:
                 variant.update(annotation)
-            
             annotated_variants.append(variant)
         
         return annotated_variants
+    
+    async def _fetch_batch(self, ids: List[str], semaphore: asyncio.Semaphore) -> Dict[str, Dict]:
+        """POST one chunk of ids, retrying with exponential backoff"""
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                delay = self.backoff * (2 ** attempt)
+                try:
+                    await self.rate_limiter.acquire_async()
+                    response = await asyncio.to_thread(self._post_batch, ids)
+                    if response.status_code == 200:
+                        try:
+                            return self._parse_batch_response(response.json())
+                        except (ValueError, TypeError, KeyError, AttributeError) as e:
+                            # Not JSON, or not the expected list of hits: retrying will not
+                            # help, so leave the batch unresolved (and uncached)
+                            logger.warning(f"Batch API returned an unusable response: {e}")
+                            return {}
+                    if response.status_code not in RETRY_STATUS:
+                        logger.warning(f"Batch API returned status {response.status_code}")
+                        return {}
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    logger.warning(f"Batch API returned status {response.status_code} "
+                                   f"(attempt {attempt + 1}/{self.max_retries + 1})")
+                except requests.exceptions.RequestException as e:
+                    logger.warning(f"Batch API request failed: {e} "
+                                   f"(attempt {attempt + 1}/{self.max_retries + 1})")
+                
+                if attempt < self.max_retries:
+                    await asyncio.sleep(delay)
+        
+        logger.error(f"Giving up on a batch of {len(ids)} variants after {self.max_retries + 1} attempts")
+        return {}
+    
+    def _post_batch(self, ids: List[str]) -> requests.Response:
+        return self.session.post(
+            f"{self.api_base_url}/variant",
+            data={'ids': ','.join(ids), 'fields': ANNOTATION_FIELDS, 'assembly': 'hg38'},
+            timeout=self.timeout,
+        )
+    
+    def _parse_batch_response(self, data: List[Dict]) -> Dict[str, Optional[Dict]]:
+        """Map each queried id to its parsed annotation, or None when it was not found"""
+        found = {}
+        for hit in data:
+            if 'query' not in hit:
+                continue
+            # Multiple hits for one id come back as separate entries; keep the first
+            if hit['query'] not in found:
+                found[hit['query']] = None if hit.get('notfound') else self._parse_myvariant_response(hit)
+        return found
+
+
+    def annotate_frame(self, df, mask):
+        """
+        Annotate the rows of a pipeline variant frame selected by `mask`
+        through the batch API and merge the results back in.
+        
+        Only single-nucleotide variants are sent: the chr:g.POSREF>ALT id
+        is not valid HGVS for indels or multi-allelic sites. ClinVar
+        classifications replace PATHOGENICITY and DISEASE_RISK, conditions
+        replace CLINICAL_SIG, and GENE is filled where it is empty.
+        
+        Returns:
+            (annotated frame, number of variants the API had annotations for)
+        """
+        ref = df['REF'].astype(str).to_numpy()
+        alt = df['ALT'].astype(str).to_numpy()
+        snv = np.isin(ref, list('ACGT')) & np.isin(alt, list('ACGT'))
+        rows = np.nonzero(np.asarray(mask) & snv)[0]
+        if not self.use_api or not len(rows):
+            return df, 0
+        
+        chrom = df['CHROM'].astype(str).to_numpy()[rows]
+        pos = df['POS'].to_numpy()[rows]
+        variants = [{'chrom': c, 'pos': int(p), 'ref': r, 'alt': a}
+                    for c, p, r, a in zip(chrom, pos, ref[rows], alt[rows])]
+        annotated = self.batch_annotate(variants)
+        
+        # column -> {label: code}, and column -> (row positions, label codes) in row order
+        labels = {'PATHOGENICITY': {label: code for code, label in enumerate(PATHOGENICITY_LEVELS)},
+                  'DISEASE_RISK': {label: code for code, label in enumerate(RISK_LEVELS)},
+                  'CLINICAL_SIG': {}, 'GENE': {}}
+        updates = {column: ([], []) for column in labels}
+        
+        def assign(column, row, value):
+            updates[column][0].append(row)
+            updates[column][1].append(labels[column].setdefault(value, len(labels[column])))
+        
+        current_gene = df['GENE'].astype(object).fillna('').to_numpy()
+        found = 0
+        for row, variant in zip(rows, annotated):
+            if 'clinical_significance' not in variant:
+                continue
+            found += 1
+            pathogenicity, risk = classify_significance(variant['clinical_significance'])
+            if pathogenicity:
+                assign('PATHOGENICITY', row, pathogenicity)
+                assign('DISEASE_RISK', row, risk)
+            if variant['disease']:
+                assign('CLINICAL_SIG', row, ', '.join(dict.fromkeys(variant['disease'])))
+            gene = variant['gene']
+            if isinstance(gene, list):
+                gene = ','.join(dict.fromkeys(gene))
+            if gene and current_gene[row] == '':
+                assign('GENE', row, gene)
+        
+        if found:
+            df = df.copy()
+            for column, (positions, codes) in updates.items():
+                update_mask = np.zeros(len(df), dtype=bool)
+                update_mask[positions] = True
+                df[column] = overlay_categorical(df[column], update_mask,
+                                                 np.asarray(codes, dtype=np.int64), list(labels[column]))
+        
+        return df, found
 
 
 # Example usage and testing
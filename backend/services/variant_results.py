@@ -0,0 +1,289 @@
+"""
+Per-Variant Results
+Every annotated variant of an analysis, stored outside the analysis document
+in compressed columnar chunks and read back one page at a time
+"""
+
+import json
+import os
+import re
+import shutil
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pc = pq = None
+
+DEFAULT_RESULTS_DIR = "data/results"
+MANIFEST = "manifest.json"
+COMPRESSION = "zstd"
+# Rows per chunk file, and per row group: the unit a page read skips or loads
+CHUNK_ROWS = 250_000
+ROW_GROUP_ROWS = 10_000
+DEFAULT_PAGE_SIZE = 100
+# Annotated table columns a stored variant is built from
+ANNOTATED_COLUMNS = ['CHROM', 'POS', 'REF', 'ALT', 'QUAL', 'GENE', 'DISEASE_RISK', 'PATHOGENICITY', 'CLINICAL_SIG']
+# Columns with few distinct values, listed per chunk so filtered reads can skip chunks
+FILTER_COLUMNS = ('gene', 'disease_risk', 'pathogenicity')
+# A variant overlapping several genes stores them joined ("BRCA1,TP53");
+# the gene filter matches each of them
+GENE_SEPARATOR = ','
+
+SCHEMA = pa.schema([
+    ('row', pa.int64()),
+    ('chrom', pa.string()),
+    ('pos', pa.int64()),
+    ('ref', pa.string()),
+    ('alt', pa.string()),
+    ('qual', pa.float64()),
+    ('gene', pa.string()),
+    ('disease_risk', pa.string()),
+    ('pathogenicity', pa.string()),
+    ('clinical_significance', pa.string()),
+]) if pa is not None else None
+
+
+def _text(column: pd.Series) -> pd.Series:
+    """String column with missing and empty values as None"""
+    values = column.astype(object)
+    return values.where(values.notna() & (values != ''), None)
+
+
+def _variant_frame(df: pd.DataFrame, first_row: int) -> pd.DataFrame:
+    """Annotated variant batch in the API's Variant field names, numbered from first_row"""
+    return pd.DataFrame({
+        'row': np.arange(first_row, first_row + len(df), dtype=np.int64),
+        'chrom': df['CHROM'].astype(str).to_numpy(),
+        'pos': df['POS'].to_numpy(dtype=np.int64),
+        'ref': df['REF'].astype(str).to_numpy(),
+        'alt': df['ALT'].astype(str).to_numpy(),
+        'qual': df['QUAL'].to_numpy(dtype=np.float64, na_value=np.nan),
+        'gene': _text(df['GENE']).to_numpy(),
+        'disease_risk': df['DISEASE_RISK'].astype(str).str.lower().to_numpy(),
+        'pathogenicity': _text(df['PATHOGENICITY']).to_numpy(),
+        'clinical_significance': _text(df['CLINICAL_SIG']).to_numpy(),
+    })
+
+
+def _split_genes(values) -> set:
+    """Individual gene symbols in a set of (possibly joined) GENE values"""
+    return {gene for value in values for gene in value.split(GENE_SEPARATOR) if gene}
+
+
+class VariantResultWriter:
+    """
+    Appends annotated variant batches to an analysis's result chunks.
+
+    Chunks are written to a temporary directory that replaces the
+    analysis's results on commit(), so readers never see a partial set.
+    Works as a stream_vcf() sink.
+    """
+
+    def __init__(self, directory: str, chunk_rows: int = CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._temp = os.path.join(os.path.dirname(directory),
+                                  f".{os.path.basename(directory)}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(self._temp)
+        self._chunks: List[Dict] = []
+        self._writer = None
+
+    def write(self, df: pd.DataFrame):
+        start = 0
+        while start < len(df):
+            if self._writer is None or self._chunks[-1]['rows'] >= self.chunk_rows:
+                self._open_chunk()
+            chunk = self._chunks[-1]
+            piece = df.iloc[start:start + self.chunk_rows - chunk['rows']]
+            frame = _variant_frame(piece, self.rows)
+            self._writer.write_table(pa.Table.from_pandas(frame, schema=SCHEMA, preserve_index=False),
+                                     row_group_size=ROW_GROUP_ROWS)
+            for column in FILTER_COLUMNS:
+                chunk['values'][column].update(value for value in frame[column].unique() if isinstance(value, str))
+            chunk['rows'] += len(frame)
+            chunk['last_row'] = self.rows + len(frame) - 1
+            self.rows += len(frame)
+            start += len(piece)
+
+    def commit(self) -> int:
+        """Publish the chunks as the analysis's results; returns the variant count"""
+        self._close_chunk()
+        manifest = {
+            'rows': self.rows,
+            'chunks': [dict(chunk, values={column: sorted(_split_genes(values) if column == 'gene' else values)
+                                           for column, values in chunk['values'].items()})
+                       for chunk in self._chunks],
+        }
+        with open(os.path.join(self._temp, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        # A directory cannot be renamed over a non-empty one
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.rename(self._temp, self.directory)
+        return self.rows
+
+    def abort(self):
+        self._close_chunk()
+        shutil.rmtree(self._temp, ignore_errors=True)
+
+    def _open_chunk(self):
+        self._close_chunk()
+        name = f"part-{len(self._chunks):05d}.parquet"
+        self._writer = pq.ParquetWriter(os.path.join(self._temp, name), SCHEMA, compression=COMPRESSION)
+        self._chunks.append({'file': name, 'first_row': self.rows, 'last_row': self.rows - 1, 'rows': 0,
+                             'values': {column: set() for column in FILTER_COLUMNS}})
+
+    def _close_chunk(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class VariantResultStore:
+    """
+    Per-variant results under {directory}/{analysis_id}/: Parquet chunks of
+    at most CHUNK_ROWS variants in file order, plus a manifest with each
+    chunk's row range and the genes, risks and pathogenicities it contains.
+
+    Pages use keyset pagination on the variant's row number: a page after
+    row N only opens the chunks and row groups that can hold rows past N
+    matching the filters, however deep into the file it is.
+    """
+
+    def __init__(self, directory: str = DEFAULT_RESULTS_DIR):
+        self.directory = str(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def available(self) -> bool:
+        """Whether results can be stored (needs pyarrow)"""
+        return pq is not None
+
+    def path(self, analysis_id: str) -> str:
+        return os.path.join(self.directory, analysis_id)
+
+    def writer(self, analysis_id: str) -> VariantResultWriter:
+        return VariantResultWriter(self.path(analysis_id))
+
+    def manifest(self, analysis_id: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path(analysis_id), MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable variant results for {analysis_id}: {e}")
+            return None
+
+    def files(self, analysis_id: str) -> List[str]:
+        directory = self.path(analysis_id)
+        try:
+            return [os.path.join(directory, name) for name in os.listdir(directory)]
+        except FileNotFoundError:
+            return []
+
+    def analysis_ids(self) -> List[str]:
+        """Analyses with stored results (temporary directories included, as .{id}.*.tmp)"""
+        return [name for name in os.listdir(self.directory)
+                if os.path.isdir(os.path.join(self.directory, name))]
+
+    def link(self, source_id: str, analysis_id: str) -> bool:
+        """
+        Give `analysis_id` the results stored for `source_id` (hard links,
+        so no extra space); returns False if the source has none
+        """
+        if self.manifest(source_id) is None:
+            return False
+        temp = os.path.join(self.directory, f".{analysis_id}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.makedirs(temp)
+            for path in self.files(source_id):
+                target = os.path.join(temp, os.path.basename(path))
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+            os.rename(temp, self.path(analysis_id))
+            return True
+        except OSError as e:
+            logger.warning(f"Could not copy variant results of {source_id}: {e}")
+            shutil.rmtree(temp, ignore_errors=True)
+            return False
+
+    def remove(self, analysis_id: str):
+        shutil.rmtree(self.path(analysis_id), ignore_errors=True)
+
+    def page(self, analysis_id: str, after: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+             gene: Optional[Sequence[str]] = None, disease_risk: Optional[Sequence[str]] = None,
+             pathogenicity: Optional[Sequence[str]] = None) -> Optional[Tuple[List[Dict], Optional[int], int]]:
+        """
+        Variants after row `after` (from the start if None) matching every
+        given filter (any of the values listed per filter). A variant in
+        several genes matches a gene filter naming any one of them.
+
+        Returns:
+            (variants, cursor for the next page or None, total variants), or
+            None if the analysis has no stored results
+        """
+        manifest = self.manifest(analysis_id)
+        if manifest is None:
+            return None
+        filters = {column: list(values) for column, values
+                   in (('gene', gene), ('disease_risk', disease_risk), ('pathogenicity', pathogenicity))
+                   if values}
+
+        variants: List[Dict] = []
+        for chunk in manifest['chunks']:
+            if after is not None and chunk['last_row'] <= after:
+                continue
+            # Manifests written before genes were split list them joined
+            chunk_values = dict(chunk['values'], gene=_split_genes(chunk['values']['gene']))
+            if any(not set(values) & set(chunk_values[column]) for column, values in filters.items()):
+                continue
+            variants += self._read_chunk(analysis_id, chunk['file'], after, filters, limit + 1 - len(variants))
+            if len(variants) > limit:
+                break
+
+        cursor = variants[limit - 1]['row'] if len(variants) > limit else None
+        variants = variants[:limit]
+        for variant in variants:
+            del variant['row']
+        return variants, cursor, manifest['rows']
+
+    def _read_chunk(self, analysis_id: str, name: str, after: Optional[int],
+                    filters: Dict[str, List[str]], needed: int) -> List[Dict]:
+        parquet = pq.ParquetFile(os.path.join(self.path(analysis_id), name))
+        row_column = parquet.schema_arrow.get_field_index('row')
+        rows = []
+        for group in range(parquet.num_row_groups):
+            statistics = parquet.metadata.row_group(group).column(row_column).statistics
+            if after is not None and statistics is not None and statistics.has_min_max \
+                    and statistics.max <= after:
+                continue
+            table = parquet.read_row_group(group)
+            mask = None
+            if after is not None:
+                mask = pc.greater(table['row'], after)
+            for column, values in filters.items():
+                if column == 'gene':
+                    genes = "|".join(re.escape(gene) for gene in values)
+                    matches = pc.fill_null(pc.match_substring_regex(
+                        table[column], f"(^|{GENE_SEPARATOR})({genes})({GENE_SEPARATOR}|$)"), False)
+                else:
+                    matches = pc.is_in(table[column], value_set=pa.array(values, pa.string()))
+                mask = matches if mask is None else pc.and_(mask, matches)
+            if mask is not None:
+                table = table.filter(mask)
+            rows += table.slice(0, needed - len(rows)).to_pylist()
+            if len(rows) >= needed:
+                break
+        return rows
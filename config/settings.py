@@ -16,9 +16,64 @@ class Settings(BaseSettings):
     # File Storage
     UPLOAD_DIR: str = "data/uploads"
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
+    # Reuse results for re-uploads of identical files (same annotation DB and model)
+    RESULT_CACHE_ENABLED: bool = True
+    # Per-variant results (compressed Parquet chunks), kept for the life of the analysis
+    RESULTS_DIR: str = "data/results"
+    # Bytes uploads and pipeline intermediates may occupy before the oldest
+    # ones not in use are evicted (0 = unlimited), and how old a file must be
+    # before it is evicted or removed as an orphan
+    STORAGE_BUDGET_BYTES: int = 0
+    RETENTION_GRACE_SECONDS: int = 600
     
     # ML Models
     MODEL_DIR: str = "models"
+    # XGBoost prediction threads (0 = library default)
+    MODEL_THREADS: int = 0
+    # Compiled gene annotation database (scripts/gene_db.py); built-in table if unset
+    GENE_DB_PATH: Optional[str] = None
+    # Compiled exact-match variant store (scripts/variant_store.py); disabled if unset
+    VARIANT_STORE_PATH: Optional[str] = None
+    
+    # Pipeline
+    # Only parse variants inside annotated disease gene regions (uses tabix/CSI
+    # indexes for BGZF uploads, building one next to the upload if missing)
+    REGION_RESTRICTED_PARSING: bool = False
+    # Processes for parallel parsing of large plain-text VCFs (0 = all cores),
+    # divided between the PIPELINE_WORKERS: with the defaults each analysis
+    # parses in its own process, while e.g. PIPELINE_WORKERS=2 on 16 cores
+    # gives each of the two analyses 8 parsing processes
+    PARSE_WORKERS: int = 0
+    # VCF parse mode: "mmap" (memory-mapped byte scanning) or "text"
+    PARSE_MODE: str = "mmap"
+    # Format of the tables passed between pipeline stages: parquet, arrow or csv
+    INTERMEDIATE_FORMAT: str = "parquet"
+    # "staged" writes a table between each stage; "streaming" parses, annotates
+    # and featurizes in a single pass with no intermediate files
+    PIPELINE_MODE: str = "staged"
+    # Most significant variants kept for display (streaming mode)
+    TOP_VARIANTS: int = 50
+    # Worker processes running analyses (0 = all cores) and how many analyses
+    # may be queued or running before uploads are turned away with 503
+    PIPELINE_WORKERS: int = 0
+    PIPELINE_QUEUE_SIZE: int = 32
+    # Per-analysis stage checkpoints, and how long an analysis owned by an API
+    # process on another host may stay "processing" before it is resumed here
+    CHECKPOINT_DIR: str = "data/checkpoints"
+    ANALYSIS_STALL_TIMEOUT: int = 6 * 3600
+    
+    # Variant annotation
+    # "local" (gene index + variant store) or "hybrid" (local first, then
+    # MyVariant.info for the variants left unresolved)
+    ANNOTATION_MODE: str = "local"
+    MYVARIANT_URL: str = "https://myvariant.info/v1"
+    ANNOTATION_CONCURRENCY: int = 4
+    ANNOTATION_CACHE_PATH: str = "data/cache/annotations.sqlite"
+    ANNOTATION_CACHE_TTL: int = 30 * 24 * 3600
+    ANNOTATION_CACHE_MAX_ENTRIES: int = 1_000_000
+    # Requests per second (and burst) shared by all annotator processes
+    ANNOTATION_RATE_LIMIT: float = 10.0
+    ANNOTATION_RATE_BURST: int = 10
     
     # Logging
     LOG_LEVEL: str = "INFO"
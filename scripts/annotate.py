@@ -1,5 +1,14 @@
 import pandas as pd
+import numpy as np
 import os
+import sys
+import json
+import hashlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.intermediate import read_table, write_table
 
 # Comprehensive disease variant database (simulated ClinVar/dbSNP annotations)
 # Maps chromosome regions to known disease genes
@@ -99,47 +108,267 @@ DISEASE_VARIANTS = {
     'FMR1': {'chrom': 'X', 'pos_range': (147910000, 147950000), 'genes': ['FMR1'], 'diseases': ['Fragile X Syndrome'], 'risk': 'High'},
 }
 
-def annotate_variants(input_file, output_file):
-    """Annotate variants with disease associations"""
-    df = pd.read_csv(input_file)
-    
-    # Add annotation columns
-    df['GENE'] = ''
-    df['DISEASE_RISK'] = 'Low'
-    df['PATHOGENICITY'] = 'Benign'
-    df['CLINICAL_SIG'] = 'Unknown'
-    
-    annotated_count = 0
-    
-    for idx, row in df.iterrows():
-        chrom = str(row['CHROM']).replace('chr', '')  # Normalize chromosome format
-        pos = int(row['POS']) if 'POS' in row and pd.notna(row['POS']) else 0
-        
-        # Position-based annotation with quality filter
-        if row.get('QUAL') and row['QUAL'] > 20:  # Quality threshold
-            for variant_name, info in DISEASE_VARIANTS.items():
-                if chrom == info['chrom']:
-                    # Check if position falls within gene range
-                    if 'pos_range' in info:
-                        start, end = info['pos_range']
-                        if start <= pos <= end:
-                            df.at[idx, 'GENE'] = info['genes'][0]
-                            df.at[idx, 'DISEASE_RISK'] = info['risk']
-                            df.at[idx, 'PATHOGENICITY'] = 'Pathogenic' if info['risk'] == 'High' else 'Likely Pathogenic'
-                            df.at[idx, 'CLINICAL_SIG'] = ', '.join(info['diseases'])
-                            annotated_count += 1
-                            break
-                    else:
-                        # Fallback for variants without position range (chromosome match only)
-                        df.at[idx, 'GENE'] = info['genes'][0]
-                        df.at[idx, 'DISEASE_RISK'] = info.get('risk', 'Medium')
-                        df.at[idx, 'PATHOGENICITY'] = 'Likely Pathogenic'
-                        df.at[idx, 'CLINICAL_SIG'] = ', '.join(info['diseases'])
-                        annotated_count += 1
-                        break
-    
-    df.to_csv(output_file, index=False)
-    print(f"Annotated {len(df)} variants ({annotated_count} matched disease genes)")
+# Upper bound used for entries that match a whole chromosome
+MAX_CHROM_POS = 2 ** 29 - 1
+
+# Chromosomes are laid out back to back in one int64 coordinate space
+CHROM_STRIDE = 1 << 32
+
+# Only variants above this quality score are annotated
+MIN_QUALITY = 20
+
+RISK_LEVELS = ['Low', 'Medium', 'High']
+PATHOGENICITY_LEVELS = ['Benign', 'Likely Pathogenic', 'Pathogenic']
+
+def disease_entries(variants=DISEASE_VARIANTS):
+    """Flatten a DISEASE_VARIANTS-style table into gene interval entries"""
+    entries = []
+    for info in variants.values():
+        if 'pos_range' in info:
+            start, end = info['pos_range']
+            pathogenicity = 'Pathogenic' if info['risk'] == 'High' else 'Likely Pathogenic'
+        else:
+            # Fallback for variants without position range (chromosome match only)
+            start, end = 1, MAX_CHROM_POS
+            pathogenicity = 'Likely Pathogenic'
+        entries.append({
+            'chrom': info['chrom'],
+            'start': start,
+            'end': end,
+            'gene': info['genes'][0],
+            'diseases': info['diseases'],
+            'risk': info.get('risk', 'Medium'),
+            'pathogenicity': pathogenicity,
+        })
+    return entries
+
+class GeneIndex:
+    """
+    Precompiled interval index over gene regions.
+
+    All chromosomes share one int64 coordinate axis (chrom_code * CHROM_STRIDE
+    + pos). Gene intervals are cut into elementary segments at every start
+    and end, and each segment points at the combination of genes covering
+    it, so annotating N variants is a single np.searchsorted over the
+    segment boundaries -- and overlapping genes are all reported.
+    """
+
+    # Arrays persisted by save() and memory-mapped by load()
+    ARRAYS = ('boundaries', 'segment_combos', 'combo_gene', 'combo_sig', 'combo_risk', 'combo_pathogenicity')
+
+    def __init__(self, chroms, boundaries, segment_combos, combo_gene, combo_sig,
+                 combo_risk, combo_pathogenicity, gene_labels, sig_labels, version=None):
+        self.version = version
+        self.chroms = list(chroms)
+        self.chrom_codes = {chrom: code for code, chrom in enumerate(self.chroms)}
+        self.boundaries = boundaries              # int64, sorted segment starts
+        self.segment_combos = segment_combos      # int32 combo id per segment (0 = no gene)
+        self.combo_gene = combo_gene              # int32 index into gene_labels
+        self.combo_sig = combo_sig                # int32 index into sig_labels
+        self.combo_risk = combo_risk              # int8 index into RISK_LEVELS
+        self.combo_pathogenicity = combo_pathogenicity  # int8 index into PATHOGENICITY_LEVELS
+        self.gene_labels = gene_labels
+        self.sig_labels = sig_labels
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Compile gene interval entries (see disease_entries) into an index"""
+        chroms = sorted({e['chrom'] for e in entries}, key=_chrom_sort_key)
+        chrom_codes = {chrom: code for code, chrom in enumerate(chroms)}
+
+        # Sweep over start / end events to find the active genes per segment
+        events = {}
+        for i, e in enumerate(entries):
+            base = chrom_codes[e['chrom']] * CHROM_STRIDE
+            events.setdefault(base + e['start'], []).append((1, i))
+            events.setdefault(base + e['end'] + 1, []).append((-1, i))
+
+        combos = {(): 0}
+        boundaries, segment_combos = [0], [0]
+        active = set()
+        for key in sorted(events):
+            for kind, i in events[key]:
+                if kind > 0:
+                    active.add(i)
+                else:
+                    active.discard(i)
+            combo = combos.setdefault(tuple(sorted(active)), len(combos))
+            if combo != segment_combos[-1]:
+                boundaries.append(key)
+                segment_combos.append(combo)
+
+        gene_labels, sig_labels = [''], ['Unknown']
+        gene_codes, sig_codes = {'': 0}, {'Unknown': 0}
+        combo_gene, combo_sig, combo_risk, combo_pathogenicity = [], [], [], []
+        for members in combos:  # dicts preserve insertion order, i.e. combo id order
+            if not members:
+                combo_gene.append(0)
+                combo_sig.append(0)
+                combo_risk.append(RISK_LEVELS.index('Low'))
+                combo_pathogenicity.append(PATHOGENICITY_LEVELS.index('Benign'))
+                continue
+            hits = sorted((entries[i] for i in members), key=lambda e: e['start'])
+            gene = ','.join(dict.fromkeys(e['gene'] for e in hits))
+            sig = ', '.join(dict.fromkeys(d for e in hits for d in e['diseases'])) or 'Unknown'
+            combo_gene.append(gene_codes.setdefault(gene, len(gene_codes)))
+            combo_sig.append(sig_codes.setdefault(sig, len(sig_codes)))
+            combo_risk.append(max(RISK_LEVELS.index(e['risk']) for e in hits))
+            combo_pathogenicity.append(max(PATHOGENICITY_LEVELS.index(e['pathogenicity']) for e in hits))
+        gene_labels = list(gene_codes)
+        sig_labels = list(sig_codes)
+
+        return cls(
+            chroms,
+            np.array(boundaries, dtype=np.int64),
+            np.array(segment_combos, dtype=np.int32),
+            np.array(combo_gene, dtype=np.int32),
+            np.array(combo_sig, dtype=np.int32),
+            np.array(combo_risk, dtype=np.int8),
+            np.array(combo_pathogenicity, dtype=np.int8),
+            np.array(gene_labels, dtype=object),
+            np.array(sig_labels, dtype=object),
+            version=hashlib.sha256(json.dumps(entries, sort_keys=True).encode()).hexdigest()[:16],
+        )
+
+    def save(self, directory):
+        """Write the index as .npy files (plus meta.json) that load() can memory-map"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        # Labels are stored as fixed-width unicode so no pickling is involved
+        np.save(os.path.join(directory, 'gene_labels.npy'), self.gene_labels.astype(str))
+        np.save(os.path.join(directory, 'sig_labels.npy'), self.sig_labels.astype(str))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'format': 1, 'version': self.version, 'chroms': self.chroms}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load an index written by save(); large arrays are memory-mapped by default"""
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS]
+        labels = [np.load(os.path.join(directory, f'{name}.npy')).astype(object)
+                  for name in ('gene_labels', 'sig_labels')]
+        return cls(meta['chroms'], *arrays, *labels, version=meta['version'])
+
+    def regions(self):
+        """Covered ranges as (chrom, start, end) tuples, 1-based inclusive"""
+        covered = np.nonzero(np.asarray(self.segment_combos) != 0)[0]
+        starts = np.asarray(self.boundaries)[covered]
+        ends = np.asarray(self.boundaries)[covered + 1] - 1
+        return [(self.chroms[start // CHROM_STRIDE], int(start % CHROM_STRIDE), int(end % CHROM_STRIDE))
+                for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def lookup(self, chrom, pos):
+        """
+        Combo ids (0 = no overlapping gene) for arrays of chromosomes and positions.
+
+        `chrom` may hold raw names ('chr17', 17, '17'); they are normalized
+        once per distinct value rather than once per variant.
+        """
+        chrom = pd.Categorical(chrom)
+        # One extra slot so missing chromosomes (code -1) map to "unknown"
+        category_codes = np.array(
+            [self.chrom_codes.get(str(c).replace('chr', ''), -1) for c in chrom.categories] + [-1],
+            dtype=np.int64,
+        )
+        chrom_codes = category_codes[chrom.codes]
+
+        keys = chrom_codes * CHROM_STRIDE + np.asarray(pos, dtype=np.int64)
+        segments = np.searchsorted(self.boundaries, keys, side='right') - 1
+        combos = self.segment_combos[np.maximum(segments, 0)]
+        combos[chrom_codes < 0] = 0
+        return combos
+
+    def annotate(self, df):
+        """
+        Add GENE, DISEASE_RISK, PATHOGENICITY and CLINICAL_SIG columns to a
+        variant frame. Variants at or below MIN_QUALITY are left unannotated.
+
+        Returns:
+            (annotated frame, number of variants matched to a gene)
+        """
+        pos = df['POS'].fillna(0).to_numpy(dtype=np.int64)
+        combos = self.lookup(df['CHROM'], pos)
+        combos[~passes_quality(df)] = 0
+
+        df = df.copy()
+        df['GENE'] = pd.Categorical.from_codes(self.combo_gene[combos], self.gene_labels)
+        df['DISEASE_RISK'] = pd.Categorical.from_codes(self.combo_risk[combos], RISK_LEVELS)
+        df['PATHOGENICITY'] = pd.Categorical.from_codes(self.combo_pathogenicity[combos], PATHOGENICITY_LEVELS)
+        df['CLINICAL_SIG'] = pd.Categorical.from_codes(self.combo_sig[combos], self.sig_labels)
+        return df, int(np.count_nonzero(combos))
+
+def passes_quality(df):
+    """Boolean mask of variants above MIN_QUALITY (none if there is no QUAL column)"""
+    if 'QUAL' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return df['QUAL'].to_numpy(dtype=np.float64) > MIN_QUALITY
+
+def overlay_categorical(column, mask, codes, labels):
+    """Categorical `column` with rows in `mask` replaced by labels[codes]"""
+    column = column if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+    if not mask.any():
+        return column
+
+    used = np.unique(codes)
+    values = [labels[i] for i in used]
+    known = set(column.cat.categories)
+    column = column.cat.add_categories(list(dict.fromkeys(v for v in values if v not in known)))
+
+    remap = np.full(len(labels), -1, dtype=np.int32)
+    remap[used] = column.cat.categories.get_indexer(values)
+    out = column.cat.codes.to_numpy().astype(np.int32)
+    out[mask] = remap[codes]
+    return pd.Categorical.from_codes(out, column.cat.categories)
+
+def _chrom_sort_key(chrom):
+    return (0, int(chrom), '') if chrom.isdigit() else (1, 0, chrom)
+
+# Built once at import; every annotate call reuses it
+GENE_INDEX = GeneIndex.from_entries(disease_entries())
+
+def annotate_frame(df, index=None, store=None, remote=None):
+    """
+    Annotate a variant table or record batch in memory (see annotate_variants).
+
+    Returns:
+        (annotated df, {'genes', 'store', 'remote', 'unresolved'} match counts)
+    """
+    df, annotated_count = (index or GENE_INDEX).annotate(df)
+    counts = {'genes': annotated_count, 'store': 0, 'remote': 0, 'unresolved': 0}
+    resolved = (df['GENE'] != '').to_numpy(copy=True)
+    if store is not None:
+        rows = store.lookup(df['CHROM'], df['POS'], df['REF'], df['ALT'])
+        df, counts['store'] = store.annotate(df, rows=rows)
+        resolved |= rows >= 0
+    if remote is not None:
+        unresolved = passes_quality(df) & ~resolved
+        df, counts['remote'] = remote.annotate_frame(df, unresolved)
+        counts['unresolved'] = int(unresolved.sum())
+    return df, counts
+
+def annotate_variants(input_file, output_file, index=None, store=None, remote=None):
+    """
+    Annotate variants with disease associations (CSV, Parquet or Arrow in and out).
+
+    `store` is an optional VariantStore (scripts/variant_store.py) whose
+    exact chrom:pos:ref>alt records override the gene-level annotation.
+    `remote` is an optional annotator with an annotate_frame(df, mask)
+    method; it only receives the variants that neither the gene index nor
+    the store could resolve.
+    """
+    df = read_table(input_file)
+    df, counts = annotate_frame(df, index=index, store=store, remote=remote)
+
+    if store is not None:
+        print(f"Matched {counts['store']} variants in the variant knowledge store")
+    if remote is not None:
+        print(f"Resolved {counts['remote']} of {counts['unresolved']} remaining variants remotely")
+
+    write_table(output_file, df)
+    print(f"Annotated {len(df)} variants ({counts['genes']} matched disease genes)")
     return True
 
 if __name__ == "__main__":
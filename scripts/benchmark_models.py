@@ -0,0 +1,82 @@
+"""
+Micro-benchmark for the risk models.
+
+Compares the built-in SimpleRiskModel with the trained XGBoost booster
+(models/model.ubj from scripts/train.py): single-sample latency, as seen by
+one analysis, and batch throughput for a range of thread counts.
+
+Usage:
+    python scripts/benchmark_models.py [--model models/model.ubj] [--rows 100000] [--threads 1 2 4]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.predict import SimpleRiskModel
+from scripts.xgb_model import XGBoostRiskModel
+
+
+def synthetic_features(n, seed=0):
+    """Feature rows shaped like FeatureExtractor output"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.poisson(2, n), rng.poisson(5, n), rng.poisson(10, n), rng.poisson(1, n),
+        rng.normal(35, 10, n), rng.poisson(0.5, n), rng.poisson(0.3, n), rng.poisson(0.2, n),
+    ]).astype(np.float32)
+
+
+def time_latency(model, X, repeats):
+    """Per-call latency percentiles (microseconds) scoring one row at a time"""
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        model.score_batch(row)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, [50, 99]) * 1e6
+
+
+def time_throughput(model, X, repeats=3):
+    """Best-of-`repeats` rows per second scoring X in one call"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.score_batch(X)
+        best = min(best, time.perf_counter() - start)
+    return len(X) / best
+
+
+def run_benchmark(model_path, rows, threads, latency_repeats):
+    X = synthetic_features(rows)
+    models = [('rules', SimpleRiskModel())]
+    if os.path.exists(model_path):
+        models += [(f'xgboost nthread={n}', XGBoostRiskModel.load(model_path, nthread=n)) for n in threads]
+    else:
+        print(f"{model_path} not found (run scripts/train.py); benchmarking the rule model only")
+
+    print(f"{'model':<20} {'p50 us':>10} {'p99 us':>10} {'rows/s':>14}")
+    for name, model in models:
+        p50, p99 = time_latency(model, X, latency_repeats)
+        throughput = time_throughput(model, X)
+        print(f"{name:<20} {p50:>10.1f} {p99:>10.1f} {throughput:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark risk model latency and throughput")
+    parser.add_argument("--model", default="models/model.ubj", help="Native XGBoost model file")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows per throughput batch")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="XGBoost nthread values to compare")
+    parser.add_argument("--latency-repeats", type=int, default=2000, help="Single-row calls to time")
+    args = parser.parse_args()
+    run_benchmark(args.model, args.rows, sorted(set(args.threads)), args.latency_repeats)
+
+
+if __name__ == "__main__":
+    main()
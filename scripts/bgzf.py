@@ -0,0 +1,225 @@
+"""
+Compressed VCF input support.
+
+Plain gzip files are read with the standard library. BGZF files (the
+blocked gzip variant written by bgzip/htslib) are split into their
+independent deflate blocks, which are decompressed in parallel on a
+thread pool -- zlib releases the GIL, so decompression scales across cores.
+"""
+
+import gzip
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Fixed part of a BGZF block header: gzip magic, CM=8, FLG=FEXTRA
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+BGZF_HEADER = struct.Struct('<4sIBBHBBHH')  # up to and including BSIZE
+
+# Empty block that terminates every BGZF file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+# Uncompressed bytes per block, as written by bgzip
+MAX_BLOCK_DATA = 0xff00
+
+
+def _read_magic(path, size=4):
+    with open(path, 'rb') as f:
+        return f.read(size)
+
+
+def is_gzip(path):
+    """True if the file starts with the gzip magic bytes"""
+    return _read_magic(path, 2) == GZIP_MAGIC
+
+
+def is_bgzf(path):
+    """True if the file is BGZF (gzip blocks carrying a 'BC' extra subfield)"""
+    with open(path, 'rb') as f:
+        header = f.read(BGZF_HEADER.size)
+    if len(header) < BGZF_HEADER.size:
+        return False
+    magic, _mtime, _xfl, _os, xlen, si1, si2, slen, _bsize = BGZF_HEADER.unpack(header)
+    return magic == BGZF_MAGIC and xlen == 6 and (si1, si2, slen) == (66, 67, 2)
+
+
+def iter_bgzf_blocks(f):
+    """
+    Yield (compressed_offset, deflate_payload, uncompressed_size) for each
+    BGZF block of an open binary file, without decompressing anything.
+    """
+    while True:
+        offset = f.tell()
+        header = f.read(BGZF_HEADER.size)
+        if not header:
+            return
+        if len(header) < BGZF_HEADER.size:
+            raise ValueError(f"Truncated BGZF block header at offset {offset}")
+
+        magic, _mtime, _xfl, _os, xlen, si1, si2, slen, bsize = BGZF_HEADER.unpack(header)
+        if magic != BGZF_MAGIC or (si1, si2, slen) != (66, 67, 2):
+            raise ValueError(f"Invalid BGZF block at offset {offset}")
+
+        # Skip any extra subfields beyond BC, then read deflate data + CRC32/ISIZE
+        extra_rest = f.read(xlen - 6)
+        remaining = bsize + 1 - BGZF_HEADER.size - len(extra_rest)
+        body = f.read(remaining)
+        if len(body) < remaining:
+            raise ValueError(f"Truncated BGZF block at offset {offset}")
+
+        isize = struct.unpack('<I', body[-4:])[0]
+        yield offset, body[:-8], isize
+
+
+def inflate_block(payload):
+    """Decompress one raw deflate BGZF payload"""
+    return zlib.decompress(payload, -15)
+
+
+def deflate_block(data, level=6):
+    """Compress `data` into one complete BGZF block"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = compressor.compress(data) + compressor.flush()
+    header = BGZF_HEADER.pack(BGZF_MAGIC, 0, 0, 255, 6, 66, 67, 2, len(payload) + 25)
+    return header + payload + struct.pack('<II', zlib.crc32(data), len(data))
+
+
+def read_virtual_range(f, begin, end, executor=None):
+    """
+    Return the decompressed bytes between two BGZF virtual offsets.
+
+    A virtual offset packs the compressed offset of a block into the high
+    48 bits and the offset within the decompressed block into the low 16.
+    """
+    begin_block, begin_within = begin >> 16, begin & 0xffff
+    end_block, end_within = end >> 16, end & 0xffff
+
+    f.seek(begin_block)
+    payloads = []
+    reached_end = False
+    for offset, payload, _isize in iter_bgzf_blocks(f):
+        if offset > end_block:
+            break
+        payloads.append(payload)
+        if offset == end_block:
+            reached_end = True
+            break
+
+    if executor is not None:
+        blocks = list(executor.map(inflate_block, payloads))
+    else:
+        blocks = [inflate_block(payload) for payload in payloads]
+    if not blocks:
+        return b''
+
+    if reached_end:
+        if len(blocks) == 1:
+            return blocks[0][begin_within:end_within]
+        blocks[-1] = blocks[-1][:end_within]
+    blocks[0] = blocks[0][begin_within:]
+    return b''.join(blocks)
+
+
+class BgzfWriter:
+    """Minimal BGZF writer (used for index files and compressed outputs)"""
+
+    def __init__(self, path, level=6):
+        self._file = open(path, 'wb')
+        self._level = level
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= MAX_BLOCK_DATA:
+            self._file.write(deflate_block(bytes(self._buffer[:MAX_BLOCK_DATA]), self._level))
+            del self._buffer[:MAX_BLOCK_DATA]
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._buffer:
+            self._file.write(deflate_block(bytes(self._buffer), self._level))
+            self._buffer.clear()
+        self._file.write(BGZF_EOF)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Read-only binary stream over a BGZF file.
+
+    Blocks are read sequentially and decompressed on a thread pool with a
+    bounded read-ahead window, so memory stays proportional to the number
+    of threads while output order is preserved.
+    """
+
+    def __init__(self, path, threads=None, read_ahead=4):
+        super().__init__()
+        self._file = open(path, 'rb')
+        self._blocks = iter_bgzf_blocks(self._file)
+        self._threads = threads or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self._threads)
+        self._pending = deque()
+        self._window = self._threads * read_ahead
+        self._buffer = b''
+        self._pos = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _fill_window(self):
+        while not self._eof and len(self._pending) < self._window:
+            block = next(self._blocks, None)
+            if block is None:
+                self._eof = True
+                break
+            self._pending.append(self._executor.submit(inflate_block, block[1]))
+
+    def readinto(self, b):
+        while self._pos >= len(self._buffer):
+            self._fill_window()
+            if not self._pending:
+                return 0
+            self._buffer = self._pending.popleft().result()
+            self._pos = 0
+
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._file.close()
+        super().close()
+
+
+def open_vcf(path, threads=None):
+    """
+    Open a VCF for text reading, transparently handling gzip and BGZF input.
+
+    Args:
+        path: Path to a .vcf, .vcf.gz or .vcf.bgz file
+        threads: Decompression threads for BGZF input (defaults to CPU count)
+    """
+    if is_bgzf(path):
+        raw = BgzfReader(path, threads=threads)
+        return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=1 << 20), encoding='utf-8')
+    if is_gzip(path):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r')
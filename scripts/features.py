@@ -0,0 +1,122 @@
+"""
+Feature extraction shared by training and inference.
+
+An annotated variant table is reduced to one feature vector:
+
+    high/medium/low risk counts, pathogenic count, mean QUAL,
+    then one count per configured gene set (BRCA, APOE, TP53 by default)
+
+GENE, DISEASE_RISK and PATHOGENICITY are read as category codes and
+counted with a single bincount each. Gene-set membership is resolved once
+per distinct gene symbol, not per variant, so adding a gene set only adds
+a column to a small membership matrix.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Only these columns of the annotated table feed the model
+FEATURE_COLUMNS = ['QUAL', 'GENE', 'DISEASE_RISK', 'PATHOGENICITY']
+
+RISK_FEATURES = ['High', 'Medium', 'Low']
+
+# Feature name -> substrings of gene symbols counted by it
+DEFAULT_GENE_SETS = {
+    'brca_variants': ('BRCA',),
+    'apoe_variants': ('APOE',),
+    'tp53_variants': ('TP53',),
+}
+
+
+def category_codes(column, categories):
+    """Category codes of `column` against fixed `categories` (-1 for anything else)"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.set_categories(categories).cat.codes.to_numpy()
+    return pd.Categorical(column, categories=categories).codes
+
+
+class FeatureAccumulator:
+    """Running feature counts over any number of batches of one table"""
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.risk_counts = np.zeros(len(RISK_FEATURES), dtype=np.int64)
+        self.pathogenic = 0
+        self.quality_sum = 0.0
+        self.quality_count = 0
+        self.gene_set_counts = np.zeros(len(extractor.gene_sets), dtype=np.int64)
+        self.rows = 0
+
+    def update(self, df):
+        """Add a batch of annotated variants"""
+        self.rows += len(df)
+
+        codes = category_codes(df['DISEASE_RISK'], RISK_FEATURES)
+        self.risk_counts += np.bincount(codes + 1, minlength=len(RISK_FEATURES) + 1)[1:]
+        self.pathogenic += int((category_codes(df['PATHOGENICITY'], ['Pathogenic']) == 0).sum())
+
+        if 'QUAL' in df.columns:
+            quality = df['QUAL'].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(quality)
+            self.quality_sum += float(quality[valid].sum())
+            self.quality_count += int(valid.sum())
+
+        if self.extractor.gene_sets:
+            genes = df['GENE'].astype('category').cat
+            per_gene = np.bincount(genes.codes.to_numpy() + 1, minlength=len(genes.categories) + 1)[1:]
+            self.gene_set_counts += per_gene @ self.extractor.membership(genes.categories)
+        return self
+
+    def features(self):
+        """The feature vector for everything seen so far"""
+        # No usable QUAL counts as 0, as it always has for the rule-based model
+        quality = self.quality_sum / self.quality_count if self.quality_count else 0.0
+        return np.concatenate([
+            self.risk_counts, [self.pathogenic, quality], self.gene_set_counts,
+        ]).astype(np.float64)
+
+
+class FeatureExtractor:
+    """Turns annotated variant tables into model feature vectors"""
+
+    def __init__(self, gene_sets=None):
+        """
+        Args:
+            gene_sets: {feature name: gene symbol substrings}; defaults to
+                DEFAULT_GENE_SETS, the features the shipped models use
+        """
+        self.gene_sets = dict(DEFAULT_GENE_SETS if gene_sets is None else gene_sets)
+        self.feature_names = (
+            [f'{level.lower()}_risk_variants' for level in RISK_FEATURES]
+            + ['pathogenic_variants', 'quality_score'] + list(self.gene_sets)
+        )
+        # Gene symbol -> gene-set membership row, filled as symbols are seen
+        self._membership = {}
+
+    def membership(self, genes):
+        """(len(genes), n_gene_sets) 0/1 matrix of gene-set membership"""
+        missing = [gene for gene in genes if gene not in self._membership]
+        for gene in missing:
+            symbol = str(gene)
+            self._membership[gene] = np.array(
+                [any(pattern in symbol for pattern in patterns) for patterns in self.gene_sets.values()],
+                dtype=np.int64,
+            )
+        if len(genes) == 0:
+            return np.zeros((0, len(self.gene_sets)), dtype=np.int64)
+        return np.stack([self._membership[gene] for gene in genes])
+
+    def accumulator(self):
+        """Empty accumulator for extracting features from a table in batches"""
+        return FeatureAccumulator(self)
+
+    def transform(self, df):
+        """Feature vector for one annotated table"""
+        return self.accumulator().update(df).features()
+
+    def transform_many(self, frames):
+        """(len(frames), n_features) feature matrix, one row per table"""
+        return np.stack([self.transform(df) for df in frames])
+
+
+FEATURE_EXTRACTOR = FeatureExtractor()
@@ -0,0 +1,148 @@
+"""
+Gene annotation database compiler.
+
+Turns a genome-scale gene model (BED or GFF3) plus an optional gene ->
+disease mapping into a GeneIndex saved as .npy arrays. Workers then
+memory-map the compiled index instead of re-parsing the source files, so
+startup stays in milliseconds however many genes the database holds.
+
+Disease map format (tab separated, '#' comments allowed):
+    GENE    Disease 1;Disease 2    High|Medium|Low
+
+Usage:
+    python scripts/gene_db.py genes.gff3 [--diseases disease_map.tsv] [--out models/gene_db]
+"""
+
+import argparse
+import gzip
+import sys
+from pathlib import Path
+from urllib.parse import unquote
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.annotate import GeneIndex, RISK_LEVELS
+
+DEFAULT_OUTPUT = "models/gene_db"
+
+
+def _open_text(path):
+    return gzip.open(path, 'rt') if str(path).endswith('.gz') else open(path, 'r')
+
+
+def read_bed(path):
+    """Yield (chrom, start, end, gene) from a BED file, converted to 1-based inclusive"""
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 4:
+                continue
+            yield fields[0].replace('chr', ''), int(fields[1]) + 1, int(fields[2]), fields[3]
+
+
+def read_gff3(path, feature_types=('gene',)):
+    """Yield (chrom, start, end, gene) for gene features of a GFF3 file"""
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith('##FASTA'):
+                break
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 9 or fields[2] not in feature_types:
+                continue
+
+            attributes = {}
+            for item in fields[8].split(';'):
+                if '=' in item:
+                    key, value = item.split('=', 1)
+                    attributes[key] = unquote(value)
+            gene = attributes.get('Name') or attributes.get('gene_name') or attributes.get('ID')
+            if gene:
+                yield fields[0].replace('chr', ''), int(fields[3]), int(fields[4]), gene
+
+
+def read_disease_map(path):
+    """Load a gene -> {'diseases': [...], 'risk': ...} mapping from a TSV file"""
+    mapping = {}
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            gene = fields[0]
+            diseases = [d.strip() for d in fields[1].replace('|', ';').split(';') if d.strip()] \
+                if len(fields) > 1 else []
+            risk = fields[2].strip().capitalize() if len(fields) > 2 else 'Medium'
+            if risk not in RISK_LEVELS:
+                raise ValueError(f"Unknown risk level '{fields[2]}' for gene {gene}")
+            mapping[gene] = {'diseases': diseases, 'risk': risk}
+    return mapping
+
+
+def build_entries(gene_file, disease_map=None):
+    """
+    Combine gene coordinates with disease mappings into GeneIndex entries.
+
+    Genes without a disease mapping are still indexed (so GENE is filled
+    in) but carry Low risk and Benign pathogenicity.
+    """
+    disease_map = disease_map or {}
+    name = str(gene_file).lower()
+    reader = read_gff3 if name.endswith(('.gff3', '.gff', '.gff3.gz', '.gff.gz')) else read_bed
+
+    entries = []
+    for chrom, start, end, gene in reader(gene_file):
+        info = disease_map.get(gene)
+        if info is None:
+            risk, diseases, pathogenicity = 'Low', [], 'Benign'
+        else:
+            risk, diseases = info['risk'], info['diseases']
+            pathogenicity = 'Pathogenic' if risk == 'High' else 'Likely Pathogenic'
+        entries.append({
+            'chrom': chrom,
+            'start': start,
+            'end': end,
+            'gene': gene,
+            'diseases': diseases,
+            'risk': risk,
+            'pathogenicity': pathogenicity,
+        })
+    return entries
+
+
+def compile_gene_database(gene_file, disease_map_file=None, output_dir=DEFAULT_OUTPUT):
+    """
+    Compile a BED/GFF3 gene model (and optional disease map) into a
+    memory-mappable GeneIndex directory.
+
+    Returns:
+        The compiled GeneIndex
+    """
+    disease_map = read_disease_map(disease_map_file) if disease_map_file else None
+    entries = build_entries(gene_file, disease_map)
+    if not entries:
+        raise ValueError(f"No gene records found in {gene_file}")
+
+    index = GeneIndex.from_entries(entries)
+    index.save(output_dir)
+    return index
+
+
+def load_gene_database(path, mmap=True):
+    """Load a compiled gene database directory"""
+    return GeneIndex.load(path, mmap=mmap)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a gene annotation database")
+    parser.add_argument("genes", help="Gene model in BED or GFF3 format (optionally gzipped)")
+    parser.add_argument("--diseases", help="Tab-separated gene -> diseases -> risk mapping")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Output directory")
+    args = parser.parse_args()
+
+    index = compile_gene_database(args.genes, args.diseases, args.out)
+    print(f"Compiled {len(index.gene_labels) - 1} gene combinations over "
+          f"{len(index.chroms)} chromosomes into {args.out} (version {index.version})")
@@ -0,0 +1,181 @@
+"""
+Intermediate table storage between pipeline stages.
+
+The format is chosen from the file extension:
+    .csv      plain text (what the command-line scripts have always written)
+    .parquet  zstd-compressed Parquet with typed columns; reads can load
+              only the columns they need
+    .arrow    zstd-compressed Arrow IPC stream, the fastest to write and read
+
+Parquet and Arrow need pyarrow; without it the pipeline falls back to CSV.
+New formats can be added with register_format().
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+DEFAULT_FORMAT = 'parquet'
+COMPRESSION = 'zstd'
+
+
+def _normalize_type(t):
+    """Use one stable Arrow type per column so every batch matches the schema"""
+    if pa.types.is_dictionary(t):
+        value_type = pa.large_string() if pa.types.is_null(t.value_type) else t.value_type
+        return pa.dictionary(pa.int32(), value_type)
+    if pa.types.is_null(t):
+        return pa.large_string()
+    return t
+
+
+class _ArrowTableWriter:
+    """Shared batch-to-Arrow conversion for the Parquet and Arrow writers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.schema = None
+        self._writer = None
+
+    def _to_table(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.schema is None:
+            self.schema = pa.schema(
+                [pa.field(f.name, _normalize_type(f.type)) for f in table.schema],
+                metadata=table.schema.metadata,
+            )
+            self._writer = self._open()
+        return table.cast(self.schema)
+
+    def write(self, df):
+        table = self._to_table(df)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class ParquetTableWriter(_ArrowTableWriter):
+    def _open(self):
+        return pq.ParquetWriter(self.path, self.schema, compression=COMPRESSION)
+
+
+class ArrowTableWriter(_ArrowTableWriter):
+    def _open(self):
+        self._sink = pa.OSFile(self.path, 'wb')
+        options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        return pa.ipc.new_stream(self._sink, self.schema, options=options)
+
+    def close(self):
+        super().close()
+        if self._writer is not None:
+            self._sink.close()
+
+
+class CsvTableWriter:
+    def __init__(self, path):
+        self.path = path
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        pass
+
+
+def _read_csv(path, columns=None):
+    return pd.read_csv(path, usecols=columns)
+
+
+def _read_parquet(path, columns=None):
+    return pq.read_table(path, columns=columns).to_pandas()
+
+
+def _read_arrow(path, columns=None):
+    with pa.OSFile(path, 'rb') as source:
+        table = pa.ipc.open_stream(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+# name -> (file extension, writer class, reader function, needs pyarrow)
+FORMATS = {
+    'csv': ('.csv', CsvTableWriter, _read_csv, False),
+    'parquet': ('.parquet', ParquetTableWriter, _read_parquet, True),
+    'arrow': ('.arrow', ArrowTableWriter, _read_arrow, True),
+}
+
+
+def register_format(name, extension, writer_cls, reader, needs_pyarrow=False):
+    """Register an additional intermediate format"""
+    FORMATS[name] = (extension, writer_cls, reader, needs_pyarrow)
+
+
+def resolve_format(name):
+    """Return a usable format name, falling back to CSV when pyarrow is missing"""
+    if name not in FORMATS:
+        raise ValueError(f"Unknown intermediate format: {name}")
+    if FORMATS[name][3] and pa is None:
+        print(f"Warning: pyarrow not installed, writing CSV instead of {name}")
+        return 'csv'
+    return name
+
+
+def table_path(directory, stem, fmt=DEFAULT_FORMAT):
+    """Path for an intermediate table, e.g. data/processed/<id>_processed.parquet"""
+    return os.path.join(str(directory), stem + FORMATS[resolve_format(fmt)][0])
+
+
+def _format_for(path):
+    for name, (extension, _writer, _reader, _needs) in FORMATS.items():
+        if str(path).endswith(extension):
+            return name
+    raise ValueError(f"Unrecognised intermediate file type: {path}")
+
+
+class TableWriter:
+    """
+    Append record batches (DataFrames) to an intermediate file.
+
+        with TableWriter('x_processed.parquet') as writer:
+            for batch in batches:
+                writer.write(batch)
+    """
+
+    def __init__(self, path):
+        self.rows = 0
+        self._writer = FORMATS[_format_for(path)][1](str(path))
+
+    def write(self, df):
+        self._writer.write(df)
+        self.rows += len(df)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_table(path, df):
+    """Write a whole DataFrame to an intermediate file"""
+    with TableWriter(path) as writer:
+        writer.write(df)
+
+
+def read_table(path, columns=None):
+    """Read an intermediate file, optionally loading only `columns`"""
+    return FORMATS[_format_for(path)][2](str(path), columns=columns)
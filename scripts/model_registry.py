@@ -0,0 +1,204 @@
+"""
+Process-wide model registry.
+
+Each model file is loaded once per process and kept warm. Callers take a
+reference with get(); the registry re-checks the file every few seconds
+(mtime and size, then a SHA-256 checksum) and swaps in a new version
+atomically, so in-flight predictions keep using the model they started with.
+
+If the file is missing or cannot be loaded, the fallback model is served.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+from scripts.xgb_model import NATIVE_EXTENSIONS, XGBoostRiskModel
+
+DEFAULT_CHECK_INTERVAL = 2.0
+
+# Classes pickled from scripts run as __main__ (e.g. quick_model.py)
+_MAIN_CLASSES = {
+    'QuickGenomicsModel': 'scripts.quick_model',
+}
+
+
+class _ModelUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == '__main__' and name in _MAIN_CLASSES:
+            module = _MAIN_CLASSES[name]
+        return super().find_class(module, name)
+
+
+class ProbaModel:
+    """Adds score_batch() to estimators that only offer predict_proba()"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def score_batch(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        prob_high = np.asarray(self.model.predict_proba(X))[:, 1]
+        return prob_high, (prob_high > 0.5).astype(np.int64)
+
+    def predict(self, X):
+        return self.score_batch(X)[1]
+
+    def predict_proba(self, X):
+        prob_high = self.score_batch(X)[0]
+        return np.column_stack([1 - prob_high, prob_high])
+
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_pickled_model(path):
+    """Load a pickled model (bare estimator or quick_model.py's dict wrapper)"""
+    with open(path, 'rb') as f:
+        obj = _ModelUnpickler(f).load()
+    if isinstance(obj, dict) and 'model' in obj:
+        obj = obj['model']
+    return obj if hasattr(obj, 'score_batch') else ProbaModel(obj)
+
+
+def load_model_file(path, nthread=None):
+    """Load a native XGBoost model (.ubj/.json) or a pickled model (anything else)"""
+    if str(path).endswith(NATIVE_EXTENSIONS):
+        return XGBoostRiskModel.load(path, nthread=nthread)
+    return load_pickled_model(path)
+
+
+def find_model_file(model_dir):
+    """
+    Model file to serve from `model_dir`: native formats are preferred over
+    pickle; if none exists yet, the path train.py writes (model.ubj).
+    """
+    candidates = [os.path.join(str(model_dir), 'model' + ext) for ext in NATIVE_EXTENSIONS + ('.pkl',)]
+    return next((path for path in candidates if os.path.exists(path)), candidates[0])
+
+
+class ModelRegistry:
+    """Serves one model file, reloading it when its contents change"""
+
+    def __init__(self, path, fallback, loader=load_model_file, check_interval=DEFAULT_CHECK_INTERVAL):
+        """
+        Args:
+            path: Model file to watch
+            fallback: Zero-argument factory for the model served when the file
+                is missing or unloadable
+            loader: Function turning the file path into a model
+            check_interval: Seconds between checks of the file for changes
+        """
+        self.path = str(path)
+        self.fallback = fallback
+        self.loader = loader
+        self.check_interval = check_interval
+
+        self._reload_lock = threading.Lock()
+        self._next_check = 0.0
+        self._stamp = None      # (mtime_ns, size) of the file last examined
+        self._failed = None     # stamp of a file that failed to load
+        # (model, version) swapped as one reference
+        self._current = (fallback(), 'builtin')
+        self.reloads = 0
+
+    @property
+    def version(self):
+        return self._current[1]
+
+    def get(self):
+        """The current model; checks for a new version at most every check_interval seconds"""
+        return self.current()[0]
+
+    def current(self):
+        """(model, version) of the current model, taken together"""
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+        return self._current
+
+    def refresh(self, force=False):
+        """Reload the model if the file changed (or unconditionally with force=True)"""
+        # Only one thread reloads; the others keep serving the current model
+        if not self._reload_lock.acquire(blocking=force):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                if self._current[1] != 'builtin':
+                    print(f"Warning: {self.path} was removed, serving the built-in model")
+                    self._current = (self.fallback(), 'builtin')
+                self._stamp = None
+                return
+
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp in (self._stamp, self._failed) and not force:
+                return
+
+            checksum = _file_checksum(self.path)
+            if checksum[:12] == self._current[1] and not force:
+                self._stamp = stamp
+                return
+            try:
+                model = self.loader(self.path)
+            except Exception as e:
+                # Possibly a partially written file; keep serving and retry once it changes
+                print(f"Warning: Could not load {self.path} ({e}), keeping model {self._current[1]}")
+                self._failed = stamp
+                return
+
+            self._current = (model, checksum[:12])
+            self._stamp = stamp
+            self.reloads += 1
+        finally:
+            self._reload_lock.release()
+
+
+class ModelFileVersion:
+    """
+    The version a ModelRegistry serving `path` reports, worked out from the
+    file without loading it: 'builtin' while it is missing, otherwise its
+    checksum, recomputed only when its mtime or size changes
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._stamp = None
+        self._version = 'builtin'
+
+    def current(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._stamp, self._version = None, 'builtin'
+            return self._version
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            self._version = _file_checksum(self.path)[:12]
+            self._stamp = stamp
+        return self._version
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(path, fallback, **kwargs):
+    """The process-wide registry for `path`, created on first use"""
+    key = os.path.abspath(str(path))
+    with _REGISTRIES_LOCK:
+        if key not in _REGISTRIES:
+            _REGISTRIES[key] = ModelRegistry(path, fallback, **kwargs)
+        return _REGISTRIES[key]
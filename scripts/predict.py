@@ -1,92 +1,90 @@
-import pandas as pd
-import pickle
+import numpy as np
 import sys
 import os
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.features import FEATURE_COLUMNS, FEATURE_EXTRACTOR
+from scripts.intermediate import read_table
+from scripts.model_registry import find_model_file, get_registry, load_model_file
+
+MODEL_DIR = 'models'
 
 class SimpleRiskModel:
     """Simple rule-based risk model that doesn't require pickle"""
     
-    def predict(self, X):
-        """Predict risk class (0=low, 1=high)"""
-        import numpy as np
-        X = np.array(X)
+    # Feature columns in the score and their weights (features from FeatureExtractor)
+    SCORE_COLUMNS = [0, 1, 3, 5, 7]   # high risk, medium risk, pathogenic, BRCA, TP53
+    SCORE_WEIGHTS = np.array([4, 2, 5, 3.5, 4], dtype=np.float64)
+    SCORE_SCALE = 25.0
+    QUALITY_COLUMN = 4
+    
+    def score_batch(self, X):
+        """
+        Score an (N, 8) feature matrix in one pass.
+        
+        Returns:
+            (probability of high risk, predicted class) as two length-N arrays
+        """
+        X = np.asarray(X, dtype=np.float64)
         if X.ndim == 1:
             X = X.reshape(1, -1)
         
-        predictions = []
-        for features in X:
-            high_risk = features[0]
-            medium_risk = features[1]
-            pathogenic = features[3]
-            brca = features[5]
-            tp53 = features[7]
-            
-            score = (high_risk * 4 + medium_risk * 2 + pathogenic * 5 + brca * 3.5 + tp53 * 4) / 25.0
-            pred = 1 if score > 0.6 else 0
-            predictions.append(pred)
+        score = X[:, self.SCORE_COLUMNS] @ self.SCORE_WEIGHTS / self.SCORE_SCALE
+        classes = (score > 0.6).astype(np.int64)
         
-        return np.array(predictions)
+        # Low average quality damps the probability (not the class)
+        score = np.where(X[:, self.QUALITY_COLUMN] < 20, score * 0.7, score)
+        prob_high = np.clip(score, 0.05, 0.95)
+        return prob_high, classes
+    
+    def predict(self, X):
+        """Predict risk class (0=low, 1=high)"""
+        return self.score_batch(X)[1]
     
     def predict_proba(self, X):
         """Predict probability of each class"""
-        import numpy as np
-        X = np.array(X)
-        if X.ndim == 1:
-            X = X.reshape(1, -1)
-        
-        probas = []
-        for features in X:
-            high_risk = features[0]
-            medium_risk = features[1]
-            pathogenic = features[3]
-            brca = features[5]
-            tp53 = features[7]
-            quality = features[4]
-            
-            score = (high_risk * 4 + medium_risk * 2 + pathogenic * 5 + brca * 3.5 + tp53 * 4) / 25.0
-            
-            if quality < 20:
-                score *= 0.7
-            
-            prob_high = min(max(score, 0.05), 0.95)
-            prob_low = 1 - prob_high
-            
-            probas.append([prob_low, prob_high])
-        
-        return np.array(probas)
+        prob_high = self.score_batch(X)[0]
+        return np.column_stack([1 - prob_high, prob_high])
+
+def model_registry(path=None, nthread=None):
+    """
+    Process-wide registry for a model file (by default the best one in
+    models/), falling back to SimpleRiskModel. `nthread` sets XGBoost's
+    prediction threads when the registry is first created.
+    """
+    path = path or find_model_file(MODEL_DIR)
+    return get_registry(path, fallback=SimpleRiskModel,
+                        loader=lambda p: load_model_file(p, nthread=nthread))
 
-def load_model():
-    """Load trained model"""
-    # Try to load pickled model, fall back to simple model
-    try:
-        if os.path.exists('models/model.pkl'):
-            # For now, just use the simple model to avoid pickle issues
-            return SimpleRiskModel()
-        else:
-            return SimpleRiskModel()
-    except Exception as e:
-        print(f"Warning: Could not load pickled model ({e}), using fallback model")
-        return SimpleRiskModel()
+def load_model(path=None):
+    """Current model for `path` (loaded once per process and reloaded when the file changes)"""
+    return model_registry(path).get()
 
 def create_features(df):
-    """Extract features from annotated variants (same as train.py)"""
-    risk_counts = df['DISEASE_RISK'].value_counts()
-    high_risk = risk_counts.get('High', 0)
-    medium_risk = risk_counts.get('Medium', 0)
-    low_risk = risk_counts.get('Low', 0)
-    
-    pathogenic_count = len(df[df['PATHOGENICITY'] == 'Pathogenic'])
-    avg_quality = df['QUAL'].mean() if 'QUAL' in df.columns else 0
-    
-    brca_variants = len(df[df['GENE'].str.contains('BRCA', na=False)])
-    apoe_variants = len(df[df['GENE'].str.contains('APOE', na=False)])
-    tp53_variants = len(df[df['GENE'].str.contains('TP53', na=False)])
-    
-    return [high_risk, medium_risk, low_risk, pathogenic_count,
-            avg_quality, brca_variants, apoe_variants, tp53_variants]
+    """Extract features from annotated variants (shared with train.py)"""
+    return FEATURE_EXTRACTOR.transform(df)
 
-def predict_disease_risk(vcf_file, annotated_file=None):
-    """Predict disease risk for a VCF file"""
+def build_report(vcf_file, total_variants, features, prob_high, risk_class):
+    """Prediction report for one sample from its feature vector and model output"""
+    return {
+        'file': vcf_file,
+        'total_variants': int(total_variants),
+        'high_risk_variants': int(features[0]),
+        'medium_risk_variants': int(features[1]),
+        'low_risk_variants': int(features[2]),
+        'pathogenic_variants': int(features[3]),
+        'disease_risk_probability': float(prob_high),
+        'risk_classification': 'High Risk' if risk_class == 1 else 'Low Risk',
+        'quality_score': float(features[4]),
+        'brca_variants': int(features[5]),
+        'apoe_variants': int(features[6]),
+        'tp53_variants': int(features[7])
+    }
+
+def predict_disease_risk(vcf_file, annotated_file=None, model=None):
+    """Predict disease risk for a VCF file (with `model`, or the registry's current model)"""
     # Find annotated file
     if annotated_file is None:
         base_name = os.path.splitext(os.path.basename(vcf_file))[0]
@@ -98,33 +96,18 @@ def predict_disease_risk(vcf_file, annotated_file=None):
         return None
     
     # Load data and model
-    df = pd.read_csv(annotated_file)
-    model = load_model()
+    df = read_table(annotated_file, columns=FEATURE_COLUMNS)
+    if model is None:
+        model = load_model()
     
     # Extract features
     features = create_features(df)
     
-    # Predict
-    risk_prob = model.predict_proba([features])[0][1]
-    risk_class = model.predict([features])[0]
+    # Predict (probability and class from a single scoring pass)
+    prob_high, classes = model.score_batch([features])
     
     # Generate detailed report
-    report = {
-        'file': vcf_file,
-        'total_variants': len(df),
-        'high_risk_variants': features[0],
-        'medium_risk_variants': features[1],
-        'low_risk_variants': features[2],
-        'pathogenic_variants': features[3],
-        'disease_risk_probability': risk_prob,
-        'risk_classification': 'High Risk' if risk_class == 1 else 'Low Risk',
-        'quality_score': features[4],
-        'brca_variants': features[5],
-        'apoe_variants': features[6],
-        'tp53_variants': features[7]
-    }
-    
-    return report
+    return build_report(vcf_file, len(df), features, prob_high[0], classes[0])
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
@@ -1,78 +1,360 @@
 import pandas as pd
+import numpy as np
 import os
 import sys
 import re
+import bisect
+import itertools
+import mmap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
-def preprocess_vcf(input_file, output_file):
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.bgzf import is_bgzf, is_gzip, open_vcf
+from scripts.intermediate import TableWriter
+from scripts.tabix import build_index, fetch_lines, find_index, load_index, merge_regions
+
+# Number of variants held in memory at once while streaming a VCF
+DEFAULT_BATCH_SIZE = 50000
+
+VARIANT_COLUMNS = ['CHROM', 'POS', 'REF', 'ALT', 'QUAL', 'FILTER', 'GT']
+
+VCF_EXTENSIONS = ('.vcf', '.vcf.gz', '.vcf.bgz')
+
+# Plain-text VCFs at least this large are parsed in parallel byte ranges
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+RANGE_BYTES = 16 * 1024 * 1024
+
+# 'text' decodes and splits each line; 'mmap' scans a memory-mapped file as bytes
+PARSE_MODES = ('text', 'mmap')
+SCAN_WINDOW_BYTES = 4 * 1024 * 1024
+
+
+def parse_variant_fields(fields):
+    """Parse the split fields of one VCF data line into a variant tuple"""
+    # Parse standard VCF fields
+    chrom = fields[0].replace('chr', '')  # Normalize chromosome
+    pos = int(fields[1]) if fields[1].isdigit() else 0
+    ref = fields[3]
+    alt = fields[4].split(',')[0] if fields[4] != '.' else ''
+
+    # Parse quality score
+    try:
+        qual = float(fields[5]) if fields[5] != '.' else np.nan
+    except ValueError:
+        qual = np.nan
+
+    filter_val = fields[6] if fields[6] != '.' else 'PASS'
+
+    # Extract genotype if sample data exists
+    genotype = None
+    if len(fields) > 9:
+        format_fields = fields[8].split(':')
+        sample_data = fields[9].split(':')
+
+        if 'GT' in format_fields:
+            gt_index = format_fields.index('GT')
+            if gt_index < len(sample_data):
+                genotype = sample_data[gt_index].replace('|', '/')
+
+    return chrom, pos, ref, alt, qual, filter_val, genotype
+
+
+def make_batch(rows):
+    """Build a compact, typed record batch from a list of variant tuples"""
+    chrom, pos, ref, alt, qual, filter_val, genotype = zip(*rows)
+    return pd.DataFrame({
+        'CHROM': pd.Categorical(np.array(chrom, dtype=object)),
+        'POS': np.array(pos, dtype=np.int32),
+        'REF': np.array(ref, dtype=object),
+        'ALT': np.array(alt, dtype=object),
+        'QUAL': np.array(qual, dtype=np.float32),
+        'FILTER': pd.Categorical(np.array(filter_val, dtype=object)),
+        'GT': pd.Categorical(np.array(genotype, dtype=object)),
+    })
+
+
+def _region_lookup(regions):
+    """Merged regions as {chrom: (sorted starts, ends)} for bisect lookups"""
+    if regions is None:
+        return None
+    lookup = {}
+    for chrom, start, end in merge_regions(regions):
+        starts, ends = lookup.setdefault(chrom, ([], []))
+        starts.append(start)
+        ends.append(end)
+    return lookup
+
+
+def _in_regions(regions_by_chrom, chrom, pos):
+    """Check a variant against merged regions (sorted starts per chromosome)"""
+    entry = regions_by_chrom.get(chrom)
+    if entry is None:
+        return False
+    starts, ends = entry
+    i = bisect.bisect_right(starts, pos) - 1
+    return i >= 0 and pos <= ends[i]
+
+
+def _filter_lines(lines, regions_by_chrom=None):
+    """Drop header lines and, when a region lookup is given, out-of-region variants"""
+    for line in lines:
+        # Skip header lines
+        if not line or line.startswith('#'):
+            continue
+        if regions_by_chrom is not None:
+            fields = line.split('\t', 2)
+            if len(fields) < 3 or not fields[1].isdigit() or not _in_regions(
+                    regions_by_chrom, fields[0].replace('chr', ''), int(fields[1])):
+                continue
+        yield line
+
+
+def _iter_line_batches(lines, batch_size):
+    """Parse VCF data lines into record batches of at most `batch_size` variants"""
+    rows = []
+    for line in lines:
+        fields = line.strip().split('\t')
+        if len(fields) < 8:
+            continue
+
+        rows.append(parse_variant_fields(fields))
+        if len(rows) >= batch_size:
+            yield make_batch(rows)
+            rows = []
+
+    if rows:
+        yield make_batch(rows)
+
+
+def _iter_data_lines(input_file, threads=None, regions=None):
+    """
+    Yield VCF data lines, restricted to `regions` when given.
+
+    BGZF input is read through its tabix/CSI index (built next to the file
+    on first use), so only the blocks overlapping the regions are touched.
+    Other input is scanned in full and filtered.
+    """
+    if regions is not None and is_bgzf(input_file):
+        try:
+            index = load_index(find_index(input_file) or build_index(input_file))
+        except (ValueError, OSError) as e:
+            print(f"Warning: Could not index {input_file} ({e}), scanning whole file")
+        else:
+            yield from fetch_lines(input_file, index, regions, threads=threads)
+            return
+
+    with open_vcf(input_file, threads=threads) as f:
+        yield from _filter_lines(f, _region_lookup(regions))
+
+
+def _scan_buffer(buf, start, end, batch_size, regions_by_chrom=None):
+    """
+    Scan the VCF data lines in buf[start:end] and yield record batches.
+
+    `buf` is a read-only mmap, consumed in newline-aligned windows that are
+    split as bytes -- lines are never decoded to str as a whole. CHROM,
+    QUAL, FILTER, FORMAT and GT go through caches keyed by their raw bytes,
+    so each distinct value is decoded once; only REF/ALT are decoded per row.
+    """
+    chrom_cache, filter_cache, qual_cache, format_cache, gt_cache = {}, {}, {}, {}, {}
+    rows = []
+    pos = start
+
+    while pos < end:
+        stop = min(pos + SCAN_WINDOW_BYTES, end)
+        if stop < end:
+            newline = buf.find(b'\n', stop, end)
+            stop = end if newline == -1 else newline + 1
+
+        for line in buf[pos:stop].split(b'\n'):
+            # Skip blank and header lines
+            if not line or line[0] == 35:  # '#'
+                continue
+
+            fields = line.split(b'\t', 10)
+            if len(fields) < 8:
+                continue
+
+            raw = fields[0]
+            chrom = chrom_cache.get(raw)
+            if chrom is None:
+                chrom = chrom_cache[raw] = raw.decode().replace('chr', '')
+
+            raw = fields[1]
+            variant_pos = int(raw) if raw.isdigit() else 0
+
+            if regions_by_chrom is not None and not _in_regions(regions_by_chrom, chrom, variant_pos):
+                continue
+
+            ref = fields[3].decode()
+            alt = fields[4]
+            alt = '' if alt == b'.' else alt.split(b',', 1)[0].decode()
+
+            raw = fields[5]
+            qual = qual_cache.get(raw)
+            if qual is None:
+                try:
+                    qual = float(raw) if raw != b'.' else np.nan
+                except ValueError:
+                    qual = np.nan
+                qual_cache[raw] = qual
+
+            raw = fields[6]
+            filter_val = filter_cache.get(raw)
+            if filter_val is None:
+                filter_val = filter_cache[raw] = raw.decode() if raw != b'.' else 'PASS'
+
+            # Extract genotype if sample data exists
+            genotype = None
+            if len(fields) > 9:
+                gt_index = format_cache.get(fields[8])
+                if gt_index is None:
+                    format_fields = fields[8].split(b':')
+                    gt_index = format_fields.index(b'GT') if b'GT' in format_fields else -1
+                    format_cache[fields[8]] = gt_index
+                if gt_index >= 0:
+                    sample = fields[9].rstrip(b'\r').split(b':')
+                    if gt_index < len(sample):
+                        raw = sample[gt_index]
+                        genotype = gt_cache.get(raw)
+                        if genotype is None:
+                            genotype = gt_cache[raw] = raw.decode().replace('|', '/')
+
+            rows.append((chrom, variant_pos, ref, alt, qual, filter_val, genotype))
+            if len(rows) >= batch_size:
+                yield make_batch(rows)
+                rows = []
+
+        pos = stop
+
+    if rows:
+        yield make_batch(rows)
+
+
+def _iter_mmap_batches(input_file, batch_size, regions=None, start=0, end=None):
+    """Memory-map a plain-text VCF and scan bytes [start, end) into record batches"""
+    size = os.path.getsize(input_file)
+    if size == 0:
+        return
+    with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        yield from _scan_buffer(buf, start, size if end is None else end,
+                                batch_size, _region_lookup(regions))
+
+
+def split_byte_ranges(input_file, range_bytes=RANGE_BYTES):
+    """
+    Split the body of a plain-text VCF into newline-aligned (start, end)
+    byte ranges of roughly `range_bytes` each, starting after the header.
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, 'rb') as f:
+        # Find the end of the header block
+        start = 0
+        for line in iter(f.readline, b''):
+            if not line.startswith(b'#'):
+                break
+            start = f.tell()
+
+        ranges = []
+        while start < size:
+            f.seek(min(start + range_bytes, size))
+            f.readline()  # advance to the next line boundary
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_byte_range(input_file, start, end, batch_size, regions, mode='text'):
+    """Worker: parse one byte range of a plain-text VCF into record batches"""
+    if mode == 'mmap':
+        return list(_iter_mmap_batches(input_file, batch_size, regions, start, end))
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    lines = _filter_lines(text.split('\n'), _region_lookup(regions))
+    return list(_iter_line_batches(lines, batch_size))
+
+
+def _iter_parallel_batches(input_file, workers, batch_size, regions, mode='text', range_bytes=RANGE_BYTES):
+    """
+    Parse byte ranges on a process pool and yield their batches in file order.
+
+    At most two ranges per worker are in flight, which keeps memory bounded
+    while every core stays busy.
+    """
+    ranges = iter(split_byte_ranges(input_file, range_bytes))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in itertools.islice(ranges, workers * 2):
+            pending.append(pool.submit(_parse_byte_range, input_file, start, end, batch_size, regions, mode))
+
+        while pending:
+            batches = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(_parse_byte_range, input_file, *next_range,
+                                           batch_size, regions, mode))
+            yield from batches
+
+
+def iter_vcf_batches(input_file, batch_size=DEFAULT_BATCH_SIZE, threads=None, regions=None, workers=1,
+                     mode='text'):
+    """
+    Stream a VCF file as record batches of at most `batch_size` variants.
+
+    Each batch is a DataFrame with int32 POS, float32 QUAL and categorical
+    CHROM/FILTER/GT columns, so peak memory is bounded by the batch size
+    rather than by the size of the file. Plain, gzip and BGZF input are
+    all accepted; `threads` controls parallel BGZF block decompression.
+
+    `regions` optionally restricts parsing to (chrom, start, end) ranges,
+    1-based inclusive, matched against the normalized chromosome name.
+
+    With `workers` > 1, large plain-text files are split into byte ranges
+    that are parsed on a process pool; batches still arrive in file order.
+
+    `mode='mmap'` memory-maps plain-text input and scans it as raw bytes
+    (see _scan_buffer); compressed input always uses the text reader.
+    """
+    if mode not in PARSE_MODES:
+        raise ValueError(f"Unknown parse mode: {mode}")
+    compressed = is_gzip(input_file)
+    if workers > 1 and not compressed and os.path.getsize(input_file) >= PARALLEL_MIN_BYTES:
+        yield from _iter_parallel_batches(input_file, workers, batch_size, regions, mode)
+        return
+
+    if mode == 'mmap' and not compressed:
+        yield from _iter_mmap_batches(input_file, batch_size, regions)
+        return
+
+    lines = _iter_data_lines(input_file, threads=threads, regions=regions)
+    yield from _iter_line_batches(lines, batch_size)
+
+
+def preprocess_vcf(input_file, output_file, batch_size=DEFAULT_BATCH_SIZE, threads=None, regions=None, workers=1,
+                   mode='text'):
     """Preprocess VCF file and extract variant information (Windows-compatible, no pysam)"""
-    variants = []
-    
+    total = 0
+
     try:
-        with open(input_file, 'r') as f:
-            for line in f:
-                # Skip header lines
-                if line.startswith('##'):
-                    continue
-                    
-                # Process column header line
-                if line.startswith('#CHROM'):
-                    headers = line.strip().split('\t')
-                    sample_columns = headers[9:] if len(headers) > 9 else []
-                    continue
-                
-                # Process variant lines
-                if line.strip():
-                    fields = line.strip().split('\t')
-                    
-                    if len(fields) < 8:
-                        continue
-                    
-                    # Parse standard VCF fields
-                    chrom = fields[0].replace('chr', '')  # Normalize chromosome
-                    pos = int(fields[1]) if fields[1].isdigit() else 0
-                    ref = fields[3]
-                    alt = fields[4].split(',')[0] if fields[4] != '.' else ''
-                    
-                    # Parse quality score
-                    try:
-                        qual = float(fields[5]) if fields[5] != '.' else None
-                    except ValueError:
-                        qual = None
-                    
-                    filter_val = fields[6] if fields[6] != '.' else 'PASS'
-                    
-                    # Extract genotype if sample data exists
-                    genotype = None
-                    if len(fields) > 9:
-                        format_fields = fields[8].split(':')
-                        sample_data = fields[9].split(':')
-                        
-                        if 'GT' in format_fields:
-                            gt_index = format_fields.index('GT')
-                            if gt_index < len(sample_data):
-                                genotype = sample_data[gt_index].replace('|', '/')
-                    
-                    variant = {
-                        'CHROM': chrom,
-                        'POS': pos,
-                        'REF': ref,
-                        'ALT': alt,
-                        'QUAL': qual,
-                        'FILTER': filter_val,
-                        'GT': genotype
-                    }
-                    
-                    variants.append(variant)
-        
-        if not variants:
+        # Append each batch so only one batch is ever held in memory; the
+        # output format (.csv, .parquet, .arrow) follows the file extension
+        with TableWriter(output_file) as writer:
+            for batch in iter_vcf_batches(input_file, batch_size=batch_size, threads=threads,
+                                          regions=regions, workers=workers, mode=mode):
+                writer.write(batch)
+        total = writer.rows
+
+        if total == 0:
             print("Warning: No variants found in VCF file")
             return False
-        
-        # Convert to DataFrame and save
-        df = pd.DataFrame(variants)
-        df.to_csv(output_file, index=False)
-        print(f"Processed {len(variants)} variants from {input_file}")
-        
+
+        print(f"Processed {total} variants from {input_file}")
+
     except FileNotFoundError:
         print(f"Error: File not found: {input_file}")
         return False
@@ -81,20 +363,21 @@ def preprocess_vcf(input_file, output_file):
         import traceback
         traceback.print_exc()
         return False
-    
+
     return True
 
 if __name__ == "__main__":
     input_dir = "data/raw"
     output_dir = "data/processed"
-    
+
     os.makedirs(output_dir, exist_ok=True)
-    
+
     for file in os.listdir(input_dir):
-        if file.endswith('.vcf'):
+        if file.endswith(VCF_EXTENSIONS):
             input_path = os.path.join(input_dir, file)
-            output_path = os.path.join(output_dir, file.replace('.vcf', '_processed.csv'))
-            
+            base_name = file[:file.index('.vcf')]
+            output_path = os.path.join(output_dir, f"{base_name}_processed.csv")
+
             print(f"Processing {file}...")
             if preprocess_vcf(input_path, output_path):
                 print(f"Saved to {output_path}")
\ No newline at end of file
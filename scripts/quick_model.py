@@ -24,62 +24,34 @@ class QuickGenomicsModel:
         self.model_version = "1.0"
         self.trained_samples = 5000
     
-    def predict(self, X):
-        """Predict risk class (0=low, 1=high)"""
+    def score_batch(self, X):
+        """Risk probability and class for an (N, 8) feature matrix, as arrays"""
         import numpy as np
-        X = np.array(X)
+        X = np.asarray(X, dtype=np.float64)
         if X.ndim == 1:
             X = X.reshape(1, -1)
         
-        predictions = []
-        for features in X:
-            # Simple rule-based prediction that looks like ML
-            high_risk = features[0]
-            medium_risk = features[1]
-            pathogenic = features[3]
-            brca = features[5]
-            tp53 = features[7]
-            
-            # Calculate risk score
-            score = (high_risk * 4 + medium_risk * 2 + pathogenic * 5 + brca * 3.5 + tp53 * 4) / 25.0
-            
-            # Predict
-            pred = 1 if score > 0.6 else 0
-            predictions.append(pred)
+        # Risk score from high risk, medium risk, pathogenic, BRCA and TP53 counts
+        score = X[:, [0, 1, 3, 5, 7]] @ np.array([4, 2, 5, 3.5, 4]) / 25.0
+        
+        # Predict
+        classes = (score > 0.6).astype(np.int64)
         
-        return np.array(predictions)
+        # Quality adjustment, then keep the probability between 5-95%
+        score = np.where(X[:, 4] < 20, score * 0.7, score)
+        prob_high = np.clip(score, 0.05, 0.95)
+        
+        return prob_high, classes
+    
+    def predict(self, X):
+        """Predict risk class (0=low, 1=high)"""
+        return self.score_batch(X)[1]
     
     def predict_proba(self, X):
         """Predict probability of each class"""
         import numpy as np
-        X = np.array(X)
-        if X.ndim == 1:
-            X = X.reshape(1, -1)
-        
-        probas = []
-        for features in X:
-            # Calculate probability
-            high_risk = features[0]
-            medium_risk = features[1]
-            pathogenic = features[3]
-            brca = features[5]
-            tp53 = features[7]
-            quality = features[4]
-            
-            # Risk score (0-1)
-            score = (high_risk * 4 + medium_risk * 2 + pathogenic * 5 + brca * 3.5 + tp53 * 4) / 25.0
-            
-            # Quality adjustment
-            if quality < 20:
-                score *= 0.7
-            
-            # Normalize to probability
-            prob_high = min(max(score, 0.05), 0.95)  # Keep between 5-95%
-            prob_low = 1 - prob_high
-            
-            probas.append([prob_low, prob_high])
-        
-        return np.array(probas)
+        prob_high = self.score_batch(X)[0]
+        return np.column_stack([1 - prob_high, prob_high])
     
     def score(self, X, y):
         """Calculate accuracy"""
@@ -0,0 +1,116 @@
+"""
+Fused streaming analysis.
+
+The staged pipeline writes the parsed and annotated variant tables to
+disk and reads them back for feature extraction. The model needs none of
+that: it works from a handful of counts and a mean quality. stream_vcf()
+reads the VCF once and runs each record batch through annotation, the
+feature accumulator and a top-K of the most significant variants, then
+drops it. Peak memory is bounded by the batch size and K.
+"""
+
+import heapq
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.annotate import PATHOGENICITY_LEVELS, RISK_LEVELS, annotate_frame
+from scripts.features import FEATURE_EXTRACTOR, category_codes
+from scripts.preprocess import iter_vcf_batches
+
+DEFAULT_TOP_K = 50
+# Rank of a Benign / Low variant, what annotation leaves unmatched variants at
+UNANNOTATED_RANK = len(RISK_LEVELS) + 2
+
+
+class TopVariants:
+    """
+    The `k` most significant annotated variants seen across batches.
+
+    Variants rank by pathogenicity, then disease risk, then QUAL; ties keep
+    the variant seen first. Only annotated variants are kept: ones with a
+    gene or a clinical significance, or ranked above the Benign / Low that
+    variants outside every annotation default to.
+    """
+
+    def __init__(self, k=DEFAULT_TOP_K):
+        self.k = k
+        self._heap = []     # min-heap of (rank, quality, -sequence, record)
+        self._seen = 0
+
+    def update(self, df):
+        """Offer a batch of annotated variants"""
+        offset, self._seen = self._seen, self._seen + len(df)
+        if self.k <= 0 or len(df) == 0:
+            return self
+
+        pathogenicity = category_codes(df['PATHOGENICITY'], PATHOGENICITY_LEVELS) + 1
+        risk = category_codes(df['DISEASE_RISK'], RISK_LEVELS) + 1
+        rank = pathogenicity.astype(np.int64) * (len(RISK_LEVELS) + 1) + risk
+        quality = df['QUAL'].to_numpy(dtype=np.float64, na_value=np.nan)
+        quality = np.where(np.isnan(quality), -np.inf, quality)
+
+        gene = df['GENE'].astype(object).fillna('').to_numpy()
+        significance = df['CLINICAL_SIG'].astype(object).fillna('').to_numpy()
+        annotated = ((rank > UNANNOTATED_RANK) | (gene != '')
+                     | ((significance != '') & (significance != 'Unknown')))
+
+        # Only this batch's best k can enter the overall top k
+        candidates = np.flatnonzero(annotated)
+        order = candidates[np.lexsort((candidates, -quality[candidates], -rank[candidates]))][:self.k]
+        for row in order:
+            key = (int(rank[row]), float(quality[row]), -(offset + int(row)))
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, key + (self._record(df, row),))
+            elif key > self._heap[0][:3]:
+                heapq.heapreplace(self._heap, key + (self._record(df, row),))
+            else:
+                break
+        return self
+
+    def records(self):
+        """Kept variants, most significant first, as API Variant dicts"""
+        return [entry[3] for entry in sorted(self._heap, key=lambda entry: entry[:3], reverse=True)]
+
+    @staticmethod
+    def _record(df, row):
+        variant = df.iloc[row]
+        quality = float(variant['QUAL'])
+        return {
+            'chrom': str(variant['CHROM']),
+            'pos': int(variant['POS']),
+            'ref': str(variant['REF']),
+            'alt': str(variant['ALT']),
+            'qual': None if np.isnan(quality) else quality,
+            'gene': str(variant['GENE']) or None,
+            'disease_risk': str(variant['DISEASE_RISK']).lower(),
+            'pathogenicity': str(variant['PATHOGENICITY']),
+            'clinical_significance': str(variant['CLINICAL_SIG']) or None,
+        }
+
+
+def stream_vcf(vcf_file, extractor=FEATURE_EXTRACTOR, index=None, store=None, remote=None,
+               top_k=DEFAULT_TOP_K, sink=None, **parse_options):
+    """
+    Parse, annotate and featurize a VCF in a single pass over its record batches.
+
+    `index`, `store` and `remote` are as for annotate_frame(); `parse_options`
+    go to iter_vcf_batches() (batch_size, regions, workers, mode, threads).
+    `sink` is an optional object whose write(df) receives every annotated
+    batch, e.g. to store per-variant results.
+
+    Returns:
+        (FeatureAccumulator, TopVariants) over every variant in the file
+    """
+    features = extractor.accumulator()
+    top = TopVariants(top_k)
+    for batch in iter_vcf_batches(vcf_file, **parse_options):
+        batch, _counts = annotate_frame(batch, index=index, store=store, remote=remote)
+        features.update(batch)
+        top.update(batch)
+        if sink is not None:
+            sink.write(batch)
+    return features, top
@@ -0,0 +1,341 @@
+"""
+Tabix (.tbi) and CSI index support for BGZF-compressed VCF files.
+
+Indexes are read in either format and built in tabix format when missing,
+so region queries can seek straight to the blocks that overlap the
+requested coordinates instead of scanning the whole genome.
+"""
+
+import gzip
+import os
+import struct
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.bgzf import BgzfWriter, inflate_block, iter_bgzf_blocks, read_virtual_range
+
+TBI_MAGIC = b'TBI\x01'
+CSI_MAGIC = b'CSI\x01'
+
+# Binning scheme used by .tbi files (and by default for .csi)
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+# Tabix preset for VCF: 1-based coordinates, sequence in column 1, position in column 2
+TBI_FORMAT_VCF = 2
+VCF_COLUMNS = (1, 2, 0)
+META_CHAR = ord('#')
+
+
+def reg2bin(beg, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """Smallest bin that fully contains the 0-based half-open interval [beg, end)"""
+    end -= 1
+    s = min_shift
+    t = ((1 << depth * 3) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> s == end >> s:
+            return t + (beg >> s)
+        s += 3
+        t -= 1 << (level - 1) * 3
+    return 0
+
+
+def reg2bins(beg, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """All bins that may contain records overlapping [beg, end)"""
+    end -= 1
+    bins = []
+    s = min_shift + depth * 3
+    t = 0
+    for level in range(depth + 1):
+        bins.extend(range(t + (beg >> s), t + (end >> s) + 1))
+        s -= 3
+        t += 1 << level * 3
+    return bins
+
+
+class TabixIndex:
+    """In-memory representation of a .tbi or .csi index"""
+
+    def __init__(self, names, bins, linear, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH, skip=0):
+        self.names = names            # sequence names in file order
+        self.bins = bins              # per sequence: {bin: flat (beg, end, beg, end, ...) voffsets}
+        self.linear = linear          # per sequence: minimum voffset per 2^min_shift window
+        self.min_shift = min_shift
+        self.depth = depth
+        self.skip = skip
+
+    def resolve_name(self, chrom):
+        """Map a normalized chromosome ('17') onto the name used in the file ('chr17')"""
+        for name in self.names:
+            if name == chrom or name.replace('chr', '') == chrom:
+                return name
+        return None
+
+    def chunks(self, chrom, beg, end):
+        """
+        Merged (beg_voffset, end_voffset) chunks that may hold records
+        overlapping the 0-based half-open interval [beg, end).
+        """
+        name = self.resolve_name(chrom)
+        if name is None:
+            return []
+        tid = self.names.index(name)
+        bins, linear = self.bins[tid], self.linear[tid]
+
+        window = beg >> self.min_shift
+        min_offset = 0
+        if linear:
+            min_offset = linear[min(window, len(linear) - 1)]
+
+        candidates = []
+        for b in reg2bins(beg, end, self.min_shift, self.depth):
+            chunks = bins.get(b, ())
+            for chunk_beg, chunk_end in zip(chunks[::2], chunks[1::2]):
+                if chunk_end > min_offset:
+                    candidates.append((max(chunk_beg, min_offset), chunk_end))
+
+        merged = []
+        for chunk_beg, chunk_end in sorted(candidates):
+            if merged and chunk_beg <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], chunk_end))
+            else:
+                merged.append((chunk_beg, chunk_end))
+        return merged
+
+
+_INT = struct.Struct('<i')
+_TBI_BIN = struct.Struct('<Ii')
+_CSI_BIN = struct.Struct('<IQi')
+
+
+def _unpack(fmt, data, offset):
+    if isinstance(fmt, str):
+        fmt = struct.Struct(fmt)
+    return fmt.unpack_from(data, offset), offset + fmt.size
+
+
+def _parse_names(data, offset):
+    (l_nm,), offset = _unpack(_INT, data, offset)
+    names = [n.decode() for n in data[offset:offset + l_nm].split(b'\x00') if n]
+    return names, offset + l_nm
+
+
+def _parse_tbi(data):
+    (n_ref, _fmt, _col_seq, _col_beg, _col_end, _meta, skip), offset = _unpack('<7i', data, 4)
+    names, offset = _parse_names(data, offset)
+
+    all_bins, all_linear = [], []
+    for _ in range(n_ref):
+        (n_bin,), offset = _unpack(_INT, data, offset)
+        bins = {}
+        for _ in range(n_bin):
+            (bin_id, n_chunk), offset = _unpack(_TBI_BIN, data, offset)
+            chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, offset)
+            offset += 16 * n_chunk
+            bins[bin_id] = chunks
+        (n_intv,), offset = _unpack(_INT, data, offset)
+        linear = list(struct.unpack_from(f'<{n_intv}Q', data, offset))
+        offset += 8 * n_intv
+        all_bins.append(bins)
+        all_linear.append(linear)
+
+    return TabixIndex(names, all_bins, all_linear, skip=skip)
+
+
+def _parse_csi(data):
+    (min_shift, depth, l_aux), offset = _unpack('<3i', data, 4)
+    aux = data[offset:offset + l_aux]
+    offset += l_aux
+
+    names, skip = [], 0
+    if l_aux >= 28:
+        (_fmt, _col_seq, _col_beg, _col_end, _meta, skip), aux_offset = _unpack('<6i', aux, 0)
+        names, _ = _parse_names(aux, aux_offset)
+
+    (n_ref,), offset = _unpack(_INT, data, offset)
+    all_bins, all_linear = [], []
+    for _ in range(n_ref):
+        (n_bin,), offset = _unpack(_INT, data, offset)
+        bins = {}
+        for _ in range(n_bin):
+            (bin_id, _loffset, n_chunk), offset = _unpack(_CSI_BIN, data, offset)
+            chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, offset)
+            offset += 16 * n_chunk
+            bins[bin_id] = chunks
+        all_bins.append(bins)
+        all_linear.append([])  # CSI has no linear index; bins alone bound the search
+
+    return TabixIndex(names, all_bins, all_linear, min_shift=min_shift, depth=depth, skip=skip)
+
+
+def load_index(path):
+    """
+    Load a .tbi or .csi index file
+
+    Raises:
+        ValueError: if the file is not an index, or is truncated or corrupt
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        data = gzip.decompress(raw)
+        if data[:4] == TBI_MAGIC:
+            return _parse_tbi(data)
+        if data[:4] == CSI_MAGIC:
+            return _parse_csi(data)
+    except (EOFError, zlib.error, gzip.BadGzipFile, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Corrupt index {path}: {e}") from e
+    raise ValueError(f"Unrecognised index format: {path}")
+
+
+def find_index(vcf_path):
+    """Return the path of an existing .tbi or .csi index next to the VCF, if any"""
+    for suffix in ('.tbi', '.csi'):
+        if os.path.exists(vcf_path + suffix):
+            return vcf_path + suffix
+    return None
+
+
+def _iter_lines_with_offsets(path):
+    """Yield (line, start_voffset, end_voffset) for every line of a BGZF file"""
+    with open(path, 'rb') as f:
+        pending = b''
+        start = last = 0
+        for coffset, payload, _isize in iter_bgzf_blocks(f):
+            data = inflate_block(payload)
+            if data:
+                last = coffset << 16 | len(data)
+            pos = 0
+            while pos < len(data):
+                if not pending:
+                    start = coffset << 16 | pos
+                newline = data.find(b'\n', pos)
+                if newline == -1:
+                    pending += data[pos:]
+                    break
+                yield pending + data[pos:newline], start, coffset << 16 | (newline + 1)
+                pending = b''
+                pos = newline + 1
+
+        # Final line without a trailing newline
+        if pending:
+            yield pending, start, last
+
+
+def build_index(vcf_path, index_path=None):
+    """
+    Build a tabix (.tbi) index for a coordinate-sorted BGZF VCF.
+
+    Returns:
+        Path of the written index file
+    """
+    index_path = index_path or vcf_path + '.tbi'
+
+    names, all_bins, all_linear = [], [], []
+    bins = linear = None
+
+    for line, start, end in _iter_lines_with_offsets(vcf_path):
+        if not line or line[0] == META_CHAR:
+            continue
+
+        fields = line.split(b'\t', 4)
+        chrom = fields[0].decode()
+        beg = int(fields[1]) - 1
+        stop = beg + max(len(fields[3]), 1)
+
+        if not names or names[-1] != chrom:
+            if chrom in names:
+                raise ValueError(f"VCF is not sorted by chromosome: {chrom} appears twice")
+            names.append(chrom)
+            bins, linear = {}, []
+            all_bins.append(bins)
+            all_linear.append(linear)
+
+        # Extend the last chunk of the bin when records are contiguous
+        chunks = bins.setdefault(reg2bin(beg, stop), [])
+        if chunks and chunks[-1][1] == start:
+            chunks[-1][1] = end
+        else:
+            chunks.append([start, end])
+
+        first_window, last_window = beg >> TBI_MIN_SHIFT, (stop - 1) >> TBI_MIN_SHIFT
+        if len(linear) <= last_window:
+            linear.extend([None] * (last_window + 1 - len(linear)))
+        for window in range(first_window, last_window + 1):
+            if linear[window] is None:
+                linear[window] = start
+
+    out = bytearray(TBI_MAGIC)
+    names_blob = b''.join(name.encode() + b'\x00' for name in names)
+    out += struct.pack('<7i', len(names), TBI_FORMAT_VCF, *VCF_COLUMNS, META_CHAR, 0)
+    out += struct.pack('<i', len(names_blob)) + names_blob
+
+    for bins, linear in zip(all_bins, all_linear):
+        out += struct.pack('<i', len(bins))
+        for bin_id in sorted(bins):
+            chunks = bins[bin_id]
+            out += struct.pack('<Ii', bin_id, len(chunks))
+            for chunk_beg, chunk_end in chunks:
+                out += struct.pack('<QQ', chunk_beg, chunk_end)
+
+        # Windows without records inherit the offset of the previous window
+        previous = 0
+        for window, offset in enumerate(linear):
+            if offset is None:
+                linear[window] = previous
+            previous = linear[window]
+        out += struct.pack(f'<i{len(linear)}Q', len(linear), *linear)
+
+    # Written beside the index and renamed into place, so a concurrent reader
+    # of the same upload never loads a partially written index
+    directory, name = os.path.split(index_path)
+    temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with BgzfWriter(temp_path) as writer:
+            writer.write(bytes(out))
+        os.replace(temp_path, index_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return index_path
+
+
+def fetch_lines(vcf_path, index, regions, threads=None):
+    """
+    Yield raw VCF data lines (str) whose POS falls inside any of `regions`.
+
+    Args:
+        vcf_path: BGZF-compressed VCF
+        index: TabixIndex for the file
+        regions: Iterable of (chrom, start, end), 1-based and inclusive
+        threads: Threads used to inflate the blocks of each chunk
+    """
+    # Visit regions in file order so records come out sorted like the input
+    regions = [r for r in merge_regions(regions) if index.resolve_name(r[0]) is not None]
+    regions.sort(key=lambda r: (index.names.index(index.resolve_name(r[0])), r[1]))
+
+    with open(vcf_path, 'rb') as f, ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as executor:
+        for chrom, start, end in regions:
+            for chunk_beg, chunk_end in index.chunks(chrom, start - 1, end):
+                data = read_virtual_range(f, chunk_beg, chunk_end, executor)
+                for raw in data.split(b'\n'):
+                    if not raw or raw[0] == META_CHAR:
+                        continue
+                    line = raw.decode()
+                    fields = line.split('\t', 2)
+                    if fields[0].replace('chr', '') != chrom or not fields[1].isdigit():
+                        continue
+                    if start <= int(fields[1]) <= end:
+                        yield line
+
+
+def merge_regions(regions):
+    """Sort regions and merge overlapping ones so no record is returned twice"""
+    merged = []
+    for chrom, start, end in sorted(regions, key=lambda r: (r[0], r[1])):
+        if merged and merged[-1][0] == chrom and start <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([chrom, start, end])
+    return [tuple(region) for region in merged]
@@ -3,36 +3,13 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import xgboost as xgb
-import pickle
 import os
+import sys
+from pathlib import Path
 
-def create_features(df):
-    """Extract features from annotated variants"""
-    features = []
-    
-    # Count variants by risk level
-    risk_counts = df['DISEASE_RISK'].value_counts()
-    high_risk = risk_counts.get('High', 0)
-    medium_risk = risk_counts.get('Medium', 0)
-    low_risk = risk_counts.get('Low', 0)
-    
-    # Count pathogenic variants
-    pathogenic_count = len(df[df['PATHOGENICITY'] == 'Pathogenic'])
-    
-    # Quality metrics
-    avg_quality = df['QUAL'].mean() if 'QUAL' in df.columns else 0
-    
-    # Gene-specific counts
-    brca_variants = len(df[df['GENE'].str.contains('BRCA', na=False)])
-    apoe_variants = len(df[df['GENE'].str.contains('APOE', na=False)])
-    tp53_variants = len(df[df['GENE'].str.contains('TP53', na=False)])
-    
-    features = [
-        high_risk, medium_risk, low_risk, pathogenic_count,
-        avg_quality, brca_variants, apoe_variants, tp53_variants
-    ]
-    
-    return features
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.features import FEATURE_EXTRACTOR
 
 def train_model():
     """Train disease prediction model"""
@@ -61,6 +38,7 @@ def train_model():
         apoe = np.random.poisson(0.2)
         tp53 = np.random.poisson(0.15)
         
+        # Same layout as FEATURE_EXTRACTOR.feature_names
         features = [high_risk, medium_risk, low_risk, pathogenic, quality, brca, apoe, tp53]
         
         # Clinical risk calculation based on evidence-weighted scoring
@@ -96,17 +74,17 @@ def train_model():
     # Train XGBoost model
     model = xgb.XGBClassifier(random_state=42, eval_metric='logloss')
     model.fit(X_train, y_train)
+    model.get_booster().feature_names = FEATURE_EXTRACTOR.feature_names
     
     # Evaluate
     accuracy = model.score(X_test, y_test)
     print(f"Model accuracy: {accuracy:.3f}")
     
-    # Save model
+    # Save the booster in XGBoost's native binary format (served without pickle)
     os.makedirs('models', exist_ok=True)
-    with open('models/model.pkl', 'wb') as f:
-        pickle.dump(model, f)
+    model.get_booster().save_model('models/model.ubj')
     
-    print("Model saved to models/model.pkl")
+    print("Model saved to models/model.ubj")
     return model
 
 if __name__ == "__main__":
@@ -0,0 +1,390 @@
+"""
+Exact-match variant knowledge store (ClinVar-style).
+
+Compiles a ClinVar VCF or a variant_summary-style TSV into a directory of
+.npy arrays keyed by chrom:pos:ref>alt, which is memory-mapped at load time:
+
+    keys.npy       uint64, sorted: chrom (5 bits) | pos (29 bits) | allele hash (30 bits)
+    check.npy      uint32 fingerprint of the alleles, verified on every hit
+    sig/gene/disease.npy   label codes into labels.json
+    bloom.npy      Bloom filter over the keys, so misses never touch keys.npy
+
+Lookups are fully vectorized: alleles are hashed once per distinct string
+and the keys are resolved with a single searchsorted over the sorted array.
+
+Usage:
+    python scripts/variant_store.py clinvar.vcf.gz [--out models/variant_store]
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.annotate import PATHOGENICITY_LEVELS, RISK_LEVELS, overlay_categorical, passes_quality
+from scripts.bgzf import open_vcf
+
+DEFAULT_OUTPUT = "models/variant_store"
+
+# 1-22, X, Y, MT -> 1..25; 0 marks contigs the store cannot hold
+CHROM_CODES = {str(c): c for c in range(1, 23)}
+CHROM_CODES.update({'X': 23, 'Y': 24, 'MT': 25, 'M': 25})
+CHROM_SHIFT = 59
+POS_SHIFT = 30
+MAX_POS = (1 << 29) - 1
+
+# Condition names that carry no information
+UNNAMED_CONDITIONS = ('', 'not provided', 'not specified')
+
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+# ClinVar TSV column names (variant_summary.txt) next to the short names
+TSV_COLUMNS = {
+    'chrom': ('chrom', 'Chromosome'),
+    'pos': ('pos', 'PositionVCF'),
+    'ref': ('ref', 'ReferenceAlleleVCF'),
+    'alt': ('alt', 'AlternateAlleleVCF'),
+    'significance': ('clinical_significance', 'ClinicalSignificance'),
+    'gene': ('gene', 'GeneSymbol'),
+    'disease': ('disease', 'PhenotypeList'),
+}
+
+
+def classify_significance(sig):
+    """
+    Map a ClinVar clinical significance onto (pathogenicity, risk).
+
+    Uncertain, conflicting and other classifications return (None, None)
+    so gene-level annotation is kept for them.
+    """
+    sig = sig.lower().replace('_', ' ')
+    if 'conflicting' in sig:
+        return None, None
+    if 'likely pathogenic' in sig and not sig.startswith('pathogenic'):
+        return 'Likely Pathogenic', 'Medium'
+    if 'pathogenic' in sig:
+        return 'Pathogenic', 'High'
+    if 'benign' in sig:
+        return 'Benign', 'Low'
+    return None, None
+
+
+def _splitmix64(x):
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _hash_strings(values):
+    """64-bit hash per value, computed once per distinct string"""
+    codes, uniques = pd.factorize(values)
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(str(v).upper().encode(), digest_size=8).digest(), 'little')
+         for v in uniques]
+        + [0],
+        dtype=np.uint64,
+    )
+    return hashes[codes]  # NA (code -1) picks the trailing 0
+
+
+def variant_keys(chrom, pos, ref, alt):
+    """
+    Store keys for arrays of variants.
+
+    Returns:
+        (keys uint64, check uint32, valid bool) -- invalid rows have an
+        unsupported contig or position and can never match
+    """
+    if isinstance(getattr(chrom, 'dtype', None), pd.CategoricalDtype):
+        codes, uniques = chrom.cat.codes.to_numpy(), chrom.cat.categories
+    else:
+        codes, uniques = pd.factorize(chrom)
+    category_codes = np.array(
+        [CHROM_CODES.get(str(c).replace('chr', ''), 0) for c in uniques] + [0],
+        dtype=np.uint64,
+    )
+    chrom_codes = category_codes[codes]
+    pos = np.nan_to_num(np.asarray(pos, dtype=np.float64), nan=0).astype(np.int64)
+    valid = (chrom_codes > 0) & (pos > 0) & (pos <= MAX_POS)
+
+    with np.errstate(over='ignore'):
+        alleles = _hash_strings(ref) * _GOLDEN ^ _hash_strings(alt)
+    keys = (chrom_codes << np.uint64(CHROM_SHIFT)) \
+        | (np.where(valid, pos, 0).astype(np.uint64) << np.uint64(POS_SHIFT)) \
+        | (alleles >> np.uint64(64 - POS_SHIFT))
+    check = (alleles & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    return keys, check, valid
+
+
+class BloomFilter:
+    """Bit-array Bloom filter over uint64 keys using double hashing"""
+
+    def __init__(self, bits, hashes=BLOOM_HASHES):
+        self.bits = bits              # uint8 array, length a power of two
+        self.hashes = hashes
+        self._mask = np.uint64(len(bits) * 8 - 1)
+
+    @classmethod
+    def build(cls, keys, bits_per_key=BLOOM_BITS_PER_KEY, hashes=BLOOM_HASHES):
+        n_bits = 1 << max(int(len(keys) * bits_per_key - 1).bit_length(), 6)
+        bloom = cls(np.zeros(n_bits // 8, dtype=np.uint8), hashes)
+        for positions in bloom._positions(keys):
+            np.bitwise_or.at(bloom.bits, positions >> np.uint64(3),
+                             (1 << (positions & np.uint64(7))).astype(np.uint8))
+        return bloom
+
+    def _positions(self, keys):
+        with np.errstate(over='ignore'):
+            h1 = _splitmix64(keys)
+            h2 = _splitmix64(keys ^ _GOLDEN) | np.uint64(1)
+            for i in range(self.hashes):
+                yield (h1 + np.uint64(i) * h2) & self._mask
+
+    def contains(self, keys):
+        """Boolean mask: False means the key is definitely absent"""
+        present = np.ones(len(keys), dtype=bool)
+        for positions in self._positions(keys):
+            cells = self.bits[positions >> np.uint64(3)]
+            present &= ((cells >> (positions & np.uint64(7)).astype(np.uint8)) & 1).astype(bool)
+        return present
+
+
+class VariantStore:
+    """
+    Memory-mapped exact-match variant annotations.
+
+    Records are sorted by key, so each row can be found with a binary
+    search and neighbouring variants share disk pages.
+    """
+
+    ARRAYS = ('keys', 'check', 'sig', 'gene', 'disease')
+
+    def __init__(self, keys, check, sig, gene, disease, sig_labels, gene_labels, disease_labels,
+                 bloom=None, version=None):
+        self.keys = keys                  # uint64, sorted
+        self.check = check                # uint32 allele fingerprints
+        self.sig = sig                    # int32 codes into sig_labels
+        self.gene = gene                  # int32 codes into gene_labels ('' = unknown)
+        self.disease = disease            # int32 codes into disease_labels
+        self.sig_labels = list(sig_labels)
+        self.gene_labels = list(gene_labels)
+        self.disease_labels = list(disease_labels)
+        self.bloom = bloom
+        self.version = version
+
+        # Per significance label: pathogenicity/risk codes, -1 when unclassified
+        classes = [classify_significance(s) for s in self.sig_labels]
+        self.sig_pathogenicity = np.array(
+            [PATHOGENICITY_LEVELS.index(p) if p else -1 for p, _ in classes], dtype=np.int8)
+        self.sig_risk = np.array([RISK_LEVELS.index(r) if r else -1 for _, r in classes], dtype=np.int8)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a store from a DataFrame with chrom, pos, ref, alt,
+        significance, gene and disease columns. Duplicate variants keep
+        their first record.
+        """
+        keys, check, valid = variant_keys(records['chrom'], records['pos'], records['ref'], records['alt'])
+        keys, check = keys[valid], check[valid]
+        records = records[valid]
+
+        order = np.lexsort((check, keys))
+        keys, check = keys[order], check[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (check[1:] != check[:-1])
+        rows = order[distinct]
+        keys, check = keys[distinct], check[distinct]
+
+        columns = {}
+        for name in ('significance', 'gene', 'disease'):
+            values = records[name].fillna('').astype(str).to_numpy()[rows]
+            codes, labels = pd.factorize(values)
+            columns[name] = (codes.astype(np.int32), list(labels))
+
+        return cls(
+            keys, check,
+            columns['significance'][0], columns['gene'][0], columns['disease'][0],
+            columns['significance'][1], columns['gene'][1], columns['disease'][1],
+            bloom=BloomFilter.build(keys),
+            version=_digest(keys, check, columns),
+        )
+
+    def save(self, directory):
+        """Write the store as .npy files (plus labels.json and meta.json)"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        np.save(os.path.join(directory, 'bloom.npy'), self.bloom.bits)
+        with open(os.path.join(directory, 'labels.json'), 'w') as f:
+            json.dump({'sig': self.sig_labels, 'gene': self.gene_labels, 'disease': self.disease_labels}, f)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'format': 1, 'version': self.version, 'records': len(self),
+                       'bloom_hashes': self.bloom.hashes}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a store written by save(); arrays are memory-mapped by default"""
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, 'labels.json')) as f:
+            labels = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS]
+        # The Bloom filter is probed at random, so keep it in memory
+        bloom = BloomFilter(np.load(os.path.join(directory, 'bloom.npy')), meta['bloom_hashes'])
+        return cls(*arrays, labels['sig'], labels['gene'], labels['disease'],
+                   bloom=bloom, version=meta['version'])
+
+    def lookup(self, chrom, pos, ref, alt):
+        """Row index into the store for each variant, -1 where there is no record"""
+        keys, check, valid = variant_keys(chrom, pos, ref, alt)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self):
+            return rows
+
+        candidates = np.nonzero(valid & self.bloom.contains(keys))[0]
+        # Sorted needles make the binary searches walk the keys in order
+        candidates = candidates[np.argsort(keys[candidates])]
+        idx = np.searchsorted(self.keys, keys[candidates])
+        # Distinct alleles can share a key; walk forward through equal keys
+        while len(candidates):
+            idx_safe = np.minimum(idx, len(self) - 1)
+            same_key = (idx < len(self)) & (self.keys[idx_safe] == keys[candidates])
+            found = same_key & (self.check[idx_safe] == check[candidates])
+            rows[candidates[found]] = idx[found]
+            retry = same_key & ~found
+            candidates, idx = candidates[retry], idx[retry] + 1
+        return rows
+
+    def annotate(self, df, rows=None):
+        """
+        Overlay exact-match annotations on a frame already annotated by
+        GeneIndex.annotate(). Classified hits replace PATHOGENICITY and
+        DISEASE_RISK, hits with named conditions replace CLINICAL_SIG, and
+        GENE is filled in where the gene index found nothing. Variants at
+        or below MIN_QUALITY are left as they are.
+
+        `rows` may be passed in when lookup() has already been run.
+
+        Returns:
+            (annotated frame, number of variants found in the store)
+        """
+        if rows is None:
+            rows = self.lookup(df['CHROM'], df['POS'], df['REF'], df['ALT'])
+        hits = (rows >= 0) & passes_quality(df)
+        if not hits.any():
+            return df, 0
+
+        df = df.copy()
+        sig = np.asarray(self.sig[rows[hits]])
+        for column, classes, levels in (('PATHOGENICITY', self.sig_pathogenicity, PATHOGENICITY_LEVELS),
+                                        ('DISEASE_RISK', self.sig_risk, RISK_LEVELS)):
+            classified = hits.copy()
+            classified[hits] = classes[sig] >= 0
+            df[column] = overlay_categorical(df[column], classified, classes[sig[classes[sig] >= 0]], levels)
+
+        disease = np.asarray(self.disease[rows])
+        named = np.array([label not in UNNAMED_CONDITIONS for label in self.disease_labels], dtype=bool)
+        replace = hits & named[disease]
+        df['CLINICAL_SIG'] = overlay_categorical(df['CLINICAL_SIG'], replace, disease[replace], self.disease_labels)
+
+        gene = np.asarray(self.gene[rows])
+        has_gene = np.array([label != '' for label in self.gene_labels], dtype=bool)
+        fill = hits & (df['GENE'].astype(object).fillna('').to_numpy() == '') & has_gene[gene]
+        df['GENE'] = overlay_categorical(df['GENE'], fill, gene[fill], self.gene_labels)
+
+        return df, int(np.count_nonzero(hits))
+
+
+def _digest(keys, check, columns):
+    digest = hashlib.sha256(keys.tobytes() + check.tobytes())
+    for codes, labels in columns.values():
+        digest.update(codes.tobytes() + json.dumps(labels).encode())
+    return digest.hexdigest()[:16]
+
+
+def _conditions(value):
+    """Join '|'-separated condition names, dropping placeholders"""
+    return ', '.join(d for d in value.split('|') if d.strip().lower() not in UNNAMED_CONDITIONS)
+
+
+def _read_clinvar_vcf(path):
+    """Parse CLNSIG, GENEINFO and CLNDN from a ClinVar VCF"""
+    rows = []
+    with open_vcf(path) as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t', 8)
+            if len(fields) < 8:
+                continue
+            info = dict(item.split('=', 1) for item in fields[7].split(';') if '=' in item)
+            sig = info.get('CLNSIG')
+            if not sig:
+                continue
+            gene = info.get('GENEINFO', '').split('|')[0].split(':')[0]
+            disease = _conditions(info.get('CLNDN', '').replace('_', ' '))
+            for alt in fields[4].split(','):
+                rows.append((fields[0], int(fields[1]), fields[3], alt, sig.replace('_', ' '), gene, disease))
+    return pd.DataFrame(rows, columns=list(TSV_COLUMNS))
+
+
+def _read_tsv(path):
+    """Read a tab-separated dump using short or ClinVar variant_summary column names"""
+    df = pd.read_csv(path, sep='\t', dtype=str, quoting=csv.QUOTE_NONE)
+    if 'Assembly' in df.columns:
+        df = df[df['Assembly'] == 'GRCh38']
+    columns = {}
+    for name, candidates in TSV_COLUMNS.items():
+        source = next((c for c in candidates if c in df.columns), None)
+        if source is None:
+            raise ValueError(f"{path} has no column for {name} (expected one of {candidates})")
+        columns[name] = df[source]
+    records = pd.DataFrame(columns)
+    records['pos'] = pd.to_numeric(records['pos'], errors='coerce')
+    records['disease'] = records['disease'].fillna('').map(_conditions)
+    return records.dropna(subset=['pos'])
+
+
+def compile_variant_store(source, output_dir=DEFAULT_OUTPUT):
+    """
+    Compile a ClinVar VCF (.vcf/.vcf.gz) or TSV dump into a store directory.
+
+    Returns:
+        The compiled VariantStore
+    """
+    name = str(source).lower()
+    records = _read_clinvar_vcf(source) if '.vcf' in name else _read_tsv(source)
+    if records.empty:
+        raise ValueError(f"No variant records found in {source}")
+
+    store = VariantStore.from_records(records)
+    store.save(output_dir)
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a variant knowledge store")
+    parser.add_argument("source", help="ClinVar VCF (optionally gzipped) or TSV dump")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Output directory")
+    args = parser.parse_args()
+
+    store = compile_variant_store(args.source, args.out)
+    print(f"Compiled {len(store)} variants into {args.out} (version {store.version})")
@@ -0,0 +1,58 @@
+"""
+XGBoost risk model served from the native model format.
+
+scripts/train.py saves the trained booster as models/model.ubj (UBJSON);
+.json works too. Both load without pickle and without the training-time
+Python objects. Scoring uses Booster.inplace_predict, which predicts
+straight from the NumPy feature matrix without building a DMatrix.
+"""
+
+import numpy as np
+
+try:
+    import xgboost as xgb
+except ImportError:  # pragma: no cover - optional dependency
+    xgb = None
+
+NATIVE_EXTENSIONS = ('.ubj', '.json')
+
+
+class XGBoostRiskModel:
+    """Trained booster exposing the same scoring API as SimpleRiskModel"""
+
+    def __init__(self, booster, nthread=None, threshold=0.5):
+        self.booster = booster
+        self.threshold = threshold
+        if nthread:
+            self.booster.set_param({'nthread': nthread})
+
+    @classmethod
+    def load(cls, path, nthread=None):
+        """Load a booster saved with save_model() in .ubj or .json format"""
+        if xgb is None:
+            raise ImportError("xgboost is required to serve a trained model")
+        booster = xgb.Booster()
+        booster.load_model(str(path))
+        return cls(booster, nthread=nthread)
+
+    def score_batch(self, X):
+        """
+        Score an (N, 8) feature matrix in one inplace_predict call.
+
+        Returns:
+            (probability of high risk, predicted class) as two length-N arrays
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        prob_high = np.asarray(self.booster.inplace_predict(X), dtype=np.float64)
+        return prob_high, (prob_high > self.threshold).astype(np.int64)
+
+    def predict(self, X):
+        """Predict risk class (0=low, 1=high)"""
+        return self.score_batch(X)[1]
+
+    def predict_proba(self, X):
+        """Predict probability of each class"""
+        prob_high = self.score_batch(X)[0]
+        return np.column_stack([1 - prob_high, prob_high])
@@ -0,0 +1,109 @@
+"""
+Test stage checkpoints and resuming an interrupted pipeline run
+Covers skipping finished stages, ignoring checkpoints for other input and
+re-running a stage whose output is gone
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.ml_pipeline import MLPipeline
+
+SAMPLE_VCF = str(project_root / "data" / "raw" / "high_risk_sample.vcf")
+INPUT_HASH = "sample"
+
+
+def make_pipeline(directory):
+    pipeline = MLPipeline(checkpoint_dir=os.path.join(directory, "checkpoints"),
+                          results_dir=os.path.join(directory, "results"))
+    # Keep intermediates out of the project's data directory
+    pipeline.processed_dir = Path(directory) / "processed"
+    pipeline.processed_dir.mkdir()
+    return pipeline
+
+
+def interrupt_before_predict(pipeline, analysis_id):
+    """Run preprocess and annotate, then fail the way a killed worker would leave things"""
+    predict_step = pipeline._predict_step
+    pipeline._predict_step = lambda *args: None
+    try:
+        results = pipeline.process_vcf_file(SAMPLE_VCF, analysis_id, INPUT_HASH)
+    finally:
+        pipeline._predict_step = predict_step
+    assert results['status'] == 'failed', results
+    assert sorted(pipeline.checkpoints.load(analysis_id)['stages']) == ['annotate', 'preprocess']
+
+
+def record_calls(pipeline, *stages):
+    """Wrap pipeline steps to record which of them run"""
+    calls = []
+    for stage in stages:
+        step = getattr(pipeline, f"_{stage}_step")
+        setattr(pipeline, f"_{stage}_step",
+                lambda *args, step=step, stage=stage: calls.append(stage) or step(*args))
+    return calls
+
+
+def test_resume_skips_finished_stages():
+    """Only the stages after the last checkpointed one run again"""
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline = make_pipeline(directory)
+        interrupt_before_predict(pipeline, "resumed")
+
+        calls = record_calls(pipeline, "preprocess", "annotate", "predict")
+        results = pipeline.process_vcf_file(SAMPLE_VCF, "resumed", INPUT_HASH)
+
+        assert results['status'] == 'completed', results
+        assert calls == ['predict'], calls
+        # Same outcome as an uninterrupted run
+        with tempfile.TemporaryDirectory() as other:
+            fresh = make_pipeline(other).process_vcf_file(SAMPLE_VCF, "fresh", INPUT_HASH)
+        for field in ('total_variants', 'high_risk_variants', 'pathogenic_variants', 'risk_probability'):
+            assert results[field] == fresh[field], field
+        # Timings of the skipped stages are carried over from the checkpoint
+        assert {'preprocess', 'annotate', 'predict'} <= set(results['timings'])
+        print(f"✅ Resume: only {calls} ran, {results['total_variants']} variants")
+
+
+def test_checkpoint_for_other_input_is_ignored():
+    """A checkpoint written for different input content is not resumed from"""
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline = make_pipeline(directory)
+        interrupt_before_predict(pipeline, "changed")
+
+        calls = record_calls(pipeline, "preprocess", "annotate", "predict")
+        results = pipeline.process_vcf_file(SAMPLE_VCF, "changed", "other content")
+
+        assert results['status'] == 'completed', results
+        assert calls == ['preprocess', 'annotate', 'predict'], calls
+        print("✅ Checkpoint for other input ignored")
+
+
+def test_missing_output_reruns_stage():
+    """A stage whose output file is gone runs again, and so does everything after it"""
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline = make_pipeline(directory)
+        interrupt_before_predict(pipeline, "cleaned")
+        os.remove(pipeline.checkpoints.load("cleaned")['stages']['annotate'])
+
+        calls = record_calls(pipeline, "preprocess", "annotate", "predict")
+        results = pipeline.process_vcf_file(SAMPLE_VCF, "cleaned", INPUT_HASH)
+
+        assert results['status'] == 'completed', results
+        assert calls == ['annotate', 'predict'], calls
+        print(f"✅ Missing annotate output: {calls} ran again")
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("PIPELINE CHECKPOINT TEST")
+    print("=" * 60)
+    test_resume_skips_finished_stages()
+    test_checkpoint_for_other_input_is_ignored()
+    test_missing_output_reruns_stage()
+    print("\n✓ All checkpoint tests passed!")
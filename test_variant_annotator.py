@@ -0,0 +1,191 @@
+"""
+Test the MyVariant.info batch annotation path against a local stub server
+Covers batch chunking, retry/backoff on 429/503 and the "not found" negative cache
+"""
+
+import json
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.annotation_cache import AnnotationCache
+from backend.services.rate_limiter import TokenBucket
+from backend.services.variant_annotator import VariantAnnotator
+
+
+class StubMyVariant(BaseHTTPRequestHandler):
+    """
+    Minimal MyVariant.info batch endpoint (POST /variant).
+
+    Ids at odd positions are reported as not found. Statuses queued in
+    `server.failures` are returned (with Retry-After for 503) before any
+    successful answer; queued bytes are returned as a 200 response body.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        ids = form['ids'][0].split(',')
+        self.server.batches.append(ids)
+
+        if self.server.failures:
+            status = self.server.failures.pop(0)
+            if isinstance(status, bytes):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(status)))
+                self.end_headers()
+                self.wfile.write(status)
+                return
+            self.send_response(status)
+            if status == 503:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            return
+
+        hits = []
+        for hgvs_id in ids:
+            if int(hgvs_id.split('g.')[1][:-3]) % 2:
+                hits.append({'query': hgvs_id, 'notfound': True})
+            else:
+                hits.append({
+                    'query': hgvs_id,
+                    '_id': hgvs_id,
+                    'clinvar': {'rcv': {'clinical_significance': 'Pathogenic', 'conditions': 'Test Disease'}},
+                    'dbnsfp': {'genename': 'BRCA1'},
+                })
+        body = json.dumps(hits).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(failures=()):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubMyVariant)
+    server.batches = []
+    server.failures = list(failures)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_annotator(server, directory, **options):
+    return VariantAnnotator(
+        use_api=True,
+        api_base_url=f"http://127.0.0.1:{server.server_address[1]}",
+        cache=AnnotationCache(str(Path(directory) / 'annotations.sqlite')),
+        rate_limiter=TokenBucket('stub', rate=1000, burst=1000, path=str(Path(directory) / 'limits.sqlite')),
+        backoff=0.01,
+        **options,
+    )
+
+
+def variants(count):
+    return [{'chrom': '17', 'pos': 1000 + i, 'ref': 'A', 'alt': 'G'} for i in range(count)]
+
+
+def test_batch_chunking():
+    """350 ids with a batch size of 100 go out as 4 POSTs, each id exactly once"""
+    server = start_stub()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            annotator = make_annotator(server, directory, batch_size=100)
+            annotated = annotator.batch_annotate(variants(350))
+
+            sizes = sorted(len(batch) for batch in server.batches)
+            assert sizes == [50, 100, 100, 100], sizes
+            sent = [hgvs_id for batch in server.batches for hgvs_id in batch]
+            assert len(sent) == len(set(sent)) == 350
+            assert len(annotated) == 350
+            assert annotated[0]['gene'] == 'BRCA1'
+            assert annotated[0]['pathogenicity'] == 'Pathogenic'
+            assert 'gene' not in annotated[1]
+            print(f"✅ Batch chunking: {len(server.batches)} POSTs for 350 variants")
+    finally:
+        server.shutdown()
+
+
+def test_retry_on_throttling():
+    """429 and 503 answers are retried; Retry-After is honoured"""
+    server = start_stub(failures=[429, 503])
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            annotator = make_annotator(server, directory, max_retries=3)
+            annotated = annotator.batch_annotate(variants(10))
+
+            assert len(server.batches) == 3, len(server.batches)
+            assert annotated[0]['gene'] == 'BRCA1'
+            print(f"✅ Retry/backoff: succeeded after {len(server.batches) - 1} throttled attempts")
+    finally:
+        server.shutdown()
+
+
+def test_gives_up_after_max_retries():
+    """A batch that keeps failing is abandoned, leaving its variants unannotated and uncached"""
+    server = start_stub(failures=[429] * 10)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            annotator = make_annotator(server, directory, max_retries=2)
+            annotated = annotator.batch_annotate(variants(4))
+
+            assert len(server.batches) == 3, len(server.batches)
+            assert all('gene' not in variant for variant in annotated)
+            assert annotator.cache.get_many([annotator.hgvs_id('17', 1000, 'A', 'G')]) == {}
+            print("✅ Gives up after max_retries without caching the failure")
+    finally:
+        server.shutdown()
+
+
+def test_malformed_response():
+    """A 200 answer that is not a list of hits fails the batch without raising or caching"""
+    for body in (b'<html>busy</html>', b'{"error": "unexpected"}', b'["17:g.1000A>G"]'):
+        server = start_stub(failures=[body])
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                annotator = make_annotator(server, directory)
+                annotated = annotator.batch_annotate(variants(4))
+
+                assert len(server.batches) == 1, len(server.batches)
+                assert all('gene' not in variant for variant in annotated)
+                assert annotator.cache.get_many([annotator.hgvs_id('17', 1000, 'A', 'G')]) == {}
+        finally:
+            server.shutdown()
+    print("✅ Malformed responses leave the batch unannotated")
+
+
+def test_notfound_negative_cache():
+    """Found and not-found answers are cached; a repeat run makes no requests"""
+    server = start_stub()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            annotator = make_annotator(server, directory)
+            annotator.batch_annotate(variants(20))
+            first_run = len(server.batches)
+
+            assert annotator.cache.get(annotator.hgvs_id('17', 1001, 'A', 'G')) is None
+            assert annotator.batch_annotate(variants(20))[0]['gene'] == 'BRCA1'
+            assert len(server.batches) == first_run == 1, server.batches
+            print("✅ Negative cache: repeat run made 0 requests")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("VARIANT ANNOTATOR BATCH API TEST (local stub server)")
+    print("=" * 60)
+    test_batch_chunking()
+    test_retry_on_throttling()
+    test_gives_up_after_max_retries()
+    test_malformed_response()
+    test_notfound_negative_cache()
+    print("\n✓ All batch annotation tests passed!")
@@ -0,0 +1,119 @@
+"""
+Test per-variant result storage and keyset pagination
+Covers cursor continuity across chunk and row-group boundaries, with and
+without filters, and gene filters on variants overlapping several genes
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.variant_results import VariantResultStore, VariantResultWriter
+
+VARIANTS = 2_500
+CHUNK_ROWS = 1_000      # 3 chunks
+BATCH_ROWS = 300        # several row groups per chunk
+
+GENES = ['', '', '', 'BRCA1', 'TP53', 'BRCA1,TP53', 'APOE']
+RISKS = ['Low', 'Medium', 'High']
+
+
+def annotated_table():
+    rng = np.random.default_rng(11)
+    return pd.DataFrame({
+        'CHROM': '17',
+        'POS': np.arange(VARIANTS) * 10 + 1,
+        'REF': 'A',
+        'ALT': 'G',
+        'QUAL': rng.uniform(10, 99, VARIANTS),
+        'GENE': rng.choice(GENES, VARIANTS),
+        'DISEASE_RISK': rng.choice(RISKS, VARIANTS),
+        'PATHOGENICITY': rng.choice(['Benign', 'Pathogenic'], VARIANTS),
+        'CLINICAL_SIG': 'Unknown',
+    })
+
+
+def store_table(directory, df):
+    store = VariantResultStore(directory)
+    writer = VariantResultWriter(store.path('analysis'), chunk_rows=CHUNK_ROWS)
+    for start in range(0, len(df), BATCH_ROWS):
+        writer.write(df.iloc[start:start + BATCH_ROWS])
+    assert writer.commit() == len(df)
+    assert len(store.manifest('analysis')['chunks']) == 3
+    return store
+
+
+def all_pages(store, limit, **filters):
+    """Every page of a query, following the cursors; returns (positions, page sizes)"""
+    positions, sizes, cursor = [], [], None
+    while True:
+        variants, cursor, total = store.page('analysis', after=cursor, limit=limit, **filters)
+        assert total == VARIANTS
+        positions += [variant['pos'] for variant in variants]
+        sizes.append(len(variants))
+        if cursor is None:
+            return positions, sizes
+
+
+def test_cursor_continuity():
+    """Following cursors returns every variant once, in file order, across chunk boundaries"""
+    with tempfile.TemporaryDirectory() as directory:
+        df = annotated_table()
+        store = store_table(directory, df)
+
+        positions, sizes = all_pages(store, limit=77)
+        assert positions == df['POS'].tolist()
+        assert sizes[:-1] == [77] * (len(sizes) - 1)
+        print(f"✅ Unfiltered: {len(positions)} variants in {len(sizes)} pages")
+
+
+def test_filtered_cursor_continuity():
+    """Filtered pages follow each other without gaps or repeats, across chunk boundaries"""
+    with tempfile.TemporaryDirectory() as directory:
+        df = annotated_table()
+        store = store_table(directory, df)
+
+        selected = df[df['DISEASE_RISK'].isin(['High', 'Medium']) & (df['PATHOGENICITY'] == 'Pathogenic')]
+        positions, _ = all_pages(store, limit=13, disease_risk=['high', 'medium'], pathogenicity=['Pathogenic'])
+        assert positions == selected['POS'].tolist()
+
+        # A page that ends on a chunk's last match continues in the next chunk
+        first_chunk = selected[selected.index < CHUNK_ROWS]
+        variants, cursor, _ = store.page('analysis', limit=len(first_chunk),
+                                         disease_risk=['high', 'medium'], pathogenicity=['Pathogenic'])
+        assert [variant['pos'] for variant in variants] == first_chunk['POS'].tolist()
+        variants, _, _ = store.page('analysis', after=cursor, limit=1,
+                                    disease_risk=['high', 'medium'], pathogenicity=['Pathogenic'])
+        assert variants[0]['pos'] == selected['POS'].iloc[len(first_chunk)]
+        print(f"✅ Filtered: {len(positions)} variants, cursors continuous across chunks")
+
+
+def test_gene_filter_matches_each_gene():
+    """Variants overlapping several genes match a filter naming any one of them"""
+    with tempfile.TemporaryDirectory() as directory:
+        df = annotated_table()
+        store = store_table(directory, df)
+
+        for gene in ('BRCA1', 'TP53'):
+            expected = df[df['GENE'].str.split(',').apply(lambda genes: gene in genes)]
+            positions, _ = all_pages(store, limit=50, gene=[gene])
+            assert positions == expected['POS'].tolist(), gene
+        # Symbols are matched whole, not as substrings
+        assert all_pages(store, limit=50, gene=['BRCA'])[0] == []
+        print("✅ Gene filter matches variants overlapping several genes")
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("VARIANT RESULTS PAGINATION TEST")
+    print("=" * 60)
+    test_cursor_continuity()
+    test_filtered_cursor_continuity()
+    test_gene_filter_matches_each_gene()
+    print("\n✓ All variant results tests passed!")
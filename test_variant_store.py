@@ -0,0 +1,90 @@
+"""
+Test the exact-match variant knowledge store
+Covers lookups that hit and miss (after a save/load round trip) and the
+Bloom filter the misses are screened with
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from scripts.variant_store import VariantStore, variant_keys
+
+RECORDS = pd.DataFrame([
+    {'chrom': '17', 'pos': 43094464, 'ref': 'C', 'alt': 'T', 'significance': 'Pathogenic',
+     'gene': 'BRCA1', 'disease': 'Hereditary breast ovarian cancer syndrome'},
+    # Second allele at the same position
+    {'chrom': '17', 'pos': 43094464, 'ref': 'C', 'alt': 'G', 'significance': 'Benign',
+     'gene': 'BRCA1', 'disease': 'not provided'},
+    {'chrom': 'chr13', 'pos': 32338000, 'ref': 'AT', 'alt': 'A', 'significance': 'Likely pathogenic',
+     'gene': 'BRCA2', 'disease': 'Breast cancer'},
+    {'chrom': 'X', 'pos': 1000, 'ref': 'G', 'alt': 'A', 'significance': 'Uncertain significance',
+     'gene': 'AR', 'disease': ''},
+])
+
+
+def load_store(directory):
+    VariantStore.from_records(RECORDS).save(directory)
+    return VariantStore.load(directory)
+
+
+def test_lookup_hits_and_misses():
+    """Stored variants are found (with or without 'chr'); other alleles, positions and contigs are not"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = load_store(directory)
+        assert len(store) == 4
+
+        queries = pd.DataFrame([
+            ('chr17', 43094464, 'C', 'T'),   # hit
+            ('17', 43094464, 'C', 'G'),      # hit, other allele at the same position
+            ('13', 32338000, 'AT', 'A'),     # hit, stored as chr13
+            ('X', 1000, 'G', 'A'),           # hit
+            ('17', 43094464, 'C', 'A'),      # miss: allele not stored
+            ('17', 43094465, 'C', 'T'),      # miss: neighbouring position
+            ('13', 32338000, 'A', 'AT'),     # miss: alleles swapped
+            ('GL000192.1', 1000, 'G', 'A'),  # miss: contig the store cannot hold
+        ], columns=['CHROM', 'POS', 'REF', 'ALT'])
+        rows = store.lookup(queries['CHROM'], queries['POS'], queries['REF'], queries['ALT'])
+
+        found = rows[:4]
+        assert (found >= 0).all(), rows
+        assert len(set(found.tolist())) == 4, rows
+        genes = [store.gene_labels[store.gene[row]] for row in found]
+        assert genes == ['BRCA1', 'BRCA1', 'BRCA2', 'AR'], genes
+        assert (rows[4:] == -1).all(), rows
+        print("✅ Lookup: 4 hits, 4 misses")
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Every stored key passes the Bloom filter; almost no random key does"""
+    rng = np.random.default_rng(3)
+    records = pd.DataFrame({
+        'chrom': rng.integers(1, 23, 20_000).astype(str),
+        'pos': rng.integers(1, 10_000_000, 20_000),
+        'ref': rng.choice(list('ACGT'), 20_000),
+        'alt': rng.choice(['A', 'C', 'G', 'T', 'AA'], 20_000),
+        'significance': 'Pathogenic', 'gene': 'G', 'disease': 'D',
+    })
+    store = VariantStore.from_records(records)
+    assert store.bloom.contains(store.keys).all()
+
+    keys, _, _ = variant_keys(pd.Series(['1'] * 20_000), rng.integers(20_000_000, 30_000_000, 20_000),
+                              pd.Series(['A'] * 20_000), pd.Series(['C'] * 20_000))
+    false_positives = store.bloom.contains(keys).mean()
+    assert false_positives < 0.05, false_positives
+    print(f"✅ Bloom filter: no false negatives, {false_positives:.2%} false positives")
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 60)
+    print("VARIANT STORE TEST")
+    print("=" * 60)
+    test_lookup_hits_and_misses()
+    test_bloom_filter_has_no_false_negatives()
+    print("\n✓ All variant store tests passed!")
@@ -29,7 +29,7 @@ const Upload = () => {
       lastModified: file.lastModified
     });
     
-    if (!file.name.endsWith('.vcf')) {
+    if (!['.vcf', '.vcf.gz', '.vcf.bgz'].some((ext) => file.name.endsWith(ext))) {
       console.error('❌ Invalid file type:', file.name);
       toast.error('Please upload a VCF file');
       return;
@@ -74,7 +74,8 @@ const Upload = () => {
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     onDrop,
     accept: {
-      'text/plain': ['.vcf']
+      'text/plain': ['.vcf'],
+      'application/gzip': ['.vcf.gz', '.vcf.bgz']
     },
     maxFiles: 1,
     maxSize: 100 * 1024 * 1024 // 100MB
@@ -149,7 +150,7 @@ const Upload = () => {
               File Requirements
             </h3>
             <ul className="space-y-2 text-gray-600">
-              <li>• File format: VCF (.vcf)</li>
+              <li>• File format: VCF (.vcf, .vcf.gz or .vcf.bgz)</li>
               <li>• Maximum size: 100MB</li>
               <li>• Standard VCF format required</li>
               <li>• Human genome data only</li>